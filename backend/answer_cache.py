@@ -0,0 +1,136 @@
+"""
+Semantic Answer Cache for Repeated Questions
+
+Serves a previous answer when a user asks a question whose embedding is close
+enough to one already answered against the same set of their documents.
+"""
+
+import os
+import time
+from collections import OrderedDict
+from typing import Dict, Any, Optional
+import numpy as np
+
+
+class SemanticAnswerCache:
+    def __init__(self, max_entries: int = 256, ttl_seconds: float = 3600, similarity_threshold: float = 0.97):
+        """
+        Initialize the answer cache.
+
+        Args:
+            max_entries: Maximum answers kept per user (least recently used are evicted); 0 disables the cache
+            ttl_seconds: Entry lifetime in seconds
+            similarity_threshold: Minimum cosine similarity between question embeddings for a hit
+        """
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.similarity_threshold = similarity_threshold
+
+        # user_id -> question id -> (created_at, document set version, unit question vector, answer)
+        self._entries: Dict[str, "OrderedDict[int, Any]"] = {}
+        self._next_id = 0
+
+        self.hits = 0
+        self.misses = 0
+
+    @classmethod
+    def from_env(cls, prefix: str = "ANSWER_CACHE") -> "SemanticAnswerCache":
+        """Create a cache configured from <prefix>_SIZE, <prefix>_TTL and <prefix>_THRESHOLD."""
+        return cls(
+            max_entries=int(os.getenv(f"{prefix}_SIZE", 256)),
+            ttl_seconds=float(os.getenv(f"{prefix}_TTL", 3600)),
+            similarity_threshold=float(os.getenv(f"{prefix}_THRESHOLD", 0.97))
+        )
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    def get(self, user_id: str, version: Any, query_vector: np.ndarray) -> Optional[Dict[str, Any]]:
+        """
+        Find a cached answer for a semantically equivalent question.
+
+        Args:
+            user_id: User who asked
+            version: Current version of the user's document set; answers given
+                against another version are discarded
+            query_vector: Embedding of the question
+
+        Returns:
+            The cached answer with its "similarity" to the question, or None
+        """
+        if not self.enabled:
+            return None
+
+        entries = self._entries.get(user_id)
+        if entries:
+            self._discard_stale(entries, version)
+
+        if not entries:
+            self.misses += 1
+            return None
+
+        query = _unit(query_vector)
+        ids = list(entries)
+        similarities = np.stack([entries[i][2] for i in ids]) @ query
+        best = int(np.argmax(similarities))
+
+        if similarities[best] < self.similarity_threshold:
+            self.misses += 1
+            return None
+
+        entries.move_to_end(ids[best])
+        self.hits += 1
+        return {**entries[ids[best]][3], "similarity": float(similarities[best])}
+
+    def set(self, user_id: str, version: Any, query_vector: np.ndarray, answer: Dict[str, Any]) -> None:
+        """
+        Cache an answer.
+
+        Args:
+            user_id: User who asked
+            version: Version of the user's document set the answer was based on
+            query_vector: Embedding of the question
+            answer: Answer fields to return on a hit
+        """
+        if not self.enabled:
+            return
+
+        entries = self._entries.setdefault(user_id, OrderedDict())
+        self._discard_stale(entries, version)
+
+        entries[self._next_id] = (time.time(), version, _unit(query_vector), dict(answer))
+        self._next_id += 1
+        while len(entries) > self.max_entries:
+            entries.popitem(last=False)
+
+    def invalidate_user(self, user_id: str) -> None:
+        """Drop all of a user's cached answers."""
+        self._entries.pop(user_id, None)
+
+    def stats(self) -> Dict[str, Any]:
+        """Return cache counters."""
+        lookups = self.hits + self.misses
+        return {
+            "users": len(self._entries),
+            "size": sum(len(entries) for entries in self._entries.values()),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0
+        }
+
+    def _discard_stale(self, entries: "OrderedDict[int, Any]", version: Any) -> None:
+        """Remove expired entries and entries from another document set version."""
+        now = time.time()
+        stale = [
+            entry_id for entry_id, (created_at, entry_version, _, _) in entries.items()
+            if entry_version != version or now - created_at >= self.ttl_seconds
+        ]
+        for entry_id in stale:
+            del entries[entry_id]
+
+
+def _unit(vector: np.ndarray) -> np.ndarray:
+    vector = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm > 0 else vector
@@ -0,0 +1,773 @@
+#!/usr/bin/env python3
+"""
+Benchmark the API endpoints offline: latency percentiles and throughput.
+
+Runs the real FastAPI app in-process with local stand-ins for the external
+services: an in-memory Supabase client (tables, filters and the RPCs in
+sql/schema.sql), deterministic Gemini embeddings (hashed bag of words, so
+related texts get similar vectors) and a Gemini model that streams a canned
+answer. Each stand-in can add a fixed delay per call to model network and
+model latency. /api/chat, /api/sessions and /api/documents/upload are then
+driven at the requested concurrency and p50/p95/p99 latency and requests per
+second are reported.
+
+Results can be saved as JSON and compared against a saved baseline, exiting
+non-zero when a p95 latency regresses beyond the tolerance.
+
+Usage:
+    python benchmark_api.py
+    python benchmark_api.py --requests 500 --concurrency 32 --db-latency-ms 5
+    python benchmark_api.py --output baseline.json
+    python benchmark_api.py --baseline baseline.json --tolerance 0.2
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import uuid
+import asyncio
+import hashlib
+import argparse
+import itertools
+from datetime import datetime, timezone
+from typing import List, Dict, Any, Optional, Callable, Awaitable, AsyncGenerator
+import numpy as np
+
+# The app reads these at import time; the stand-ins replace the real clients
+os.environ.setdefault("SUPABASE_URL", "http://localhost.invalid")
+os.environ.setdefault("SUPABASE_ANON_KEY", "benchmark")
+os.environ.setdefault("GOOGLE_API_KEY", "benchmark")
+
+ENDPOINTS = ("chat", "sessions", "upload")
+
+EMBEDDING_DIMENSION = 768
+
+QUESTIONS = [
+    "What are the risks of a lumbar drain?",
+    "How is normal pressure hydrocephalus diagnosed?",
+    "Compare ACDF with cervical disc arthroplasty",
+    "What is the recovery time after a microdiscectomy?",
+    "When is decompressive craniectomy indicated after traumatic brain injury?",
+    "How do you manage a CSF leak after spine surgery?",
+    "What are the signs of shunt malfunction?",
+    "Explain the Spetzler-Martin grading scale",
+    "What imaging is used before deep brain stimulation?",
+    "How is a chronic subdural hematoma treated?",
+]
+
+DOCUMENT_SENTENCES = [
+    "A lumbar drain diverts cerebrospinal fluid to lower intracranial pressure.",
+    "Over-drainage can cause headache, subdural hematoma or tonsillar herniation.",
+    "Normal pressure hydrocephalus presents with gait disturbance, incontinence and dementia.",
+    "A high-volume tap test helps predict the response to shunting.",
+    "Cervical disc arthroplasty preserves motion at the operated level.",
+    "ACDF achieves fusion and is preferred when there is instability or severe facet disease.",
+    "Most patients return to desk work two to four weeks after a microdiscectomy.",
+    "Decompressive craniectomy is considered for refractory intracranial hypertension.",
+    "A CSF leak may be managed with bed rest, a lumbar drain or surgical repair.",
+    "Shunt malfunction can present with headache, vomiting and lethargy.",
+    "The Spetzler-Martin scale grades arteriovenous malformations by size, eloquence and venous drainage.",
+    "High-resolution MRI is used to plan electrode targets for deep brain stimulation.",
+    "Chronic subdural hematomas are often drained through burr holes.",
+]
+
+
+# ---------------------------------------------------------------------------
+# In-memory Supabase stand-in
+# ---------------------------------------------------------------------------
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+def _parse_vector(value: Any) -> np.ndarray:
+    """pgvector values are sent as "[x,y,...]" literals."""
+    if isinstance(value, str):
+        value = json.loads(value)
+    vector = np.asarray(value, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm > 0 else vector
+
+
+def _words(text: str) -> List[str]:
+    return re.findall(r"[a-z0-9]+", text.lower())
+
+
+class LocalResult:
+    def __init__(self, data: List[Dict[str, Any]], count: Optional[int] = None):
+        self.data = data
+        self.count = count
+
+
+class LocalQuery:
+    """The subset of the PostgREST query builder the backend uses."""
+
+    def __init__(self, db: "LocalSupabase", table: str):
+        self.db = db
+        self.table = table
+        self.operation = "select"
+        self.columns = "*"
+        self.payload: Any = None
+        self.on_conflict: Optional[str] = None
+        self.returning = "representation"
+        self.filters: List[Callable[[Dict[str, Any]], bool]] = []
+        self.ordering: List[tuple] = []
+        self.row_limit: Optional[int] = None
+        self.row_range: Optional[tuple] = None
+
+    def select(self, columns: str = "*", **kwargs) -> "LocalQuery":
+        self.operation, self.columns = "select", columns
+        return self
+
+    def insert(self, rows: Any, count: Optional[str] = None, returning: str = "representation", **kwargs) -> "LocalQuery":
+        self.operation, self.payload, self.returning = "insert", rows if isinstance(rows, list) else [rows], returning
+        return self
+
+    def upsert(self, rows: Any, on_conflict: Optional[str] = None, **kwargs) -> "LocalQuery":
+        self.operation, self.payload, self.on_conflict = "upsert", rows if isinstance(rows, list) else [rows], on_conflict
+        return self
+
+    def update(self, values: Dict[str, Any]) -> "LocalQuery":
+        self.operation, self.payload = "update", values
+        return self
+
+    def delete(self) -> "LocalQuery":
+        self.operation = "delete"
+        return self
+
+    def eq(self, column: str, value: Any) -> "LocalQuery":
+        if "." in column:
+            # Filter on an embedded parent row, e.g. documents.user_id
+            parent, field = column.split(".", 1)
+            self.filters.append(lambda row: (self.db.parent(parent, row) or {}).get(field) == value)
+        else:
+            self.filters.append(lambda row: row.get(column) == value)
+        return self
+
+    def gt(self, column: str, value: Any) -> "LocalQuery":
+        self.filters.append(lambda row: row.get(column) is not None and row[column] > value)
+        return self
+
+    def lt(self, column: str, value: Any) -> "LocalQuery":
+        self.filters.append(lambda row: row.get(column) is not None and row[column] < value)
+        return self
+
+    def in_(self, column: str, values: List[Any]) -> "LocalQuery":
+        allowed = set(values)
+        self.filters.append(lambda row: row.get(column) in allowed)
+        return self
+
+    def or_(self, conditions: str) -> "LocalQuery":
+        # Only the "column.is.null" and "column.lt.value" forms are used
+        checks = []
+        for condition in conditions.split(","):
+            column, operator, value = condition.split(".", 2)
+            if operator == "is" and value == "null":
+                checks.append(lambda row, c=column: row.get(c) is None)
+            elif operator == "lt":
+                checks.append(lambda row, c=column, v=float(value): row.get(c) is not None and row[c] < v)
+            else:
+                raise ValueError(f"Unsupported or_ condition: {condition}")
+        self.filters.append(lambda row: any(check(row) for check in checks))
+        return self
+
+    def order(self, column: str, desc: bool = False) -> "LocalQuery":
+        self.ordering.append((column, desc))
+        return self
+
+    def limit(self, count: int) -> "LocalQuery":
+        self.row_limit = count
+        return self
+
+    def range(self, start: int, end: int) -> "LocalQuery":
+        self.row_range = (start, end)
+        return self
+
+    async def execute(self) -> LocalResult:
+        await self.db.round_trip()
+        rows = self.db.tables.setdefault(self.table, [])
+
+        if self.operation in ("insert", "upsert"):
+            stored = []
+            for payload in self.payload:
+                if self.operation == "upsert" and self.on_conflict:
+                    if any(row.get(self.on_conflict) == payload.get(self.on_conflict) for row in rows):
+                        continue
+                row = self.db.new_row(self.table, payload)
+                rows.append(row)
+                stored.append(row)
+            data = [] if self.returning == "minimal" else [self.db.public(row) for row in stored]
+            return LocalResult(data, count=len(stored))
+
+        matched = [row for row in rows if all(check(row) for check in self.filters)]
+
+        if self.operation == "update":
+            for row in matched:
+                row.update(self.payload)
+                if "updated_at" in row:
+                    row["updated_at"] = _now()
+            return LocalResult([self.db.public(row) for row in matched], count=len(matched))
+
+        if self.operation == "delete":
+            self.db.delete_rows(self.table, matched)
+            return LocalResult([self.db.public(row) for row in matched], count=len(matched))
+
+        for column, desc in reversed(self.ordering):
+            matched.sort(key=lambda row: (row.get(column) is None, row.get(column)), reverse=desc)
+        if self.row_range is not None:
+            matched = matched[self.row_range[0]:self.row_range[1] + 1]
+        if self.row_limit is not None:
+            matched = matched[:self.row_limit]
+
+        return LocalResult([self.db.project(self.table, row, self.columns) for row in matched])
+
+
+class LocalRpc:
+    def __init__(self, db: "LocalSupabase", name: str, params: Dict[str, Any]):
+        self.db = db
+        self.name = name
+        self.params = params
+
+    async def execute(self) -> LocalResult:
+        await self.db.round_trip()
+        handler = getattr(self.db, f"rpc_{self.name}", None)
+        if handler is None:
+            raise RuntimeError(f"Unknown RPC {self.name}")
+        return LocalResult(handler(**self.params))
+
+
+class LocalSupabase:
+    """
+    In-memory stand-in for the async Supabase client.
+
+    Implements the tables, query builder methods and RPCs from sql/schema.sql
+    that the backend calls. Every request waits latency_ms first, like a
+    round trip to PostgREST.
+    """
+
+    def __init__(self, latency_ms: float = 0.0):
+        self.latency = latency_ms / 1000
+        self.tables: Dict[str, List[Dict[str, Any]]] = {}
+        self._serial = itertools.count(1)
+        self.requests = 0
+
+    def table(self, name: str) -> LocalQuery:
+        return LocalQuery(self, name)
+
+    def rpc(self, name: str, params: Dict[str, Any]) -> LocalRpc:
+        return LocalRpc(self, name, params)
+
+    async def round_trip(self) -> None:
+        self.requests += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        else:
+            await asyncio.sleep(0)
+
+    def new_row(self, table: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+        """Apply the column defaults from sql/schema.sql."""
+        now = _now()
+        row = dict(payload)
+        if table == "chat_messages":
+            row.setdefault("id", next(self._serial))
+        elif table != "chunk_embeddings":
+            row.setdefault("id", str(uuid.uuid4()))
+        row.setdefault("created_at", now)
+        if table in ("chat_sessions", "documents", "ingestion_jobs"):
+            row.setdefault("updated_at", now)
+        if table == "ingestion_jobs":
+            row.setdefault("status", "queued")
+            row.setdefault("chunks_embedded", 0)
+            row.setdefault("attempts", 1)
+        if "embedding" in row:
+            # Parse once, so searches don't re-parse the literal
+            row["_vector"] = _parse_vector(row["embedding"])
+        return row
+
+    def delete_rows(self, table: str, matched: List[Dict[str, Any]]) -> None:
+        doomed = {id(row) for row in matched}
+        self.tables[table] = [row for row in self.tables[table] if id(row) not in doomed]
+
+        # ON DELETE CASCADE
+        if table == "documents":
+            document_ids = {row["id"] for row in matched}
+            chunks = self.tables.get("document_chunks", [])
+            self.tables["document_chunks"] = [row for row in chunks if row["document_id"] not in document_ids]
+        elif table == "chat_sessions":
+            session_ids = {row["session_id"] for row in matched}
+            messages = self.tables.get("chat_messages", [])
+            self.tables["chat_messages"] = [row for row in messages if row["session_id"] not in session_ids]
+
+    def parent(self, table: str, row: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """The row a foreign key points to (only chunks -> documents is embedded)."""
+        if table != "documents":
+            return None
+        for document in self.tables.get("documents", []):
+            if document["id"] == row.get("document_id"):
+                return document
+        return None
+
+    @staticmethod
+    def public(row: Dict[str, Any]) -> Dict[str, Any]:
+        return {key: value for key, value in row.items() if not key.startswith("_")}
+
+    def project(self, table: str, row: Dict[str, Any], columns: str) -> Dict[str, Any]:
+        """Apply a PostgREST select list: "*", "alias:column" and "parent!inner(columns)"."""
+        result: Dict[str, Any] = {}
+        for column in re.findall(r"[^,(]+(?:\([^)]*\))?", columns):
+            column = column.strip()
+            if not column:
+                continue
+            if column == "*":
+                result.update(self.public(row))
+                continue
+            embedded = re.match(r"(\w+)(?:!\w+)?\(([^)]*)\)", column)
+            if embedded:
+                parent = self.parent(embedded.group(1), row) or {}
+                fields = [field.strip() for field in embedded.group(2).split(",")]
+                result[embedded.group(1)] = {field: parent.get(field) for field in fields}
+                continue
+            alias, _, source = column.partition(":")
+            if not source:
+                alias = source = column
+            result[alias] = row.get(source)
+        return result
+
+    # RPCs from sql/schema.sql
+
+    def rpc_append_chat_messages(self, session_id_input: str, user_id_input: str = "anonymous", new_messages: Any = ()) -> List[Dict[str, Any]]:
+        sessions = self.tables.setdefault("chat_sessions", [])
+        session = next((row for row in sessions if row["session_id"] == session_id_input), None)
+        title = next((m["content"] for m in new_messages if m.get("role") == "user"), None)
+        if title is not None and len(title) > 50:
+            title = title[:50] + "..."
+
+        if session is None:
+            sessions.append(self.new_row("chat_sessions", {
+                "session_id": session_id_input,
+                "user_id": user_id_input,
+                "title": title,
+                "message_count": len(new_messages)
+            }))
+        else:
+            session["updated_at"] = _now()
+            session["title"] = session.get("title") or title
+            session["message_count"] += len(new_messages)
+
+        messages = self.tables.setdefault("chat_messages", [])
+        for message in new_messages:
+            messages.append(self.new_row("chat_messages", {
+                "session_id": session_id_input,
+                "message_id": message.get("id"),
+                "role": message.get("role"),
+                "content": message.get("content"),
+                "source": message.get("source")
+            }))
+        return []
+
+    def rpc_list_chat_sessions(
+        self,
+        user_id_filter: str = "anonymous",
+        before_updated_at: Optional[str] = None,
+        before_session_id: Optional[str] = None,
+        page_size: Optional[int] = None
+    ) -> List[Dict[str, Any]]:
+        sessions = [row for row in self.tables.get("chat_sessions", []) if row["user_id"] == user_id_filter]
+        if before_updated_at is not None:
+            sessions = [
+                row for row in sessions
+                if (row["updated_at"], row["session_id"]) < (before_updated_at, before_session_id)
+            ]
+        sessions.sort(key=lambda row: (row["updated_at"], row["session_id"]), reverse=True)
+        fields = ("session_id", "title", "message_count", "created_at", "updated_at")
+        return [{field: row.get(field) for field in fields} for row in sessions[:page_size]]
+
+    def _user_chunks(self, user_id: str) -> List[tuple]:
+        filenames = {
+            row["id"]: row["filename"]
+            for row in self.tables.get("documents", [])
+            if row["user_id"] == user_id
+        }
+        return [
+            (row, filenames[row["document_id"]])
+            for row in self.tables.get("document_chunks", [])
+            if row["document_id"] in filenames
+        ]
+
+    def rpc_search_document_chunks(
+        self,
+        query_embedding: Any,
+        user_id_filter: str = "anonymous",
+        similarity_threshold: float = 0.7,
+        match_count: int = 5,
+        **kwargs
+    ) -> List[Dict[str, Any]]:
+        chunks = [(row, filename) for row, filename in self._user_chunks(user_id_filter) if "_vector" in row]
+        if not chunks:
+            return []
+
+        similarities = np.stack([row["_vector"] for row, _ in chunks]) @ _parse_vector(query_embedding)
+        order = np.argsort(-similarities)[:match_count]
+        return [
+            {
+                "id": chunks[i][0]["id"],
+                "document_id": chunks[i][0]["document_id"],
+                "chunk_index": chunks[i][0]["chunk_index"],
+                "content": chunks[i][0]["content"],
+                "similarity": float(similarities[i]),
+                "documents": {"filename": chunks[i][1]}
+            }
+            for i in order if similarities[i] > similarity_threshold
+        ]
+
+    def rpc_search_document_chunks_text(self, query_text: str, user_id_filter: str = "anonymous", match_count: int = 5) -> List[Dict[str, Any]]:
+        terms = set(_words(query_text))
+        scored = []
+        for row, filename in self._user_chunks(user_id_filter):
+            words = _words(row["content"])
+            rank = sum(word in terms for word in words) / (len(words) or 1)
+            if rank > 0:
+                scored.append((rank, row, filename))
+        scored.sort(key=lambda item: item[0], reverse=True)
+        return [
+            {
+                "id": row["id"],
+                "document_id": row["document_id"],
+                "chunk_index": row["chunk_index"],
+                "content": row["content"],
+                "keyword_rank": rank,
+                "documents": {"filename": filename}
+            }
+            for rank, row, filename in scored[:match_count]
+        ]
+
+    def rpc_get_corpus_descriptor(self, user_id_filter: str = "anonymous") -> List[Dict[str, Any]]:
+        documents = [row for row in self.tables.get("documents", []) if row["user_id"] == user_id_filter]
+        return [{
+            "document_count": len(documents),
+            "chunk_count": len(self._user_chunks(user_id_filter)),
+            "last_modified": max((max(row["created_at"], row["updated_at"]) for row in documents), default=None)
+        }]
+
+
+# ---------------------------------------------------------------------------
+# Gemini stand-ins
+# ---------------------------------------------------------------------------
+
+def hashed_embedding(text: str, dimension: int = EMBEDDING_DIMENSION) -> List[float]:
+    """Deterministic bag-of-words embedding: texts sharing words point the same way."""
+    vector = np.zeros(dimension, dtype=np.float32)
+    for word in _words(text):
+        digest = hashlib.blake2b(word.encode(), digest_size=8).digest()
+        index = int.from_bytes(digest[:4], "little") % dimension
+        vector[index] += 1.0 if digest[4] & 1 else -1.0
+    if not vector.any():
+        vector[0] = 1.0
+    return vector.tolist()
+
+
+class FakeEmbedding:
+    def __init__(self, values: List[float]):
+        self.values = values
+
+
+class FakeEmbedResponse:
+    def __init__(self, embeddings: List[FakeEmbedding]):
+        self.embeddings = embeddings
+
+
+class FakeGenerateResponse:
+    def __init__(self, text: str):
+        self.text = text
+
+
+class FakeModels:
+    def __init__(self, embed_latency_ms: float, generate_latency_ms: float):
+        self.embed_latency = embed_latency_ms / 1000
+        self.generate_latency = generate_latency_ms / 1000
+        self.embed_calls = 0
+        self.generate_calls = 0
+
+    async def embed_content(self, model: str, contents: List[str], config: Any = None) -> FakeEmbedResponse:
+        self.embed_calls += 1
+        await asyncio.sleep(self.embed_latency)
+        dimension = getattr(config, "output_dimensionality", None) or EMBEDDING_DIMENSION
+        return FakeEmbedResponse([FakeEmbedding(hashed_embedding(text, dimension)) for text in contents])
+
+    async def generate_content(self, model: str, contents: Any, config: Any = None) -> FakeGenerateResponse:
+        # Used for conversation summaries
+        self.generate_calls += 1
+        await asyncio.sleep(self.generate_latency)
+        return FakeGenerateResponse("The user asked about neurosurgical procedures and their risks.")
+
+
+class FakeAio:
+    def __init__(self, models: FakeModels):
+        self.models = models
+
+
+class FakeGenaiClient:
+    """Stand-in for google.genai.Client with deterministic async embed and generate calls."""
+
+    def __init__(self, embed_latency_ms: float = 0.0, generate_latency_ms: float = 0.0):
+        self.aio = FakeAio(FakeModels(embed_latency_ms, generate_latency_ms))
+
+
+def build_fake_llm(first_token_ms: float, token_ms: float, answer_words: int):
+    """A Gemini stand-in for the ADK agent that streams a canned answer."""
+    from google.adk.models import BaseLlm, LlmResponse
+    from google.genai import types
+
+    class FakeLlm(BaseLlm):
+        model: str = "benchmark-fake"
+
+        async def generate_content_async(self, llm_request, stream: bool = False) -> AsyncGenerator[LlmResponse, None]:
+            question = ""
+            if llm_request.contents and llm_request.contents[-1].parts:
+                question = llm_request.contents[-1].parts[0].text or ""
+            words = (f"Regarding {question.strip()}:" + " details" * answer_words).split()
+
+            await asyncio.sleep(first_token_ms / 1000)
+            if stream:
+                for word in words:
+                    yield LlmResponse(
+                        content=types.Content(role="model", parts=[types.Part(text=word + " ")]),
+                        partial=True
+                    )
+                    await asyncio.sleep(token_ms / 1000)
+            else:
+                await asyncio.sleep(token_ms * len(words) / 1000)
+            yield LlmResponse(content=types.Content(role="model", parts=[types.Part(text=" ".join(words))]))
+
+    return FakeLlm()
+
+
+# ---------------------------------------------------------------------------
+# Load generation
+# ---------------------------------------------------------------------------
+
+def synthetic_document(sentences: int, seed: int) -> str:
+    rng = np.random.default_rng(seed)
+    picks = rng.integers(0, len(DOCUMENT_SENTENCES), size=sentences)
+    paragraphs = [
+        " ".join(DOCUMENT_SENTENCES[i] for i in picks[start:start + 5])
+        for start in range(0, sentences, 5)
+    ]
+    return "\n\n".join(paragraphs)
+
+
+def summarize(latencies: List[float], errors: int, elapsed: float) -> Dict[str, Any]:
+    values = np.array(latencies) * 1000 if latencies else np.zeros(1)
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "p50_ms": float(np.percentile(values, 50)),
+        "p95_ms": float(np.percentile(values, 95)),
+        "p99_ms": float(np.percentile(values, 99)),
+        "max_ms": float(values.max()),
+        "rps": len(latencies) / elapsed if elapsed > 0 else 0.0
+    }
+
+
+async def drive(
+    request: Callable[[int], Awaitable[bool]],
+    total: int,
+    concurrency: int
+) -> Dict[str, Any]:
+    """Run `total` requests with `concurrency` workers; each returns True on success."""
+    counter = itertools.count()
+    latencies: List[float] = []
+    errors = 0
+
+    async def worker() -> None:
+        nonlocal errors
+        while (index := next(counter)) < total:
+            start = time.perf_counter()
+            try:
+                ok = await request(index)
+            except Exception as e:
+                print(f"Request {index} failed: {e}")
+                ok = False
+            latencies.append(time.perf_counter() - start)
+            if not ok:
+                errors += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*[worker() for _ in range(concurrency)])
+    return summarize(latencies, errors, time.perf_counter() - start)
+
+
+async def wait_for_job(client, job_id: str, user_id: str, timeout: float = 300) -> bool:
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        response = await client.get(f"/api/documents/jobs/{job_id}", params={"user_id": user_id})
+        status = response.json().get("status") if response.status_code == 200 else None
+        if status in ("completed", "failed"):
+            return status == "completed"
+        await asyncio.sleep(0.01)
+    return False
+
+
+async def run_benchmark(args: argparse.Namespace) -> Dict[str, Any]:
+    import httpx
+    import database
+
+    supabase = LocalSupabase(args.db_latency_ms)
+    database.db_service.supabase = supabase
+
+    # Imported after the database stand-in is in place, so every service uses it
+    import main
+    from neurosurgery_agent.agent import root_agent
+
+    genai_client = FakeGenaiClient(args.embed_latency_ms, args.generate_latency_ms)
+    runtime = main.get_agent_runtime()
+    runtime.rag_service.genai_client = genai_client
+    if runtime.memory is not None:
+        runtime.memory.genai_client = genai_client
+    root_agent.model = build_fake_llm(args.first_token_ms, args.token_ms, args.answer_words)
+
+    results: Dict[str, Any] = {"config": vars(args), "endpoints": {}}
+    transport = httpx.ASGITransport(app=main.app)
+
+    async with main.lifespan(main.app):
+        async with httpx.AsyncClient(transport=transport, base_url="http://benchmark", timeout=None) as client:
+            user_id = "anonymous"
+
+            async def upload(index: int) -> Optional[str]:
+                document = synthetic_document(args.document_sentences, seed=index)
+                response = await client.post(
+                    "/api/documents/upload",
+                    files={"file": (f"benchmark-{index}.txt", document.encode(), "text/plain")},
+                    data={"user_id": user_id}
+                )
+                if response.status_code != 202:
+                    return None
+                return response.json()["job"]["id"]
+
+            # Seed documents so chat questions have something to retrieve
+            for index in range(args.seed_documents):
+                job_id = await upload(index)
+                if job_id is None or not await wait_for_job(client, job_id, user_id):
+                    print(f"⚠️  Seed document {index} failed to ingest")
+
+            async def chat(index: int) -> bool:
+                response = await client.post("/api/chat", json={
+                    "query": QUESTIONS[index % len(QUESTIONS)] + ("" if args.repeat_questions else f" (case {index})"),
+                    "session_id": f"benchmark-{index % args.sessions}"
+                })
+                return response.status_code == 200
+
+            async def sessions(index: int) -> bool:
+                response = await client.get("/api/sessions", params={"limit": 20})
+                return response.status_code == 200
+
+            # Uploads return once queued; ingestion to completion is tracked separately
+            ingest_latencies: List[float] = []
+            ingest_failures = 0
+            trackers: List[asyncio.Task] = []
+
+            async def track_ingest(job_id: str, start: float) -> None:
+                nonlocal ingest_failures
+                if await wait_for_job(client, job_id, user_id):
+                    ingest_latencies.append(time.perf_counter() - start)
+                else:
+                    ingest_failures += 1
+
+            async def upload_and_track(index: int) -> bool:
+                start = time.perf_counter()
+                job_id = await upload(args.seed_documents + index)
+                if job_id is None:
+                    return False
+                trackers.append(asyncio.create_task(track_ingest(job_id, start)))
+                return True
+
+            scenarios = {"chat": chat, "sessions": sessions, "upload": upload_and_track}
+            for name in args.endpoints:
+                requests = args.upload_requests if name == "upload" else args.requests
+                print(f"⏱️  {name}: {requests} requests, concurrency {args.concurrency}")
+
+                run_start = time.perf_counter()
+                results["endpoints"][name] = await drive(scenarios[name], requests, args.concurrency)
+
+                if name == "upload":
+                    await asyncio.gather(*trackers)
+                    results["endpoints"]["ingest"] = summarize(
+                        ingest_latencies, ingest_failures, time.perf_counter() - run_start
+                    )
+
+    results["calls"] = {
+        "database_requests": supabase.requests,
+        "embed_calls": genai_client.aio.models.embed_calls,
+        "summary_calls": genai_client.aio.models.generate_calls
+    }
+    return results
+
+
+def print_results(results: Dict[str, Any]) -> None:
+    print(f"\n{'endpoint':<10} {'requests':>9} {'errors':>7} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'rps':>9}")
+    for name, stats in results["endpoints"].items():
+        print(f"{name:<10} {stats['requests']:>9} {stats['errors']:>7} {stats['p50_ms']:>9.1f} "
+              f"{stats['p95_ms']:>9.1f} {stats['p99_ms']:>9.1f} {stats['rps']:>9.1f}")
+    calls = results["calls"]
+    print(f"\n📦 {calls['database_requests']} database requests, {calls['embed_calls']} embedding calls, "
+          f"{calls['summary_calls']} summary calls")
+
+
+def compare(results: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    """Endpoints whose p95 latency grew by more than `tolerance` over the baseline."""
+    regressions = []
+    for name, stats in results["endpoints"].items():
+        before = baseline.get("endpoints", {}).get(name)
+        if not before or before["p95_ms"] <= 0:
+            continue
+        change = stats["p95_ms"] / before["p95_ms"] - 1
+        if change > tolerance:
+            regressions.append(f"{name}: p95 {before['p95_ms']:.1f} ms -> {stats['p95_ms']:.1f} ms (+{change:.0%})")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark API endpoints offline")
+    parser.add_argument("--endpoints", nargs="+", choices=ENDPOINTS, default=list(ENDPOINTS))
+    parser.add_argument("--requests", type=int, default=200, help="Requests per chat/sessions run")
+    parser.add_argument("--upload-requests", type=int, default=20, help="Uploads in the upload run")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--sessions", type=int, default=20, help="Chat sessions the requests are spread over")
+    parser.add_argument("--repeat-questions", action="store_true",
+                        help="Reuse identical questions (exercises the answer and embedding caches)")
+    parser.add_argument("--seed-documents", type=int, default=3, help="Documents ingested before the chat run")
+    parser.add_argument("--document-sentences", type=int, default=200, help="Sentences per synthetic document")
+    parser.add_argument("--db-latency-ms", type=float, default=2.0, help="Delay per database request")
+    parser.add_argument("--embed-latency-ms", type=float, default=30.0, help="Delay per embedding call")
+    parser.add_argument("--generate-latency-ms", type=float, default=300.0, help="Delay per summary call")
+    parser.add_argument("--first-token-ms", type=float, default=200.0, help="Model delay before the first token")
+    parser.add_argument("--token-ms", type=float, default=2.0, help="Model delay per generated word")
+    parser.add_argument("--answer-words", type=int, default=80, help="Words per generated answer")
+    parser.add_argument("--output", help="Write results to this JSON file")
+    parser.add_argument("--baseline", help="Compare against results saved with --output")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed p95 increase over the baseline")
+    args = parser.parse_args()
+
+    results = asyncio.run(run_benchmark(args))
+    print_results(results)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"💾 Results written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        if regressions:
+            print("\n❌ Latency regressions:")
+            for regression in regressions:
+                print(f"   {regression}")
+            sys.exit(1)
+        print(f"\n✅ No p95 regressions beyond {args.tolerance:.0%} of the baseline")
+
+
+if __name__ == "__main__":
+    main()
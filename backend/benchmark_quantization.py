@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""
+Benchmark embedding quantization: memory, payload size and recall.
+
+Compares full-precision search against half-precision (pgvector halfvec),
+int8 (per-vector scale) and binary (sign bit, Hamming distance) quantized
+search, with and without re-ranking the top candidates by full-precision
+cosine similarity, as search_document_chunks does with PGVECTOR_QUANTIZATION.
+
+Runs offline on synthetic clustered unit vectors, or on real embeddings saved
+as a .npy matrix (e.g. exported from document_chunks).
+
+Usage:
+    python benchmark_quantization.py
+    python benchmark_quantization.py --embeddings chunks.npy --k 5 --rescore 4
+"""
+
+import json
+import time
+import argparse
+from typing import Callable, Dict
+import numpy as np
+from rag_service import to_vector_literal
+
+
+def synthetic_embeddings(count: int, dimension: int, clusters: int, rng: np.random.Generator) -> np.ndarray:
+    """Unit vectors drawn around random cluster centers, like topical document chunks."""
+    centers = rng.normal(size=(clusters, dimension))
+    assignments = rng.integers(0, clusters, size=count)
+    vectors = centers[assignments] + rng.normal(scale=0.8, size=(count, dimension))
+    return normalize(vectors.astype(np.float32))
+
+
+def normalize(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """Row-wise indexes of the k highest scores, best first."""
+    indexes = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    order = np.argsort(-np.take_along_axis(scores, indexes, axis=1), axis=1)
+    return np.take_along_axis(indexes, order, axis=1)
+
+
+def quantize_int8(matrix: np.ndarray):
+    scales = np.abs(matrix).max(axis=1, keepdims=True) / 127.0
+    scales[scales == 0] = 1.0
+    return np.round(matrix / scales).astype(np.int8), scales.astype(np.float32)
+
+
+def build_scorers(data: np.ndarray) -> Dict[str, Callable[[np.ndarray], np.ndarray]]:
+    """Approximate query-by-data similarity functions for each storage format."""
+    half = data.astype(np.float16)
+    codes, scales = quantize_int8(data)
+    bits = np.packbits(data > 0, axis=1)
+    dimension = data.shape[1]
+
+    # Set bits per byte value, for popcounts
+    popcount = np.unpackbits(np.arange(256, dtype=np.uint8)[:, None], axis=1).sum(axis=1)
+
+    def hamming_similarity(queries: np.ndarray) -> np.ndarray:
+        query_bits = np.packbits(queries > 0, axis=1)
+        differing = np.stack([popcount[q ^ bits].sum(axis=1) for q in query_bits])
+        return 1.0 - differing / dimension
+
+    return {
+        "halfvec": lambda queries: queries.astype(np.float16).astype(np.float32) @ half.astype(np.float32).T,
+        "int8": lambda queries: (queries @ codes.astype(np.float32).T) * scales.T,
+        "binary": hamming_similarity,
+    }
+
+
+def recall(found: np.ndarray, truth: np.ndarray) -> float:
+    k = truth.shape[1]
+    return float(np.mean([len(set(f) & set(t)) / k for f, t in zip(found, truth)]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark embedding quantization")
+    parser.add_argument("--embeddings", help="Optional .npy matrix of real embeddings")
+    parser.add_argument("--vectors", type=int, default=20000, help="Synthetic vectors to generate")
+    parser.add_argument("--dimension", type=int, default=768, help="Synthetic vector dimension")
+    parser.add_argument("--queries", type=int, default=200, help="Queries to run")
+    parser.add_argument("--k", type=int, default=5, help="Results per query")
+    parser.add_argument("--rescore", type=int, default=4, help="Candidates per result re-ranked at full precision")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    if args.embeddings:
+        data = normalize(np.load(args.embeddings).astype(np.float32))
+    else:
+        data = synthetic_embeddings(args.vectors, args.dimension, clusters=64, rng=rng)
+    count, dimension = data.shape
+
+    # Queries are perturbed data points, so each has genuine near neighbours
+    picks = rng.integers(0, count, size=args.queries)
+    queries = normalize(data[picks] + rng.normal(scale=0.02, size=(args.queries, dimension)).astype(np.float32))
+
+    truth = top_k(queries @ data.T, args.k)
+    candidates = args.k * args.rescore
+
+    bytes_per_vector = {
+        "float32": 4 * dimension,
+        "halfvec": 2 * dimension,
+        "int8": dimension + 4,
+        "binary": dimension // 8,
+    }
+
+    print(f"📊 {count} vectors x {dimension} dims, {args.queries} queries, k={args.k}, rescore x{args.rescore}\n")
+    print(f"{'format':<8} {'bytes/vec':>10} {'total MB':>9} {'recall':>8} {'rescored':>9} {'ms/query':>9}")
+    print(f"{'float32':<8} {bytes_per_vector['float32']:>10} {bytes_per_vector['float32'] * count / 1e6:>9.1f} "
+          f"{1.0:>8.3f} {'-':>9} {'-':>9}")
+
+    for name, scorer in build_scorers(data).items():
+        start = time.perf_counter()
+        scores = scorer(queries)
+        elapsed_ms = (time.perf_counter() - start) * 1000 / args.queries
+
+        direct = top_k(scores, args.k)
+        shortlist = top_k(scores, min(candidates, count))
+        exact = np.einsum("qd,qcd->qc", queries, data[shortlist])
+        rescored = np.take_along_axis(shortlist, top_k(exact, args.k), axis=1)
+
+        size = bytes_per_vector[name]
+        print(f"{name:<8} {size:>10} {size * count / 1e6:>9.1f} "
+              f"{recall(direct, truth):>8.3f} {recall(rescored, truth):>9.3f} {elapsed_ms:>9.2f}")
+
+    sample = data[:100]
+    json_list = np.mean([len(json.dumps(vector.tolist())) for vector in sample])
+    literal = np.mean([len(to_vector_literal(vector)) for vector in sample])
+    print(f"\n📦 Insert payload per vector: JSON float list {json_list:,.0f} bytes, "
+          f"vector literal {literal:,.0f} bytes ({literal / json_list:.0%})")
+
+
+if __name__ == "__main__":
+    main()
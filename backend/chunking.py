@@ -0,0 +1,313 @@
+"""
+Sentence-Aware Document Chunking
+
+Splits text into chunks that end on sentence or paragraph boundaries and fit an
+approximate token budget, in a single streaming pass. Each chunk keeps the
+character offsets of its text in the original document.
+"""
+
+import re
+from typing import List, Dict, Any, Optional, Tuple, AsyncIterable, AsyncIterator
+
+# Rough characters per token for English text; used to estimate chunk sizes
+# without running a tokenizer
+CHARS_PER_TOKEN = 4
+
+# End of a sentence (terminal punctuation, optional closing quote or bracket,
+# then whitespace) or a line break. Two or more newlines mark a paragraph.
+# Matches only start at the first of a run of terminal punctuation, so a long
+# run is not re-tried from every position in it.
+BOUNDARY = re.compile(r"""(?<![.!?])[.!?]+["')\]]*\s+|\n\s*""")
+
+# Characters a sentence boundary can start with, and continue with before its whitespace
+BOUNDARY_START = ".!?"
+BOUNDARY_BODY = ".!?\"')]"
+
+# (start offset, end offset, estimated tokens, starts a paragraph)
+Unit = Tuple[int, int, int, bool]
+
+
+def estimate_tokens(char_count: int) -> int:
+    """Approximate token count for a span of text."""
+    return -(-char_count // CHARS_PER_TOKEN)
+
+
+class SentenceChunker:
+    """
+    Streaming chunker that packs whole sentences into token-budgeted chunks.
+
+    Text is fed in arbitrary pieces. Sentences are never split unless a single
+    sentence exceeds the budget, in which case it is cut at whitespace. A new
+    paragraph starts a new chunk once the current one is at least half full.
+    Consecutive chunks within a paragraph share up to overlap_tokens of
+    trailing sentences. Only the current chunk and at most about one chunk's
+    worth of unfinished sentence are kept in memory, and each character is
+    scanned for boundaries once, so the output does not depend on how the
+    text is split into pieces.
+    """
+
+    def __init__(self, max_tokens: int = 512, overlap_tokens: int = 64):
+        self.max_tokens = max_tokens
+        self.overlap_tokens = overlap_tokens
+        self.max_chars = max_tokens * CHARS_PER_TOKEN
+
+        self._buffer = ""
+        self._buffer_start = 0  # document offset of _buffer[0]
+        self._scan = 0  # buffer index where the next sentence starts
+        self._search_from = 0  # buffer index where the boundary search resumes
+        self._scanned_to = 0  # buffer length at the end of the last scan
+        self._started = False  # leading whitespace skipped
+        self._paragraph_start = True  # next sentence starts a paragraph
+        self._skip_space = False  # next sentence continues one cut at whitespace
+
+        self._units: List[Unit] = []  # sentences in the current chunk
+        self._tokens = 0
+        self._new_units = 0  # sentences added since the last chunk (excludes overlap)
+        self._chunks: List[Dict[str, Any]] = []
+
+    def feed(self, text: str) -> List[Dict[str, Any]]:
+        """
+        Add text and return the chunks completed by it.
+
+        Returns:
+            Chunks as {"content", "start_char", "end_char"}
+        """
+        if text:
+            self._buffer += text
+            self._scan_units(final=False)
+        return self._take_chunks()
+
+    def finish(self) -> List[Dict[str, Any]]:
+        """Flush the remaining text as the final chunk(s)."""
+        self._scan_units(final=True)
+        if self._new_units:
+            self._emit()
+        return self._take_chunks()
+
+    def _scan_units(self, final: bool) -> None:
+        """Cut complete sentences off the buffer and pack them into chunks."""
+        buffer = self._buffer
+
+        if not self._started:
+            stripped = len(buffer) - len(buffer.lstrip())
+            if stripped == len(buffer):
+                # Only whitespace so far; drop it
+                self._buffer = ""
+                self._buffer_start += len(buffer)
+                return
+            self._scan = self._search_from = stripped
+            self._started = True
+
+        # Text before _search_from was already scanned and holds no boundary.
+        # It is behind _scan only while a run of punctuation is pending, since
+        # the run belongs to the unfinished sentence and may have been cut.
+        search_from = self._search_from
+        sentence_end = len(buffer)  # the unfinished sentence extends at least this far
+        for match in BOUNDARY.finditer(buffer, search_from):
+            # Whitespace running to the end of the buffer may continue in the next piece
+            if match.end() == len(buffer) and not final:
+                search_from = sentence_end = match.start()
+                break
+            end = match.start() + len(match.group().rstrip())
+            self._add_unit(self._scan, end)
+            self._paragraph_start = match.group().count("\n") >= 2
+            self._scan = search_from = match.end()
+        else:
+            search_from = self._pending_boundary(buffer, search_from)
+
+        if final:
+            if self._scan < len(buffer):
+                end = len(buffer.rstrip())
+                if end > self._scan:
+                    self._add_unit(self._scan, end)
+                self._scan = len(buffer)
+        else:
+            # Cut the unfinished sentence now wherever it already exceeds the
+            # budget, so it is never held whole
+            self._scan = self._cut_long_sentence(self._scan, sentence_end)
+        self._search_from = search_from
+        self._scanned_to = len(buffer)
+
+        # Drop text no longer needed: everything before the current chunk
+        keep_from = self._units[0][0] if self._units else self._buffer_start + self._scan
+        cut = keep_from - self._buffer_start
+        if cut > 0:
+            self._buffer = self._buffer[cut:]
+            self._buffer_start = keep_from
+            self._scan -= cut
+            self._search_from = max(0, self._search_from - cut)
+            self._scanned_to -= cut
+
+    def _pending_boundary(self, buffer: str, search_from: int) -> int:
+        """
+        Buffer index where a boundary may start once more text arrives.
+
+        Only trailing punctuation can grow into a boundary. Just the text added
+        since the last scan is walked back over; if all of it is punctuation,
+        the run pending at search_from continues.
+        """
+        position = len(buffer)
+        index = len(buffer) - 1
+        limit = max(self._scan, self._scanned_to)
+        while index >= limit and buffer[index] in BOUNDARY_BODY:
+            if buffer[index] in BOUNDARY_START:
+                position = index
+            index -= 1
+        if index < limit and search_from < self._scanned_to:
+            position = search_from
+        return position
+
+    def _add_unit(self, start: int, end: int) -> None:
+        """Add the sentence buffer[start:end], cutting it at whitespace if over budget."""
+        start = self._cut_long_sentence(start, end)
+        self._skip_space = False
+        if end > start:
+            self._append_unit(start, end, self._paragraph_start)
+
+    def _cut_long_sentence(self, start: int, end: int) -> int:
+        """
+        Append max_chars pieces of a sentence while more than max_chars remain before end.
+
+        Args:
+            start: Buffer index of the (rest of the) sentence
+            end: Buffer index the sentence extends to at least
+
+        Returns:
+            Buffer index where the rest of the sentence starts
+        """
+        buffer = self._buffer
+        while True:
+            if self._skip_space:
+                while start < end and buffer[start].isspace():
+                    start += 1
+                if start == end:
+                    # The whitespace may continue past end
+                    return start
+                self._skip_space = False
+
+            if end - start <= self.max_chars:
+                return start
+
+            cut = max(buffer.rfind(" ", start, start + self.max_chars), buffer.rfind("\n", start, start + self.max_chars))
+            if cut <= start:
+                cut = start + self.max_chars
+            piece_end = start + len(buffer[start:cut].rstrip())
+            self._append_unit(start, piece_end, self._paragraph_start)
+            self._paragraph_start = False
+            start = cut
+            self._skip_space = True
+
+    def _append_unit(self, start: int, end: int, paragraph_start: bool) -> None:
+        """Append a sentence (buffer indexes) to the current chunk, emitting it first if full."""
+        offset = self._buffer_start
+        unit = (offset + start, offset + end, estimate_tokens(end - start), paragraph_start)
+        tokens = unit[2]
+
+        if self._new_units:
+            over_budget = self._tokens + tokens > self.max_tokens
+            paragraph_break = paragraph_start and self._tokens * 2 >= self.max_tokens
+            if over_budget or paragraph_break:
+                self._emit()
+                # Carry trailing sentences over as overlap, but never across a
+                # paragraph break and never the whole previous chunk
+                carried: List[Unit] = []
+                carried_tokens = 0
+                if not paragraph_break:
+                    for previous in reversed(self._units[1:]):
+                        if carried_tokens + previous[2] > self.overlap_tokens:
+                            break
+                        carried.insert(0, previous)
+                        carried_tokens += previous[2]
+                while carried and carried_tokens + tokens > self.max_tokens:
+                    carried_tokens -= carried.pop(0)[2]
+                self._units = carried
+                self._tokens = carried_tokens
+                self._new_units = 0
+
+        self._units.append(unit)
+        self._tokens += tokens
+        self._new_units += 1
+
+    def _emit(self) -> None:
+        """Record the current chunk."""
+        start, end = self._units[0][0], self._units[-1][1]
+        self._chunks.append({
+            "content": self._buffer[start - self._buffer_start:end - self._buffer_start],
+            "start_char": start,
+            "end_char": end
+        })
+
+    def _take_chunks(self) -> List[Dict[str, Any]]:
+        chunks, self._chunks = self._chunks, []
+        return chunks
+
+
+def chunk_document(text: str, max_tokens: int = 512, overlap_tokens: int = 64) -> List[Dict[str, Any]]:
+    """
+    Chunk a whole document held in memory.
+
+    Args:
+        text: Document text
+        max_tokens: Approximate token budget per chunk
+        overlap_tokens: Approximate tokens of trailing sentences repeated in the next chunk
+
+    Returns:
+        Chunks as {"content", "start_char", "end_char"}
+    """
+    chunker = SentenceChunker(max_tokens, overlap_tokens)
+    return chunker.feed(text) + chunker.finish()
+
+
+async def iter_chunks(
+    pieces: AsyncIterable[str],
+    max_tokens: int = 512,
+    overlap_tokens: int = 64
+) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Chunk a stream of text pieces without holding the whole text.
+
+    Args:
+        pieces: Decoded text, in order
+        max_tokens: Approximate token budget per chunk
+        overlap_tokens: Approximate tokens of trailing sentences repeated in the next chunk
+
+    Yields:
+        Chunks identical to chunk_document on the concatenated text
+    """
+    chunker = SentenceChunker(max_tokens, overlap_tokens)
+    async for piece in pieces:
+        for chunk in chunker.feed(piece):
+            yield chunk
+    for chunk in chunker.finish():
+        yield chunk
+
+
+def stitch_chunks(chunks: List[Dict[str, Any]]) -> str:
+    """
+    Rebuild document text from chunks with character offsets.
+
+    Overlapping text is taken once. The whitespace between chunks is not
+    stored; chunks mostly break at paragraphs, so wider gaps are filled with a
+    blank line and single-character gaps with a space.
+
+    Args:
+        chunks: Chunks with content, start_char and end_char, ordered by start_char
+
+    Returns:
+        Reassembled text
+    """
+    parts: List[str] = []
+    position: Optional[int] = None
+
+    for chunk in chunks:
+        start, end, content = chunk["start_char"], chunk["end_char"], chunk["content"]
+        if position is None:
+            parts.append(content)
+        elif start >= position:
+            gap = start - position
+            parts.append(("\n\n" if gap > 1 else " " * gap) + content)
+        elif end > position:
+            parts.append(content[position - start:])
+        position = end if position is None else max(position, end)
+
+    return "".join(parts)
@@ -0,0 +1,213 @@
+"""
+Bounded Conversation Memory for Multi-Turn Chats
+
+Gives the agent the context of earlier turns without resending the whole
+transcript: the most recent turns are passed verbatim and older ones are folded
+into a rolling summary stored with the chat session. The summary is extended
+in the background a few turns at a time, so each prompt carries at most a
+fixed number of recent turns plus a summary of bounded length.
+"""
+
+import os
+import asyncio
+from typing import List, Dict, Any, Optional, Set
+from google import genai
+from google.genai import types
+from metrics import CHAT_STAGE_SECONDS, GEMINI_CALLS, GEMINI_ERRORS
+
+SUMMARY_PROMPT = """You maintain a running summary of a conversation between a user and a neurosurgery AI assistant.
+
+Update the summary with the new messages below. Keep the facts the assistant needs to answer follow-up questions: the user's situation and goals, the topics and procedures discussed, key facts and recommendations given, and open questions. Write plain prose in the third person, at most {max_chars} characters.
+
+Current summary:
+{summary}
+
+New messages:
+{messages}
+
+Updated summary:"""
+
+
+class ConversationMemory:
+    def __init__(
+        self,
+        db_service,
+        genai_client: genai.Client,
+        window_turns: int = 4,
+        summary_batch_turns: int = 4,
+        summary_max_chars: int = 2000,
+        message_max_chars: int = 2000,
+        summary_model: str = "gemini-2.0-flash"
+    ):
+        """
+        Initialize conversation memory.
+
+        Args:
+            db_service: DatabaseService holding chat messages and session summaries
+            genai_client: Gemini client used to write summaries
+            window_turns: Recent turns (question and answer pairs) passed verbatim;
+                0 disables conversation memory
+            summary_batch_turns: Turns allowed to accumulate beyond the window
+                before they are folded into the summary
+            summary_max_chars: Maximum summary length
+            message_max_chars: Longest message passed verbatim; longer ones are truncated
+            summary_model: Gemini model used to write summaries
+        """
+        self.db = db_service
+        self.genai_client = genai_client
+        self.window_turns = window_turns
+        self.summary_batch_turns = max(1, summary_batch_turns)
+        self.summary_max_chars = summary_max_chars
+        self.message_max_chars = message_max_chars
+        self.summary_model = summary_model
+
+        self._summary_locks: Dict[str, asyncio.Lock] = {}
+        self._summary_tasks: Set[asyncio.Task] = set()
+
+    @classmethod
+    def from_env(cls, db_service, genai_client: genai.Client) -> "ConversationMemory":
+        """Create conversation memory configured from CONVERSATION_* environment variables."""
+        return cls(
+            db_service,
+            genai_client,
+            window_turns=int(os.getenv("CONVERSATION_WINDOW_TURNS", 4)),
+            summary_batch_turns=int(os.getenv("CONVERSATION_SUMMARY_BATCH_TURNS", 4)),
+            summary_max_chars=int(os.getenv("CONVERSATION_SUMMARY_MAX_CHARS", 2000)),
+            message_max_chars=int(os.getenv("CONVERSATION_MESSAGE_MAX_CHARS", 2000)),
+            summary_model=os.getenv("CONVERSATION_SUMMARY_MODEL", "gemini-2.0-flash")
+        )
+
+    @property
+    def enabled(self) -> bool:
+        return self.window_turns > 0
+
+    @property
+    def max_messages(self) -> int:
+        """Most unsummarized messages ever passed to the model."""
+        return 2 * (self.window_turns + self.summary_batch_turns)
+
+    async def load(self, session_id: str) -> Dict[str, Any]:
+        """
+        Load the context of a session's earlier turns.
+
+        Args:
+            session_id: Chat session ID
+
+        Returns:
+            {"summary": summary of older turns (may be empty),
+             "messages": recent messages not covered by the summary, oldest first,
+             at most max_messages}
+        """
+        if not self.enabled:
+            return {"summary": "", "messages": []}
+
+        with CHAT_STAGE_SECONDS.time(stage="history_load"):
+            state, messages = await asyncio.gather(
+                self.db.load_session_summary(session_id),
+                self.db.load_chat_message_range(session_id, self.max_messages)
+            )
+
+        # Filter after both reads, so a summary written in between is never
+        # combined with messages it already covers
+        summary, through = state.get("summary") or "", state.get("summary_through")
+        if through is not None:
+            messages = [message for message in messages if message["cursor"] > through]
+
+        return {
+            "summary": summary,
+            "messages": [
+                {**message, "content": self._truncate(message["content"], self.message_max_chars)}
+                for message in messages
+            ]
+        }
+
+    def schedule_update(self, session_id: str) -> None:
+        """Fold turns that left the window into the summary, in the background."""
+        if not self.enabled:
+            return
+
+        task = asyncio.create_task(self.update(session_id))
+        self._summary_tasks.add(task)
+        task.add_done_callback(self._summary_tasks.discard)
+
+    async def update(self, session_id: str) -> bool:
+        """
+        Fold turns that left the window into the summary, once enough accumulate.
+
+        Turns are folded oldest first, summary_batch_turns at a time, until at
+        most max_messages messages remain unsummarized.
+
+        Args:
+            session_id: Chat session ID
+
+        Returns:
+            True if the summary was extended
+        """
+        lock = self._summary_locks.setdefault(session_id, asyncio.Lock())
+        async with lock:
+            extended = False
+            try:
+                state = await self.db.load_session_summary(session_id)
+                summary, through = state.get("summary") or "", state.get("summary_through")
+
+                while True:
+                    messages = await self.db.load_chat_message_range(
+                        session_id, self.max_messages + 1, after=through, newest=False
+                    )
+                    if len(messages) <= self.max_messages:
+                        return extended
+
+                    fold = messages[:2 * self.summary_batch_turns]
+                    summary = await self._summarize(summary, fold)
+                    if summary is None:
+                        return extended
+
+                    through = fold[-1]["cursor"]
+                    if not await self.db.save_session_summary(session_id, summary, through):
+                        return extended
+                    extended = True
+
+            except Exception as e:
+                print(f"Error updating conversation summary: {e}")
+                return extended
+
+    async def drain(self) -> None:
+        """Wait for background summary updates to finish."""
+        if self._summary_tasks:
+            await asyncio.wait(list(self._summary_tasks))
+
+    async def _summarize(self, summary: str, messages: List[Dict[str, Any]]) -> Optional[str]:
+        """Extend a summary with new messages using Gemini."""
+        transcript = "\n".join(
+            f"{'User' if message['role'] == 'user' else 'Assistant'}: "
+            f"{self._truncate(message['content'], self.message_max_chars)}"
+            for message in messages
+        )
+        prompt = SUMMARY_PROMPT.format(
+            max_chars=self.summary_max_chars,
+            summary=summary or "(none yet)",
+            messages=transcript
+        )
+
+        GEMINI_CALLS.inc(operation="summarize")
+        try:
+            response = await self.genai_client.aio.models.generate_content(
+                model=self.summary_model,
+                contents=prompt,
+                config=types.GenerateContentConfig(
+                    temperature=0.2,
+                    # Roughly 4 characters per token, with headroom
+                    max_output_tokens=self.summary_max_chars // 3
+                )
+            )
+        except Exception as e:
+            GEMINI_ERRORS.inc(operation="summarize")
+            print(f"Error summarizing conversation: {e}")
+            return None
+
+        text = (response.text or "").strip()
+        return self._truncate(text, self.summary_max_chars) if text else None
+
+    @staticmethod
+    def _truncate(text: str, max_chars: int) -> str:
+        return text if len(text) <= max_chars else text[:max_chars].rstrip() + "…"
@@ -0,0 +1,114 @@
+"""
+Per-User Corpus Descriptors
+
+Tracks how many documents and chunks each user has indexed, with a version
+stamp that changes whenever their document set does. Retrieval is skipped for
+users with nothing to search, and results derived from a user's documents
+(such as cached answers) are only reused for the version they were built from.
+"""
+
+import os
+import time
+import asyncio
+from typing import Dict, Any, Optional, Tuple
+from supabase import AsyncClient
+
+
+class CorpusRegistry:
+    def __init__(self, supabase_client: AsyncClient, ttl_seconds: float = 60):
+        """
+        Initialize the registry.
+
+        Args:
+            supabase_client: Async Supabase client used to load descriptors
+            ttl_seconds: Descriptor lifetime before it is reloaded, so uploads and
+                deletes made by other server processes are picked up
+        """
+        self.supabase = supabase_client
+        self.ttl_seconds = ttl_seconds
+
+        # user_id -> (loaded_at, descriptor)
+        self._descriptors: Dict[str, Tuple[float, Dict[str, Any]]] = {}
+        self._load_locks: Dict[str, asyncio.Lock] = {}
+
+    @classmethod
+    def from_env(cls, supabase_client: AsyncClient) -> "CorpusRegistry":
+        """Create a registry configured from CORPUS_DESCRIPTOR_TTL."""
+        return cls(supabase_client, ttl_seconds=float(os.getenv("CORPUS_DESCRIPTOR_TTL", 60)))
+
+    async def get(self, user_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Return a user's corpus descriptor, loading it if missing or expired.
+
+        Args:
+            user_id: User ID
+
+        Returns:
+            {"documents", "chunks", "version"}, or None if it could not be loaded
+            (callers should then assume the user may have documents)
+        """
+        descriptor = self._fresh(user_id)
+        if descriptor is not None:
+            return descriptor
+
+        # One load per user at a time; concurrent requests wait for it
+        lock = self._load_locks.setdefault(user_id, asyncio.Lock())
+        async with lock:
+            descriptor = self._fresh(user_id)
+            if descriptor is not None:
+                return descriptor
+            return await self._load(user_id)
+
+    async def refresh(self, user_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Reload a user's descriptor after their documents changed.
+
+        Args:
+            user_id: User ID
+
+        Returns:
+            The new descriptor, or None if it could not be loaded
+        """
+        lock = self._load_locks.setdefault(user_id, asyncio.Lock())
+        async with lock:
+            return await self._load(user_id)
+
+    def invalidate(self, user_id: str) -> None:
+        """Forget a user's descriptor so the next get reloads it."""
+        self._descriptors.pop(user_id, None)
+
+    def _fresh(self, user_id: str) -> Optional[Dict[str, Any]]:
+        entry = self._descriptors.get(user_id)
+        if entry is not None and time.time() - entry[0] < self.ttl_seconds:
+            return entry[1]
+        return None
+
+    async def _load(self, user_id: str) -> Optional[Dict[str, Any]]:
+        """Fetch the descriptor from the database and cache it."""
+        self._descriptors.pop(user_id, None)
+
+        try:
+            result = await self.supabase.rpc(
+                "get_corpus_descriptor",
+                {"user_id_filter": user_id}
+            ).execute()
+        except Exception as e:
+            print(f"Error loading corpus descriptor for user {user_id}: {e}")
+            return None
+
+        if not result.data:
+            return None
+
+        row = result.data[0]
+        documents = row.get("document_count") or 0
+        chunks = row.get("chunk_count") or 0
+        descriptor = {
+            "documents": documents,
+            "chunks": chunks,
+            # Changes with any upload or delete: counts catch deletes, the latest
+            # document timestamp catches a delete followed by an upload
+            "version": f"{documents}:{chunks}:{row.get('last_modified') or ''}"
+        }
+
+        self._descriptors[user_id] = (time.time(), descriptor)
+        return descriptor
@@ -6,59 +6,110 @@ Handles all database operations for storing and retrieving chat sessions.
 
 import os
 import json
-from typing import List, Dict, Any, Optional
-from supabase import create_client, Client
+import base64
+import binascii
+import httpx
+from typing import List, Dict, Any, Optional, Tuple
+from supabase import AsyncClient, AsyncClientOptions
 from dotenv import load_dotenv
 
 load_dotenv()
 
+# Columns selected from chat_messages when rebuilding message objects
+MESSAGE_COLUMNS = "message_id, role, content, source"
+
+# Messages fetched per request when loading a whole session (PostgREST's default max-rows)
+MESSAGE_PAGE_SIZE = 1000
+
+
+def encode_session_cursor(updated_at: str, session_id: str) -> str:
+    """Encode a session list position as an opaque, URL-safe cursor."""
+    raw = json.dumps([updated_at, session_id], separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_session_cursor(cursor: str) -> Tuple[str, str]:
+    """
+    Decode a cursor made by encode_session_cursor.
+    
+    Raises:
+        ValueError: If the cursor is malformed
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        updated_at, session_id = json.loads(raw.decode("utf-8"))
+    except (binascii.Error, UnicodeDecodeError, TypeError, ValueError) as e:
+        raise ValueError(f"Invalid session cursor: {cursor!r}") from e
+    if not isinstance(updated_at, str) or not isinstance(session_id, str):
+        raise ValueError(f"Invalid session cursor: {cursor!r}")
+    return updated_at, session_id
+
+
 class DatabaseService:
     def __init__(self):
-        """Initialize Supabase client."""
+        """Initialize async Supabase client backed by a pooled HTTP client."""
         supabase_url = os.getenv("SUPABASE_URL")
         supabase_key = os.getenv("SUPABASE_ANON_KEY")
         
         if not supabase_url or not supabase_key:
             raise ValueError("SUPABASE_URL and SUPABASE_ANON_KEY must be set in environment variables")
         
-        self.supabase: Client = create_client(supabase_url, supabase_key)
+        # One bounded connection pool shared by every service that talks to PostgREST,
+        # so concurrent requests reuse keep-alive connections instead of blocking the loop
+        max_connections = int(os.getenv("SUPABASE_MAX_CONNECTIONS", 20))
+        self.http_client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_connections
+            ),
+            timeout=httpx.Timeout(float(os.getenv("SUPABASE_TIMEOUT", 30))),
+            follow_redirects=True
+        )
+        
+        self.supabase: AsyncClient = AsyncClient(
+            supabase_url,
+            supabase_key,
+            options=AsyncClientOptions(httpx_client=self.http_client)
+        )
+    
+    async def close(self) -> None:
+        """Close the pooled HTTP connections."""
+        await self.http_client.aclose()
     
-    async def save_chat_session(self, session_id: str, messages: List[Dict[str, Any]], user_id: str = "anonymous") -> bool:
+    async def append_chat_messages(self, session_id: str, messages: List[Dict[str, Any]], user_id: str = "anonymous") -> bool:
         """
-        Save or update a chat session with messages.
+        Append messages to a chat session, creating the session if needed.
+        
+        Only the new messages are sent; the append runs as a single server-side
+        transaction so concurrent turns on one session cannot overwrite each other.
         
         Args:
             session_id: Unique session identifier
-            messages: List of message objects
+            messages: New message objects, in order
             user_id: User identifier (default: "anonymous")
             
         Returns:
             bool: True if successful, False otherwise
         """
         try:
-            # Try to update existing session first
-            result = self.supabase.table("chat_sessions").update({
-                "messages": messages,
-                "updated_at": "NOW()"
-            }).eq("session_id", session_id).execute()
-            
-            # If no rows were updated, create new session
-            if not result.data:
-                result = self.supabase.table("chat_sessions").insert({
-                    "session_id": session_id,
-                    "user_id": user_id,
-                    "messages": messages
-                }).execute()
+            await self.supabase.rpc(
+                "append_chat_messages",
+                {
+                    "session_id_input": session_id,
+                    "user_id_input": user_id,
+                    "new_messages": messages
+                }
+            ).execute()
             
             return True
             
         except Exception as e:
-            print(f"Error saving chat session: {e}")
+            print(f"Error appending chat messages: {e}")
             return False
     
     async def load_chat_session(self, session_id: str) -> Optional[List[Dict[str, Any]]]:
         """
-        Load messages for a specific chat session.
+        Load all messages for a specific chat session.
         
         Args:
             session_id: Unique session identifier
@@ -67,10 +118,23 @@ class DatabaseService:
             List of message objects or None if session not found
         """
         try:
-            result = self.supabase.table("chat_sessions").select("messages").eq("session_id", session_id).execute()
+            # Read a page at a time so long sessions aren't cut off at the row cap
+            rows: List[Dict[str, Any]] = []
+            while True:
+                query = self.supabase.table("chat_messages").select(
+                    f"cursor:id, {MESSAGE_COLUMNS}"
+                ).eq("session_id", session_id)
+                if rows:
+                    query = query.gt("id", rows[-1]["cursor"])
+                
+                result = await query.order("id").limit(MESSAGE_PAGE_SIZE).execute()
+                page = result.data or []
+                rows.extend(page)
+                if len(page) < MESSAGE_PAGE_SIZE:
+                    break
             
-            if result.data and len(result.data) > 0:
-                return result.data[0]["messages"]
+            if rows:
+                return [self._to_message(row) for row in rows]
             
             return None
             
@@ -78,26 +142,183 @@ class DatabaseService:
             print(f"Error loading chat session: {e}")
             return None
     
-    async def get_user_sessions(self, user_id: str = "anonymous") -> List[Dict[str, Any]]:
+    async def load_chat_messages_page(self, session_id: str, limit: int = 50, before: Optional[int] = None) -> Dict[str, Any]:
         """
-        Get all sessions for a user (for future sidebar implementation).
+        Load one page of a chat session's messages, newest page first.
+        
+        Args:
+            session_id: Unique session identifier
+            limit: Maximum number of messages to return
+            before: Cursor from a previous page; only older messages are returned
+            
+        Returns:
+            Dict with "messages" (oldest first within the page) and "next_cursor"
+            (None when there are no older messages)
+        """
+        try:
+            query = self.supabase.table("chat_messages").select(
+                f"cursor:id, {MESSAGE_COLUMNS}"
+            ).eq("session_id", session_id)
+            
+            if before is not None:
+                query = query.lt("id", before)
+            
+            # Fetch one extra row to know whether an older page exists
+            result = await query.order("id", desc=True).limit(limit + 1).execute()
+            rows = result.data or []
+            
+            has_more = len(rows) > limit
+            rows = list(reversed(rows[:limit]))
+            
+            return {
+                "messages": [self._to_message(row) for row in rows],
+                "next_cursor": rows[0]["cursor"] if has_more and rows else None
+            }
+            
+        except Exception as e:
+            print(f"Error loading chat messages page: {e}")
+            return {"messages": [], "next_cursor": None}
+    
+    async def load_chat_message_range(
+        self,
+        session_id: str,
+        limit: int,
+        after: Optional[int] = None,
+        newest: bool = True
+    ) -> List[Dict[str, Any]]:
+        """
+        Load up to `limit` messages of a session with their cursors.
+        
+        Args:
+            session_id: Unique session identifier
+            limit: Maximum number of messages to return
+            after: Only return messages after this cursor
+            newest: Take the newest matching messages (otherwise the oldest)
+            
+        Returns:
+            Message objects with a "cursor" field, oldest first
+        """
+        try:
+            query = self.supabase.table("chat_messages").select(
+                f"cursor:id, {MESSAGE_COLUMNS}"
+            ).eq("session_id", session_id)
+            
+            if after is not None:
+                query = query.gt("id", after)
+            
+            result = await query.order("id", desc=newest).limit(limit).execute()
+            rows = result.data or []
+            if newest:
+                rows.reverse()
+            
+            return [{**self._to_message(row), "cursor": row["cursor"]} for row in rows]
+            
+        except Exception as e:
+            print(f"Error loading chat messages: {e}")
+            return []
+    
+    async def load_session_summary(self, session_id: str) -> Dict[str, Any]:
+        """
+        Load the rolling summary of a session's older messages.
+        
+        Args:
+            session_id: Unique session identifier
+            
+        Returns:
+            Dict with "summary" and "summary_through" (cursor of the last message
+            it covers); empty if the session has no summary
+        """
+        try:
+            result = await self.supabase.table("chat_sessions").select(
+                "summary, summary_through"
+            ).eq("session_id", session_id).limit(1).execute()
+            
+            return result.data[0] if result.data else {}
+            
+        except Exception as e:
+            print(f"Error loading session summary: {e}")
+            return {}
+    
+    async def save_session_summary(self, session_id: str, summary: str, through: int) -> bool:
+        """
+        Store a session's rolling summary, unless a newer one is already stored.
+        
+        Args:
+            session_id: Unique session identifier
+            summary: Summary of the session's messages up to `through`
+            through: Cursor of the last message covered by the summary
+            
+        Returns:
+            bool: True if the summary was stored
+        """
+        try:
+            result = await self.supabase.table("chat_sessions").update({
+                "summary": summary,
+                "summary_through": through
+            }).eq("session_id", session_id).or_(
+                f"summary_through.is.null,summary_through.lt.{through}"
+            ).execute()
+            
+            return bool(result.data)
+            
+        except Exception as e:
+            print(f"Error saving session summary: {e}")
+            return False
+    
+    @staticmethod
+    def _to_message(row: Dict[str, Any]) -> Dict[str, Any]:
+        """Convert a chat_messages row to the message shape used by the API."""
+        message = {
+            "id": row["message_id"],
+            "role": row["role"],
+            "content": row["content"]
+        }
+        if row.get("source"):
+            message["source"] = row["source"]
+        return message
+    
+    async def get_user_sessions(self, user_id: str = "anonymous", limit: Optional[int] = None, cursor: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Get session summaries for a user, most recently updated first.
+        
+        Titles and message counts come from the denormalized chat_sessions
+        columns, so this is a single indexed query regardless of history size.
         
         Args:
             user_id: User identifier
+            limit: Optional page size (all sessions when None)
+            cursor: next_cursor from a previous page
             
         Returns:
-            List of session metadata
+            Dict with "sessions" (list of session summaries) and "next_cursor"
+            (None when there are no more sessions)
+            
+        Raises:
+            ValueError: If the cursor is malformed
         """
+        params: Dict[str, Any] = {"user_id_filter": user_id}
+        if cursor:
+            params["before_updated_at"], params["before_session_id"] = decode_session_cursor(cursor)
+        
         try:
-            result = self.supabase.table("chat_sessions").select(
-                "session_id, created_at, updated_at"
-            ).eq("user_id", user_id).order("updated_at", desc=True).execute()
+            if limit is not None:
+                # Fetch one extra row to know whether another page exists
+                params["page_size"] = limit + 1
+            
+            result = await self.supabase.rpc("list_chat_sessions", params).execute()
+            sessions = result.data or []
             
-            return result.data or []
+            next_cursor = None
+            if limit is not None and len(sessions) > limit:
+                sessions = sessions[:limit]
+                last = sessions[-1]
+                next_cursor = encode_session_cursor(last["updated_at"], last["session_id"])
+            
+            return {"sessions": sessions, "next_cursor": next_cursor}
             
         except Exception as e:
             print(f"Error getting user sessions: {e}")
-            return []
+            return {"sessions": [], "next_cursor": None}
     
     async def delete_chat_session(self, session_id: str, user_id: str = "anonymous") -> bool:
         """
@@ -111,7 +332,7 @@ class DatabaseService:
             bool: True if successful, False otherwise
         """
         try:
-            result = self.supabase.table("chat_sessions").delete().eq(
+            result = await self.supabase.table("chat_sessions").delete().eq(
                 "session_id", session_id
             ).eq("user_id", user_id).execute()
             
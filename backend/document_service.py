@@ -6,138 +6,146 @@ Handles document storage, processing, and management operations.
 
 import os
 import uuid
-from typing import List, Dict, Any, Optional
-from supabase import Client
-from rag_service import RAGService
+import time
+import codecs
+import asyncio
+from typing import List, Dict, Any, Optional, Tuple, AsyncIterable, AsyncIterator
+from supabase import AsyncClient
+from rag_service import RAGService, ProgressCallback
+from chunking import iter_chunks
+from extraction import TextExtractor
+from metrics import INGESTION_STAGE_SECONDS
+
+# Bytes read from disk per step when streaming an uploaded file
+FILE_READ_SIZE = 256 * 1024
+
+# Rows fetched per request when reading a document's chunks (PostgREST's default max-rows)
+CHUNK_PAGE_SIZE = 1000
+
+
+async def iter_text_from_file(path: str, read_size: int = FILE_READ_SIZE) -> AsyncIterator[str]:
+    """
+    Decode a UTF-8 file incrementally, reading it off the event loop.
+    
+    Args:
+        path: File to read
+        read_size: Bytes read per step
+        
+    Yields:
+        Decoded text pieces; raises UnicodeDecodeError on invalid UTF-8
+    """
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    
+    def read() -> Tuple[str, bool]:
+        # Decode in the worker thread too, so large blocks don't stall the loop
+        block = f.read(read_size)
+        return decoder.decode(block, final=not block), not block
+    
+    f = await asyncio.to_thread(open, path, 'rb')
+    try:
+        done = False
+        while not done:
+            text, done = await asyncio.to_thread(read)
+            if text:
+                yield text
+    finally:
+        await asyncio.to_thread(f.close)
+
+
+async def timed_iteration(items: AsyncIterable[Any], totals: Dict[str, float], key: str) -> AsyncIterator[Any]:
+    """
+    Yield items from an async iterable, adding the time spent waiting for them to totals[key].
+    
+    Args:
+        items: Items to pass through
+        totals: Accumulated seconds per key
+        key: Key to accumulate into
+    """
+    iterator = items.__aiter__()
+    while True:
+        start = time.perf_counter()
+        try:
+            item = await iterator.__anext__()
+        except StopAsyncIteration:
+            return
+        finally:
+            totals[key] += time.perf_counter() - start
+        yield item
+
 
 class DocumentService:
-    def __init__(self, supabase_client: Client, rag_service: RAGService):
+    def __init__(
+        self,
+        supabase_client: AsyncClient,
+        rag_service: RAGService,
+        extractor: Optional[TextExtractor] = None
+    ):
         """Initialize document service."""
         self.supabase = supabase_client
         self.rag_service = rag_service
+        # Parses PDF and Word files in worker processes
+        self.extractor = extractor or TextExtractor.from_env()
     
-    def extract_text_from_content(self, content: bytes, mime_type: str) -> str:
+    async def upload_document_file(
+        self,
+        filename: str,
+        path: str,
+        mime_type: str,
+        user_id: str = "anonymous",
+        document_id: Optional[str] = None,
+        progress_callback: Optional[ProgressCallback] = None
+    ) -> Optional[Dict[str, Any]]:
         """
-        Extract text content from uploaded file.
+        Upload and process a document from a file on disk, streaming it.
         
-        Args:
-            content: File content as bytes
-            mime_type: MIME type of the file
-            
-        Returns:
-            Extracted text content
-        """
-        try:
-            print(f"Processing file with MIME type: {mime_type}")
-            print(f"Content length: {len(content)} bytes")
-            
-            # Handle text files
-            if mime_type and mime_type.startswith('text/'):
-                text = content.decode('utf-8')
-                print(f"Extracted text length: {len(text)} characters")
-                return text
-            
-            # Handle common document formats
-            elif mime_type == 'application/pdf':
-                # For now, return a placeholder - you can integrate PyPDF2 or similar
-                return "PDF content extraction not implemented yet. Please upload text files."
-            
-            elif mime_type in ['application/msword', 'application/vnd.openxmlformats-officedocument.wordprocessingml.document']:
-                return "Word document content extraction not implemented yet. Please upload text files."
-            
-            else:
-                # Try to decode as text anyway
-                try:
-                    text = content.decode('utf-8')
-                    print(f"Fallback text extraction successful, length: {len(text)} characters")
-                    return text
-                except UnicodeDecodeError as e:
-                    print(f"Unicode decode error: {e}")
-                    return f"Unsupported file type: {mime_type}. Please upload text files."
-                    
-        except Exception as e:
-            print(f"Error extracting text from content: {e}")
-            return f"Error processing file: {str(e)}"
-    
-    async def upload_document(self, filename: str, content: bytes, mime_type: str, user_id: str = "anonymous") -> Optional[Dict[str, Any]]:
-        """
-        Upload and process a document.
+        The file is read, decoded, chunked, embedded and inserted incrementally, so
+        peak memory is bounded regardless of file size. PDF and Word files are
+        parsed in worker processes; PDFs page by page, so chunking starts on the
+        first pages while later ones are still being parsed. The full text is not kept
+        in documents.content; get_document_content rebuilds it from the chunks.
         
         Args:
             filename: Name of the uploaded file
-            content: File content as bytes
+            path: Path of the uploaded file
             mime_type: MIME type of the file
             user_id: User ID who uploaded the document
+            document_id: Optional ID to create the document with
+            progress_callback: Optional coroutine called with (chunks embedded, chunks seen so far)
             
         Returns:
-            Document metadata if successful, None otherwise
+            Document metadata (with ingestion statistics under "ingestion") if
+            successful, None otherwise
         """
         try:
-            print(f"Starting upload for file: {filename}")
-            
-            # Extract text content
-            text_content = self.extract_text_from_content(content, mime_type)
+            print(f"Starting streaming upload for file: {filename}")
             
-            if not text_content or text_content.strip() == "":
-                print("No text content extracted from file")
-                return None
-            
-            # Check if text content contains error messages
-            if text_content.startswith("PDF content extraction not implemented") or \
-               text_content.startswith("Word document content extraction not implemented") or \
-               text_content.startswith("Unsupported file type") or \
-               text_content.startswith("Error processing file"):
-                print(f"Text extraction failed: {text_content}")
+            if self.extractor.supports(mime_type):
+                text = self.extractor.iter_text(path, mime_type)
+            elif self.can_stream_text(mime_type):
+                text = iter_text_from_file(path)
+            else:
+                print(f"Text extraction failed: unsupported file type {mime_type}")
                 return None
             
-            print(f"Text content extracted successfully, length: {len(text_content)}")
+            file_size = await asyncio.to_thread(os.path.getsize, path)
             
-            # Store document in database
-            document_data = {
-                "user_id": user_id,
-                "filename": filename,
-                "content": text_content,
-                "file_size": len(content),
-                "mime_type": mime_type
-            }
+            # Reading, decoding and chunking are interleaved; time waiting for
+            # text (extract) separately from waiting for chunks (which includes it)
+            totals = {"extract": 0.0, "chunk": 0.0}
+            chunks = timed_iteration(iter_chunks(
+                timed_iteration(text, totals, "extract"),
+                self.rag_service.chunk_max_tokens,
+                self.rag_service.chunk_overlap_tokens
+            ), totals, "chunk")
             
-            print("Inserting document into database...")
             try:
-                result = self.supabase.table("documents").insert(document_data).execute()
-                print(f"Database insert result: {result}")
-                
-                if not result.data:
-                    print("Failed to insert document into database - no data returned")
-                    return None
-            except Exception as db_error:
-                print(f"Database insertion error: {db_error}")
-                # Check if table exists
-                try:
-                    test_result = self.supabase.table("documents").select("*").limit(1).execute()
-                    print("Documents table exists and is accessible")
-                except Exception as table_error:
-                    print(f"Documents table may not exist: {table_error}")
-                return None
-            
-            document = result.data[0]
-            document_id = document["id"]
-            print(f"Document inserted with ID: {document_id}")
-            
-            # Generate and store embeddings
-            print("Generating embeddings...")
-            embedding_success = await self.rag_service.store_document_embeddings(
-                document_id, text_content
-            )
-            
-            if not embedding_success:
-                # If embedding fails, delete the document
-                print("Embedding generation failed, cleaning up...")
-                self.supabase.table("documents").delete().eq("id", document_id).execute()
-                print("Failed to generate embeddings, document deleted")
-                return None
-            
-            print("Document upload completed successfully")
-            return document
+                return await self._store_document(
+                    filename, chunks, file_size, mime_type, user_id,
+                    document_id, progress_callback
+                )
+            finally:
+                INGESTION_STAGE_SECONDS.observe(totals["extract"], stage="extract")
+                INGESTION_STAGE_SECONDS.observe(totals["chunk"] - totals["extract"], stage="chunk")
             
         except Exception as e:
             print(f"Error uploading document: {e}")
@@ -145,6 +153,85 @@ class DocumentService:
             traceback.print_exc()
             return None
     
+    def can_stream_text(self, mime_type: str) -> bool:
+        """Whether a file of this type is decoded as UTF-8 text (directly or as a fallback)."""
+        return mime_type not in (
+            'application/pdf',
+            'application/msword',
+            'application/vnd.openxmlformats-officedocument.wordprocessingml.document'
+        )
+    
+    async def _store_document(
+        self,
+        filename: str,
+        chunks: AsyncIterable[Dict[str, Any]],
+        file_size: int,
+        mime_type: str,
+        user_id: str,
+        document_id: Optional[str] = None,
+        progress_callback: Optional[ProgressCallback] = None
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Insert the document row, then embed and store its chunks.
+        
+        The full text is not stored; get_document_content rebuilds it from the
+        chunks. The document is deleted again if embedding fails.
+        
+        Returns:
+            Document metadata with ingestion statistics, or None on failure
+        """
+        # Store document in database
+        document_data = {
+            "user_id": user_id,
+            "filename": filename,
+            "content": None,
+            "file_size": file_size,
+            "mime_type": mime_type
+        }
+        if document_id:
+            document_data["id"] = document_id
+        
+        print("Inserting document into database...")
+        try:
+            result = await self.supabase.table("documents").insert(document_data).execute()
+            
+            if not result.data:
+                print("Failed to insert document into database - no data returned")
+                return None
+        except Exception as db_error:
+            print(f"Database insertion error: {db_error}")
+            # Check if table exists
+            try:
+                test_result = await self.supabase.table("documents").select("*").limit(1).execute()
+                print("Documents table exists and is accessible")
+            except Exception as table_error:
+                print(f"Documents table may not exist: {table_error}")
+            return None
+        
+        document = result.data[0]
+        document_id = document["id"]
+        print(f"Document inserted with ID: {document_id}")
+        
+        # Generate and store embeddings
+        print("Generating embeddings...")
+        ingestion_stats = await self.rag_service.store_chunk_stream(
+            document_id, chunks, progress_callback
+        )
+        
+        if ingestion_stats is None:
+            # If embedding fails, delete the document (chunks cascade)
+            print("Embedding generation failed, cleaning up...")
+            await self.supabase.table("documents").delete().eq("id", document_id).execute()
+            self.rag_service.corpus.invalidate(user_id)
+            print("Failed to generate embeddings, document deleted")
+            return None
+        
+        await self.rag_service.index_document(user_id, document_id)
+        await self.rag_service.corpus.refresh(user_id)
+        
+        print("Document upload completed successfully")
+        return {**document, "ingestion": ingestion_stats}
+    
     async def get_user_documents(self, user_id: str = "anonymous") -> List[Dict[str, Any]]:
         """
         Get all documents for a user.
@@ -156,7 +243,7 @@ class DocumentService:
             List of document metadata
         """
         try:
-            result = self.supabase.table("documents").select(
+            result = await self.supabase.table("documents").select(
                 "id, filename, file_size, mime_type, created_at, updated_at"
             ).eq("user_id", user_id).order("created_at", desc=True).execute()
             
@@ -179,11 +266,16 @@ class DocumentService:
         """
         try:
             # Delete document (chunks will be deleted automatically due to CASCADE)
-            result = self.supabase.table("documents").delete().eq(
+            result = await self.supabase.table("documents").delete().eq(
                 "id", document_id
             ).eq("user_id", user_id).execute()
             
-            return len(result.data) > 0
+            if not result.data:
+                return False
+            
+            self.rag_service.unindex_document(user_id, document_id)
+            await self.rag_service.corpus.refresh(user_id)
+            return True
             
         except Exception as e:
             print(f"Error deleting document: {e}")
@@ -201,14 +293,32 @@ class DocumentService:
             Document content if found, None otherwise
         """
         try:
-            result = self.supabase.table("documents").select("content").eq(
+            result = await self.supabase.table("documents").select("content").eq(
                 "id", document_id
             ).eq("user_id", user_id).execute()
             
-            if result.data:
+            if not result.data:
+                return None
+            
+            if result.data[0]["content"] is not None:
                 return result.data[0]["content"]
             
-            return None
+            # Streamed uploads don't keep the full text; rebuild it from the
+            # chunks, a page at a time so large documents aren't cut off
+            chunks: List[Dict[str, Any]] = []
+            while True:
+                chunks_result = await self.supabase.table("document_chunks").select(
+                    "content, start_char, end_char"
+                ).eq("document_id", document_id).order("chunk_index").range(
+                    len(chunks), len(chunks) + CHUNK_PAGE_SIZE - 1
+                ).execute()
+                
+                page = chunks_result.data or []
+                chunks.extend(page)
+                if len(page) < CHUNK_PAGE_SIZE:
+                    break
+            
+            return self.rag_service.reassemble_chunks(chunks)
             
         except Exception as e:
             print(f"Error getting document content: {e}")
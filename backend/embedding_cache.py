@@ -0,0 +1,172 @@
+"""
+Embedding Cache for Query Embeddings
+
+In-process LRU cache with TTL for Gemini embeddings, with an optional shared
+SQLite tier so restarts and multiple workers reuse warm entries.
+"""
+
+import os
+import re
+import time
+import sqlite3
+import asyncio
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, Optional, Tuple
+import numpy as np
+
+# (normalized text, task type, model, dimension)
+CacheKey = Tuple[str, str, str, int]
+
+
+def normalize_text(text: str) -> str:
+    """Normalize text for cache lookups: trim, collapse whitespace and lowercase."""
+    return re.sub(r"\s+", " ", text).strip().lower()
+
+
+def make_cache_key(text: str, task_type: str, model: str, dimension: int) -> CacheKey:
+    """Build the cache key for an embedding request."""
+    return (normalize_text(text), task_type, model, dimension)
+
+
+class EmbeddingCache:
+    def __init__(self, max_size: int = 1024, ttl_seconds: float = 86400, db_path: Optional[str] = None):
+        """
+        Initialize the embedding cache.
+
+        Args:
+            max_size: Maximum number of entries kept in memory (least recently used are evicted)
+            ttl_seconds: Entry lifetime in seconds
+            db_path: Optional SQLite file shared across restarts and workers
+        """
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[CacheKey, Tuple[float, np.ndarray]]" = OrderedDict()
+
+        self.hits = 0
+        self.misses = 0
+        self.disk_hits = 0
+        self.evictions = 0
+
+        self._db: Optional[sqlite3.Connection] = None
+        self._db_lock = threading.Lock()
+        if db_path:
+            self._db = sqlite3.connect(db_path, check_same_thread=False, timeout=5)
+            with self._db_lock:
+                # WAL lets several worker processes read while one writes
+                self._db.execute("PRAGMA journal_mode=WAL")
+                self._db.execute(
+                    "CREATE TABLE IF NOT EXISTS embeddings ("
+                    "key TEXT PRIMARY KEY, created_at REAL NOT NULL, vector BLOB NOT NULL)"
+                )
+                self._db.commit()
+
+    @classmethod
+    def from_env(cls, prefix: str = "EMBEDDING_CACHE") -> "EmbeddingCache":
+        """Create a cache configured from <prefix>_SIZE, <prefix>_TTL and <prefix>_PATH."""
+        return cls(
+            max_size=int(os.getenv(f"{prefix}_SIZE", 1024)),
+            ttl_seconds=float(os.getenv(f"{prefix}_TTL", 86400)),
+            db_path=os.getenv(f"{prefix}_PATH") or None
+        )
+
+    async def get(self, key: CacheKey) -> Optional[np.ndarray]:
+        """
+        Look up an embedding, checking memory first and then the disk tier.
+
+        Args:
+            key: Cache key from make_cache_key
+
+        Returns:
+            The cached embedding or None
+        """
+        now = time.time()
+        entry = self._entries.get(key)
+        if entry is not None:
+            created_at, vector = entry
+            if now - created_at < self.ttl_seconds:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return vector
+            del self._entries[key]
+
+        if self._db is not None:
+            row = await asyncio.to_thread(self._disk_get, key)
+            if row is not None and now - row[0] < self.ttl_seconds:
+                vector = np.frombuffer(row[1], dtype=np.float32)
+                self._remember(key, vector, row[0])
+                self.hits += 1
+                self.disk_hits += 1
+                return vector
+
+        self.misses += 1
+        return None
+
+    async def set(self, key: CacheKey, vector: np.ndarray) -> None:
+        """
+        Store an embedding in memory and, when configured, on disk.
+
+        Args:
+            key: Cache key from make_cache_key
+            vector: Embedding vector
+        """
+        vector = np.array(vector, dtype=np.float32)
+        created_at = time.time()
+        self._remember(key, vector, created_at)
+
+        if self._db is not None:
+            try:
+                await asyncio.to_thread(self._disk_set, key, created_at, vector)
+            except sqlite3.Error as e:
+                print(f"Error writing embedding cache: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        """Return cache counters."""
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "disk_hits": self.disk_hits,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0
+        }
+
+    def clear(self) -> None:
+        """Drop all in-memory entries."""
+        self._entries.clear()
+
+    def _remember(self, key: CacheKey, vector: np.ndarray, created_at: float) -> None:
+        """Insert into the in-memory LRU, evicting the oldest entries when full."""
+        # Cached arrays are shared between callers, so make them read-only
+        vector.setflags(write=False)
+        self._entries[key] = (created_at, vector)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    @staticmethod
+    def _disk_key(key: CacheKey) -> str:
+        return hashlib.sha256("\x1f".join(str(part) for part in key).encode("utf-8")).hexdigest()
+
+    def _disk_get(self, key: CacheKey) -> Optional[Tuple[float, bytes]]:
+        with self._db_lock:
+            try:
+                return self._db.execute(
+                    "SELECT created_at, vector FROM embeddings WHERE key = ?",
+                    (self._disk_key(key),)
+                ).fetchone()
+            except sqlite3.Error as e:
+                print(f"Error reading embedding cache: {e}")
+                return None
+
+    def _disk_set(self, key: CacheKey, created_at: float, vector: np.ndarray) -> None:
+        with self._db_lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO embeddings (key, created_at, vector) VALUES (?, ?, ?)",
+                (self._disk_key(key), created_at, vector.tobytes())
+            )
+            self._db.commit()
@@ -0,0 +1,226 @@
+"""
+PDF and Word Text Extraction in Worker Processes
+
+Parsing PDF and DOCX files is CPU-heavy pure Python, so it runs in worker
+processes: it never blocks the event loop or holds the GIL while requests are
+served. PDFs are extracted a batch of pages at a time, and the next batch is
+parsed while the current one is chunked and embedded, so ingestion starts on
+the first pages without waiting for the whole file. Each file is parsed by a
+worker of its own and has a limit on its total parsing time; a parse that
+overruns it is killed with its worker, without touching other files' parses.
+"""
+
+import os
+import asyncio
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import List, Optional, Set, Tuple, AsyncIterator, Callable, Any
+
+import docx
+import pypdf
+
+PDF_MIME_TYPE = "application/pdf"
+DOCX_MIME_TYPE = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+
+# Separates pages and paragraphs in extracted text, so the chunker treats
+# them as paragraph boundaries
+PARAGRAPH_BREAK = "\n\n"
+
+
+class ExtractionError(Exception):
+    """Text could not be extracted from a document."""
+
+
+# Functions below run in worker processes
+
+
+def extract_pdf_pages(path: str, start: int, count: int) -> Tuple[List[str], int]:
+    """
+    Extract the text of pages [start, start + count) of a PDF.
+
+    Returns:
+        (page texts, total page count)
+    """
+    reader = pypdf.PdfReader(path)
+    total = len(reader.pages)
+    pages = [
+        (reader.pages[index].extract_text() or "").strip()
+        for index in range(start, min(start + count, total))
+    ]
+    return pages, total
+
+
+def extract_docx_paragraphs(path: str) -> List[str]:
+    """Extract the non-empty paragraphs of a Word document, followed by its table cells."""
+    document = docx.Document(path)
+    paragraphs = [paragraph.text.strip() for paragraph in document.paragraphs]
+    for table in document.tables:
+        for row in table.rows:
+            paragraphs.append(" | ".join(cell.text.strip() for cell in row.cells))
+    return [paragraph for paragraph in paragraphs if paragraph]
+
+
+class TextExtractor:
+    def __init__(self, max_workers: int = 2, timeout_seconds: float = 120, pages_per_task: int = 8):
+        """
+        Initialize the extractor.
+
+        Args:
+            max_workers: Files parsed at once (one worker process each)
+            timeout_seconds: Limit on the time spent parsing one file (time the
+                caller spends on the extracted text doesn't count)
+            pages_per_task: PDF pages extracted per worker call (smaller batches
+                start ingestion sooner, larger ones reopen the file less often)
+        """
+        self.max_workers = max_workers
+        self.timeout_seconds = timeout_seconds
+        self.pages_per_task = max(1, pages_per_task)
+
+        # Workers are started on first use and kept between files; a file
+        # waits here while max_workers others are being parsed
+        self._slots = asyncio.Semaphore(max_workers)
+        self._idle: List[_Worker] = []
+        self._workers: Set[_Worker] = set()
+
+        # Files whose extraction was stopped at the time limit
+        self.timeouts = 0
+
+    @classmethod
+    def from_env(cls) -> "TextExtractor":
+        """Create an extractor configured from EXTRACTION_* environment variables."""
+        return cls(
+            max_workers=int(os.getenv("EXTRACTION_WORKERS", 2)),
+            timeout_seconds=float(os.getenv("EXTRACTION_TIMEOUT", 120)),
+            pages_per_task=int(os.getenv("EXTRACTION_PAGES_PER_TASK", 8))
+        )
+
+    def supports(self, mime_type: str) -> bool:
+        """Whether files of this type are extracted here."""
+        return mime_type in (PDF_MIME_TYPE, DOCX_MIME_TYPE)
+
+    async def iter_text(self, path: str, mime_type: str) -> AsyncIterator[str]:
+        """
+        Extract a document on disk incrementally.
+
+        Args:
+            path: File to read
+            mime_type: PDF_MIME_TYPE or DOCX_MIME_TYPE
+
+        Yields:
+            Text pieces (pages or paragraphs, each followed by a paragraph break)
+
+        Raises:
+            ExtractionError: If the file can't be parsed or extraction times out
+        """
+        if not self.supports(mime_type):
+            raise ExtractionError(f"Unsupported file type {mime_type}")
+
+        async with self._slots:
+            worker = self._idle.pop() if self._idle else self._start_worker()
+            # Only time spent parsing counts against the limit, not time the
+            # caller spends consuming the pieces
+            worker.parse_budget = self.timeout_seconds
+            try:
+                async for piece in self._iter_text(worker, path, mime_type):
+                    yield piece
+            finally:
+                if worker.alive:
+                    self._idle.append(worker)
+
+    def shutdown(self) -> None:
+        """Stop the worker processes."""
+        for worker in list(self._workers):
+            self._stop_worker(worker)
+        self._idle.clear()
+
+    async def _iter_text(self, worker: "_Worker", path: str, mime_type: str) -> AsyncIterator[str]:
+        """Extract one file on its checked-out worker."""
+        if mime_type == DOCX_MIME_TYPE:
+            # Word documents are parsed whole
+            for paragraph in await self._run(worker, extract_docx_paragraphs, path):
+                yield paragraph + PARAGRAPH_BREAK
+            return
+
+        pages, total = await self._run(worker, extract_pdf_pages, path, 0, self.pages_per_task)
+        start = 0
+        pending: Optional[asyncio.Future] = None
+        try:
+            while True:
+                # Parse the next batch while this one is consumed
+                start += self.pages_per_task
+                pending = None
+                if start < total:
+                    pending = asyncio.ensure_future(
+                        self._run(worker, extract_pdf_pages, path, start, self.pages_per_task)
+                    )
+
+                for page in pages:
+                    if page:
+                        yield page + PARAGRAPH_BREAK
+
+                if pending is None:
+                    return
+                pages, _ = await pending
+        finally:
+            if pending is not None and not pending.done():
+                pending.cancel()
+                # The batch keeps running in the worker otherwise, delaying the next file
+                self._stop_worker(worker)
+
+    async def _run(self, worker: "_Worker", function: Callable[..., Any], *args: Any) -> Any:
+        """Run a parse function on a file's worker, within what is left of the file's parse time."""
+        loop = asyncio.get_running_loop()
+        # Calls for one file run one at a time on its own worker, so the time
+        # from submission to result is time spent parsing
+        start = loop.time()
+        try:
+            return await asyncio.wait_for(
+                loop.run_in_executor(worker.executor, function, *args),
+                max(0.0, worker.parse_budget)
+            )
+        except asyncio.TimeoutError:
+            # A running call can't be cancelled; only this file's worker is stopped
+            self.timeouts += 1
+            self._stop_worker(worker)
+            raise ExtractionError(f"Text extraction timed out after {self.timeout_seconds:g}s")
+        except BrokenProcessPool:
+            self._stop_worker(worker)
+            raise ExtractionError("Text extraction worker crashed")
+        except Exception as e:
+            raise ExtractionError(f"Could not extract text: {e}") from e
+        finally:
+            worker.parse_budget -= loop.time() - start
+
+    def _start_worker(self) -> "_Worker":
+        worker = _Worker()
+        self._workers.add(worker)
+        return worker
+
+    def _stop_worker(self, worker: "_Worker") -> None:
+        worker.stop()
+        self._workers.discard(worker)
+        if worker in self._idle:
+            self._idle.remove(worker)
+
+
+class _Worker:
+    """A single worker process, parsing one file at a time."""
+
+    def __init__(self):
+        # Spawned (not forked) so the process doesn't inherit the event loop,
+        # threads or open connections of the server
+        self.executor = ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn"))
+        self.alive = True
+        # Parse time left for the file being extracted, in seconds
+        self.parse_budget = 0.0
+
+    def stop(self) -> None:
+        """Kill the process, interrupting any parse in progress."""
+        if not self.alive:
+            return
+        self.alive = False
+        # The executor has no public way to stop a running call
+        for process in list((getattr(self.executor, "_processes", None) or {}).values()):
+            process.terminate()
+        self.executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,365 @@
+"""
+Background Ingestion Queue for Document Uploads
+
+Runs the document processing pipeline (extraction, chunking, embedding, storage)
+in worker tasks so uploads return immediately with a job id. Job state is kept in
+the ingestion_jobs table and uploaded files are spooled to disk, so interrupted
+jobs are picked up again when the server restarts.
+
+Each job is leased by the server process that owns it, which renews the lease
+while the job is queued or running. Processes sharing a spool directory only
+take over jobs whose lease has expired, so a restarting process never steals
+work another live process is still doing.
+"""
+
+import os
+import uuid
+import socket
+import asyncio
+import tempfile
+from datetime import datetime, timedelta, timezone
+from typing import List, Dict, Any, Optional, Set, AsyncIterable
+from supabase import AsyncClient
+from document_service import DocumentService
+from metrics import IN_FLIGHT
+
+# Job statuses
+QUEUED = "queued"
+PROCESSING = "processing"
+COMPLETED = "completed"
+FAILED = "failed"
+
+# Document fields copied onto a completed job (everything except the full text)
+DOCUMENT_FIELDS = ("id", "filename", "file_size", "mime_type", "created_at", "updated_at")
+
+JOB_COLUMNS = (
+    "id, user_id, filename, mime_type, file_size, status, chunks_total, chunks_embedded, "
+    "document_id, document, ingestion, error, attempts, claimed_by, heartbeat_at, created_at, updated_at"
+)
+
+
+class IngestionQueue:
+    def __init__(
+        self,
+        supabase_client: AsyncClient,
+        document_service: DocumentService,
+        max_queue_size: int = 16,
+        workers: int = 2,
+        max_attempts: int = 3,
+        spool_dir: Optional[str] = None,
+        lease_seconds: float = 60
+    ):
+        """
+        Initialize the ingestion queue.
+
+        Args:
+            supabase_client: Async Supabase client used for job state
+            document_service: Service running the upload pipeline
+            max_queue_size: Maximum number of waiting jobs before uploads are rejected
+            workers: Number of concurrent worker tasks
+            max_attempts: Attempts (including resumes after restarts) before a job is failed
+            spool_dir: Directory holding uploaded files until their job finishes
+            lease_seconds: How long a job stays claimed by this process without a
+                renewal; other processes resume jobs whose lease has expired
+        """
+        self.supabase = supabase_client
+        self.document_service = document_service
+        self.max_attempts = max_attempts
+        self.worker_count = workers
+        self.spool_dir = spool_dir or os.path.join(tempfile.gettempdir(), "synapsechat_ingestion")
+        os.makedirs(self.spool_dir, exist_ok=True)
+        self.lease_seconds = lease_seconds
+
+        # Identifies this process in claimed_by
+        self.instance_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        # Jobs this process has queued or is running, whose leases it renews
+        self._owned: Set[str] = set()
+
+        self.queue: "asyncio.Queue[Dict[str, Any]]" = asyncio.Queue(maxsize=max_queue_size)
+        self._tasks: List[asyncio.Task] = []
+
+    @classmethod
+    def from_env(cls, supabase_client: AsyncClient, document_service: DocumentService) -> "IngestionQueue":
+        """Create a queue configured from INGESTION_* environment variables."""
+        return cls(
+            supabase_client,
+            document_service,
+            max_queue_size=int(os.getenv("INGESTION_QUEUE_SIZE", 16)),
+            workers=int(os.getenv("INGESTION_WORKERS", 2)),
+            max_attempts=int(os.getenv("INGESTION_MAX_ATTEMPTS", 3)),
+            spool_dir=os.getenv("INGESTION_SPOOL_DIR") or None,
+            lease_seconds=float(os.getenv("INGESTION_LEASE_SECONDS", 60))
+        )
+
+    async def start(self) -> None:
+        """Start worker tasks, renew this process's leases and take over jobs whose lease expired."""
+        for i in range(self.worker_count):
+            self._tasks.append(asyncio.create_task(self._worker(i)))
+        self._tasks.append(asyncio.create_task(self._renew_leases()))
+        self._tasks.append(asyncio.create_task(self._watch_expired_leases()))
+
+    async def stop(self) -> None:
+        """Cancel worker tasks; unfinished jobs stay in the table and resume on next start."""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks.clear()
+
+    def spool_path(self, job_id: str) -> str:
+        """Path of the spooled upload for a job."""
+        return os.path.join(self.spool_dir, f"{job_id}.upload")
+
+    async def submit(
+        self,
+        filename: str,
+        blocks: AsyncIterable[bytes],
+        mime_type: str,
+        user_id: str = "anonymous"
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Queue a document for background processing.
+
+        Args:
+            filename: Name of the uploaded file
+            blocks: File content as a stream of byte blocks, spooled to disk as it arrives
+            mime_type: MIME type of the file
+            user_id: User ID who uploaded the document
+
+        Returns:
+            The created job, or None if the queue is full or the job could not be created
+        """
+        # Backpressure: reject instead of accepting work we cannot start soon
+        if self.queue.full():
+            return None
+
+        job_id = str(uuid.uuid4())
+        path = self.spool_path(job_id)
+
+        try:
+            file_size = await _spool_blocks(path, blocks)
+
+            result = await self.supabase.table("ingestion_jobs").insert({
+                "id": job_id,
+                "user_id": user_id,
+                "filename": filename,
+                "mime_type": mime_type,
+                "file_size": file_size,
+                "status": QUEUED,
+                # Reserve the document id so a resumed job can remove partial output
+                "document_id": str(uuid.uuid4()),
+                "attempts": 1,
+                "claimed_by": self.instance_id,
+                "heartbeat_at": _now()
+            }).execute()
+
+            if not result.data:
+                print("Failed to create ingestion job - no data returned")
+                _remove_file(path)
+                return None
+
+            job = result.data[0]
+            self.queue.put_nowait(job)
+            self._owned.add(job_id)
+            return job
+
+        except asyncio.QueueFull:
+            await self._update_job(job_id, {"status": FAILED, "error": "Ingestion queue is full"})
+            _remove_file(path)
+            return None
+        except Exception as e:
+            print(f"Error creating ingestion job: {e}")
+            _remove_file(path)
+            return None
+
+    async def get_job(self, job_id: str, user_id: str = "anonymous") -> Optional[Dict[str, Any]]:
+        """
+        Get the current state of a job.
+
+        Args:
+            job_id: ID of the job
+            user_id: User ID for security check
+
+        Returns:
+            Job record if found, None otherwise
+        """
+        try:
+            result = await self.supabase.table("ingestion_jobs").select(JOB_COLUMNS).eq(
+                "id", job_id
+            ).eq("user_id", user_id).execute()
+
+            if result.data:
+                return result.data[0]
+
+            return None
+
+        except Exception as e:
+            print(f"Error getting ingestion job: {e}")
+            return None
+
+    async def _worker(self, worker_index: int) -> None:
+        """Process jobs from the queue until cancelled."""
+        while True:
+            job = await self.queue.get()
+            try:
+                with IN_FLIGHT.track_in_progress(kind="ingestion_job"):
+                    await self._process(job)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Ingestion worker {worker_index} failed on job {job['id']}: {e}")
+                await self._update_job(job["id"], {"status": FAILED, "error": str(e)})
+            finally:
+                self._owned.discard(job["id"])
+                self.queue.task_done()
+
+    async def _process(self, job: Dict[str, Any]) -> None:
+        """Run the upload pipeline for one job and record the outcome."""
+        job_id = job["id"]
+        path = self.spool_path(job_id)
+
+        if not os.path.exists(path):
+            await self._update_job(job_id, {"status": FAILED, "error": "Uploaded file is no longer available"})
+            return
+
+        # Shutdown cancels the job; its upload is kept so the job resumes on the next start
+        cancelled = False
+        try:
+            await self._update_job(job_id, {"status": PROCESSING, "error": None})
+
+            # A previous attempt may have stored the document before being
+            # interrupted; delete it through the service so search forgets it too
+            await self.document_service.delete_document(job["document_id"], job["user_id"])
+
+            async def report_progress(embedded: int, total: int) -> None:
+                await self._update_job(job_id, {"chunks_embedded": embedded, "chunks_total": total})
+
+            # The file is streamed from the spool, never held in memory whole
+            document = await self.document_service.upload_document_file(
+                filename=job["filename"],
+                path=path,
+                mime_type=job["mime_type"],
+                user_id=job["user_id"],
+                document_id=job["document_id"],
+                progress_callback=report_progress
+            )
+
+            if document:
+                await self._update_job(job_id, {
+                    "status": COMPLETED,
+                    "document": {field: document.get(field) for field in DOCUMENT_FIELDS},
+                    "ingestion": document.get("ingestion")
+                })
+            else:
+                await self._update_job(job_id, {
+                    "status": FAILED,
+                    "error": "Failed to process document. Please ensure it's a text, PDF or .docx file."
+                })
+        except asyncio.CancelledError:
+            cancelled = True
+            raise
+        finally:
+            # Errors are recorded by the worker; a failed job is not retried
+            if not cancelled:
+                _remove_file(path)
+
+    async def _renew_leases(self) -> None:
+        """Keep the leases of this process's jobs from expiring, until cancelled."""
+        while True:
+            await asyncio.sleep(self.lease_seconds / 3)
+            if not self._owned:
+                continue
+            try:
+                await self.supabase.table("ingestion_jobs").update({"heartbeat_at": _now()}).in_(
+                    "id", list(self._owned)
+                ).eq("claimed_by", self.instance_id).execute()
+            except Exception as e:
+                print(f"Error renewing ingestion job leases: {e}")
+
+    async def _watch_expired_leases(self) -> None:
+        """Resume interrupted jobs at startup, then whenever another process's lease runs out."""
+        while True:
+            await self._resume_interrupted_jobs()
+            await asyncio.sleep(self.lease_seconds)
+
+    async def _resume_interrupted_jobs(self) -> None:
+        """Re-enqueue unfinished jobs of this host whose lease has expired."""
+        expired_before = _now(-self.lease_seconds)
+        try:
+            result = await self.supabase.table("ingestion_jobs").select(JOB_COLUMNS).in_(
+                "status", [QUEUED, PROCESSING]
+            ).order("created_at").execute()
+        except Exception as e:
+            print(f"Error loading interrupted ingestion jobs: {e}")
+            return
+
+        for job in result.data or []:
+            # Only this host has the spooled file
+            if job["id"] in self._owned or not os.path.exists(self.spool_path(job["id"])):
+                continue
+
+            # A live process is still queuing or running the job
+            if job.get("heartbeat_at") and _parse_time(job["heartbeat_at"]) >= _parse_time(expired_before):
+                continue
+
+            if job["attempts"] >= self.max_attempts:
+                await self._update_job(job["id"], {"status": FAILED, "error": "Too many interrupted attempts"})
+                _remove_file(self.spool_path(job["id"]))
+                continue
+
+            # Claim the job by bumping its attempt count; with several processes
+            # sharing a spool directory only one update matches, and none does
+            # if the owner renewed its lease in the meantime
+            claim_query = self.supabase.table("ingestion_jobs").update({
+                "attempts": job["attempts"] + 1,
+                "status": QUEUED,
+                "claimed_by": self.instance_id,
+                "heartbeat_at": _now()
+            }).eq("id", job["id"]).eq("attempts", job["attempts"])
+            if job.get("heartbeat_at"):
+                claim_query = claim_query.lt("heartbeat_at", expired_before)
+            try:
+                claim = await claim_query.execute()
+            except Exception as e:
+                print(f"Error claiming ingestion job {job['id']}: {e}")
+                continue
+
+            if claim.data:
+                print(f"Resuming interrupted ingestion job {job['id']}")
+                self._owned.add(job["id"])
+                await self.queue.put(claim.data[0])
+
+    async def _update_job(self, job_id: str, fields: Dict[str, Any]) -> None:
+        """Persist job fields, logging rather than raising on failure."""
+        try:
+            await self.supabase.table("ingestion_jobs").update(fields).eq("id", job_id).execute()
+        except Exception as e:
+            print(f"Error updating ingestion job {job_id}: {e}")
+
+
+async def _spool_blocks(path: str, blocks: AsyncIterable[bytes]) -> int:
+    """Write byte blocks to a file off the event loop, returning the number of bytes written."""
+    size = 0
+    f = await asyncio.to_thread(open, path, "wb")
+    try:
+        async for block in blocks:
+            await asyncio.to_thread(f.write, block)
+            size += len(block)
+    finally:
+        await asyncio.to_thread(f.close)
+    return size
+
+
+def _now(offset_seconds: float = 0) -> str:
+    """Current UTC time (shifted by offset_seconds) as an ISO 8601 timestamp."""
+    return (datetime.now(timezone.utc) + timedelta(seconds=offset_seconds)).isoformat()
+
+
+def _parse_time(value: str) -> datetime:
+    return datetime.fromisoformat(value.replace("Z", "+00:00"))
+
+
+def _remove_file(path: str) -> None:
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
@@ -5,10 +5,15 @@ This server provides AI-powered neurosurgery assistance using Google ADK.
 """
 
 import os
+import json
+import asyncio
+import time
 import uuid
-from typing import Dict, Any, List
+from contextlib import asynccontextmanager
+from typing import Dict, Any, List, Optional
 from fastapi import FastAPI, HTTPException, UploadFile, File, Form
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse, PlainTextResponse
 from pydantic import BaseModel
 from dotenv import load_dotenv
 import uvicorn
@@ -17,21 +22,108 @@ import uvicorn
 load_dotenv()
 
 # Import the neurosurgery agent and database service
-from neurosurgery_agent.agent import query_neurosurgery_agent
+from neurosurgery_agent.agent import query_neurosurgery_agent, stream_neurosurgery_agent, get_agent_runtime
 from database import db_service
-from rag_service import RAGService
 from document_service import DocumentService
+from ingestion_jobs import IngestionQueue
+from extraction import PDF_MIME_TYPE, DOCX_MIME_TYPE
+from metrics import registry, CHAT_STAGE_SECONDS, CHAT_REQUESTS, IN_FLIGHT
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Run ingestion workers while the app is up; release pooled connections on shutdown."""
+    await ingestion_queue.start()
+    yield
+    await ingestion_queue.stop()
+    await wait_for_chat_saves()
+    if get_agent_runtime().memory is not None:
+        await get_agent_runtime().memory.drain()
+    document_service.extractor.shutdown()
+    await db_service.close()
+
 
 # Initialize FastAPI app
 app = FastAPI(
     title="Neurosurgery AI Backend",
     description="FastAPI backend for neurosurgery AI chat using Google ADK with RAG",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
-# Initialize RAG and document services
-rag_service = RAGService(db_service.supabase)
+# Share one RAG service (and Gemini client) with the agent runtime
+rag_service = get_agent_runtime().rag_service
 document_service = DocumentService(db_service.supabase, rag_service)
+ingestion_queue = IngestionQueue.from_env(db_service.supabase, document_service)
+
+# Bytes read from an uploaded file per step while spooling it to disk
+UPLOAD_READ_SIZE = int(os.getenv("UPLOAD_READ_SIZE", 1024 * 1024))
+
+# Types of uploads whose browser sent no specific MIME type, by file extension
+EXTENSION_MIME_TYPES = {".pdf": PDF_MIME_TYPE, ".docx": DOCX_MIME_TYPE}
+
+# Latest write-behind save of a completed chat turn, by session, and the user
+# each of those sessions belongs to
+pending_chat_saves: Dict[str, asyncio.Task] = {}
+pending_chat_save_users: Dict[str, str] = {}
+
+
+def component_cache_stats() -> Dict[str, Dict[str, Any]]:
+    """Counters of the in-process caches, by cache name."""
+    return {
+        "answer": get_agent_runtime().answer_cache.stats(),
+        "query_embedding": rag_service.query_embedding_cache.stats()
+    }
+
+
+# Values the components already track, read when /metrics is scraped
+registry.gauge(
+    "neurosurgery_cache_hit_ratio", "Hit ratio of in-process caches", ["cache"],
+    lambda: {(name,): stats["hit_rate"] for name, stats in component_cache_stats().items()}
+)
+registry.counter(
+    "neurosurgery_cache_hits_total", "Hits of in-process caches", ["cache"],
+    lambda: {(name,): stats["hits"] for name, stats in component_cache_stats().items()}
+)
+registry.counter(
+    "neurosurgery_cache_misses_total", "Misses of in-process caches", ["cache"],
+    lambda: {(name,): stats["misses"] for name, stats in component_cache_stats().items()}
+)
+registry.gauge(
+    "neurosurgery_cache_entries", "Entries held by in-process caches", ["cache"],
+    lambda: {(name,): stats["size"] for name, stats in component_cache_stats().items()}
+)
+registry.counter(
+    "neurosurgery_retrieval_routes_total", "Questions by retrieval route", ["route"],
+    lambda: {(route,): count for route, count in get_agent_runtime().router.stats()["routes"].items()}
+)
+registry.counter(
+    "neurosurgery_retrieval_skipped_seconds_total", "Estimated retrieval time saved by routing",
+    function=lambda: get_agent_runtime().router.stats()["estimated_saved_ms"] / 1000
+)
+registry.counter(
+    "neurosurgery_single_flight_calls_total", "Calls started by single-flight groups", ["flight"],
+    lambda: {(flight.name,): flight.calls for flight in (rag_service.embedding_flights, rag_service.retrieval_flights)}
+)
+registry.counter(
+    "neurosurgery_single_flight_coalesced_total", "Calls saved by joining an identical call in flight", ["flight"],
+    lambda: {(flight.name,): flight.coalesced for flight in (rag_service.embedding_flights, rag_service.retrieval_flights)}
+)
+registry.gauge(
+    "neurosurgery_ingestion_queue_depth", "Ingestion jobs waiting for a worker",
+    function=lambda: ingestion_queue.queue.qsize()
+)
+registry.counter(
+    "neurosurgery_extraction_timeouts_total", "Uploads whose text extraction hit the time limit",
+    function=lambda: document_service.extractor.timeouts
+)
+registry.gauge(
+    "neurosurgery_pending_chat_saves", "Sessions with a chat turn save in progress",
+    function=lambda: len(pending_chat_saves)
+)
+registry.gauge(
+    "neurosurgery_vector_index_chunks", "Chunks loaded in the local vector index",
+    function=lambda: rag_service.vector_index.stats()["chunks"] if rag_service.vector_index else None
+)
 
 # Configure CORS for Next.js frontend
 app.add_middleware(
@@ -58,11 +150,13 @@ class ChatResponse(BaseModel):
     answer: str
     source: str = None
     session_id: str
+    routing: Optional[Dict[str, Any]] = None
 
 
 class ChatHistoryResponse(BaseModel):
     messages: List[Dict[str, Any]]
     session_id: str
+    next_cursor: Optional[int] = None
 
 
 class SessionSummary(BaseModel):
@@ -75,6 +169,7 @@ class SessionSummary(BaseModel):
 
 class UserSessionsResponse(BaseModel):
     sessions: List[SessionSummary]
+    next_cursor: Optional[str] = None
 
 
 class DocumentResponse(BaseModel):
@@ -90,10 +185,33 @@ class DocumentListResponse(BaseModel):
     documents: List[DocumentResponse]
 
 
+class IngestionStats(BaseModel):
+    chunks: int
+    embedded_chunks: int
+    cached_chunks: int
+    cache_hit_rate: float
+
+
+class IngestionJobResponse(BaseModel):
+    id: str
+    status: str
+    filename: str
+    file_size: int
+    chunks_total: Optional[int] = None
+    chunks_embedded: int = 0
+    document: Optional[DocumentResponse] = None
+    ingestion: Optional[IngestionStats] = None
+    error: Optional[str] = None
+    created_at: str
+    updated_at: str
+
+
 class UploadResponse(BaseModel):
     success: bool
     message: str
     document: DocumentResponse = None
+    ingestion: Optional[IngestionStats] = None
+    job: Optional[IngestionJobResponse] = None
 
 
 # Health check endpoint
@@ -107,6 +225,124 @@ async def health_check():
     }
 
 
+async def save_chat_turn(session_id: str, query: str, result: Dict[str, Any], user_id: str = "anonymous") -> bool:
+    """
+    Append a user question and the agent's answer to the stored chat history.
+    
+    Args:
+        session_id: The chat session to update
+        query: The user's question
+        result: Agent result containing the answer and source
+        user_id: User the session belongs to
+        
+    Returns:
+        True if the messages were saved
+    """
+    # Create user message
+    user_message = {
+        "id": str(uuid.uuid4()),
+        "role": "user",
+        "content": query
+    }
+    
+    # Create assistant message
+    assistant_message = {
+        "id": str(uuid.uuid4()),
+        "role": "assistant",
+        "content": result["answer"],
+        "source": result.get("source", "Neurosurgery AI Agent")
+    }
+    
+    # Append only the new turn; earlier history is never rewritten
+    return await db_service.append_chat_messages(session_id, [user_message, assistant_message], user_id)
+
+
+def save_chat_turn_behind(session_id: str, query: str, result: Dict[str, Any], user_id: str = "anonymous") -> asyncio.Task:
+    """
+    Save a chat turn in the background so the response does not wait for it.
+    
+    Saves for the same session run one after another, in the order they were
+    scheduled, so turns are never stored out of order.
+    
+    Args:
+        session_id: The chat session to update
+        query: The user's question
+        result: Agent result containing the answer and source
+        user_id: User the session belongs to
+        
+    Returns:
+        Task resolving to True if the messages were saved
+    """
+    previous = pending_chat_saves.get(session_id)
+    
+    async def save() -> bool:
+        if previous is not None:
+            await asyncio.wait([previous])
+        try:
+            with CHAT_STAGE_SECONDS.time(stage="history_save"):
+                saved = await save_chat_turn(session_id, query, result, user_id)
+        except Exception as e:
+            print(f"Error saving chat turn for session {session_id}: {e}")
+            return False
+        
+        # Fold turns that left the conversation window into the session summary
+        memory = get_agent_runtime().memory
+        if saved and memory is not None:
+            memory.schedule_update(session_id)
+        return saved
+    
+    task = asyncio.create_task(save())
+    pending_chat_saves[session_id] = task
+    pending_chat_save_users[session_id] = user_id
+    
+    def forget(done: asyncio.Task) -> None:
+        if pending_chat_saves.get(session_id) is done:
+            del pending_chat_saves[session_id]
+            del pending_chat_save_users[session_id]
+    
+    task.add_done_callback(forget)
+    return task
+
+
+async def wait_for_chat_saves(session_id: Optional[str] = None, user_id: Optional[str] = None) -> None:
+    """
+    Wait for pending write-behind saves, so reads see every completed turn.
+    
+    Args:
+        session_id: Only wait for this session's saves (all sessions if None)
+        user_id: Only wait for saves to this user's sessions (all users if None)
+    """
+    if session_id is None:
+        tasks = [
+            task for pending_session_id, task in pending_chat_saves.items()
+            if user_id is None or pending_chat_save_users[pending_session_id] == user_id
+        ]
+    else:
+        tasks = [pending_chat_saves[session_id]] if session_id in pending_chat_saves else []
+    
+    if tasks:
+        await asyncio.wait(tasks)
+
+
+def upload_mime_type(filename: str, content_type: Optional[str]) -> str:
+    """MIME type of an upload, falling back to its extension when the browser sent a generic one."""
+    if content_type and content_type != "application/octet-stream":
+        return content_type
+    return EXTENSION_MIME_TYPES.get(os.path.splitext(filename)[1].lower(), "text/plain")
+
+
+def format_sse(event: str, data: Dict[str, Any]) -> str:
+    """Format a server-sent event with a JSON payload."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+def chat_outcome(result: Dict[str, Any]) -> str:
+    """Label a chat result for the request counter."""
+    if "error" in result:
+        return "error"
+    return "cached" if result.get("cached") else "answered"
+
+
 # Main chat endpoint
 @app.post("/api/chat", response_model=ChatResponse)
 async def chat_with_agent(request: ChatRequest):
@@ -127,42 +363,27 @@ async def chat_with_agent(request: ChatRequest):
         # Generate session ID if not provided
         session_id = request.session_id or str(uuid.uuid4())
         
-        # Load existing chat history
-        existing_messages = await db_service.load_chat_session(session_id) or []
-        
-        # Create user message
-        user_message = {
-            "id": str(uuid.uuid4()),
-            "role": "user",
-            "content": request.query.strip()
-        }
-        
-        # Query the neurosurgery agent with RAG support
-        result = await query_neurosurgery_agent(
-            question=request.query.strip(),
-            session_id=session_id,
-            user_id="anonymous"  # TODO: Replace with actual user ID when auth is implemented
-        )
-        
-        # Create assistant message
-        assistant_message = {
-            "id": str(uuid.uuid4()),
-            "role": "assistant",
-            "content": result["answer"],
-            "source": result.get("source", "Neurosurgery AI Agent")
-        }
-        
-        # Update messages list
-        updated_messages = existing_messages + [user_message, assistant_message]
+        with IN_FLIGHT.track_in_progress(kind="chat"), CHAT_STAGE_SECONDS.time(stage="request"):
+            # Make the previous turn visible to the agent's conversation memory
+            await wait_for_chat_saves(session_id)
+            
+            # Query the neurosurgery agent with RAG support
+            result = await query_neurosurgery_agent(
+                question=request.query.strip(),
+                session_id=session_id,
+                user_id="anonymous"  # TODO: Replace with actual user ID when auth is implemented
+            )
+        CHAT_REQUESTS.inc(endpoint="chat", outcome=chat_outcome(result))
         
-        # Save to database
-        await db_service.save_chat_session(session_id, updated_messages)
+        # Save to database after responding (write-behind)
+        save_chat_turn_behind(session_id, request.query.strip(), result)
         
         # Return the response
         return ChatResponse(
             answer=result["answer"],
             source=result.get("source", "Neurosurgery AI Agent"),
-            session_id=result["session_id"]
+            session_id=result["session_id"],
+            routing=result.get("routing")
         )
         
     except HTTPException:
@@ -176,26 +397,133 @@ async def chat_with_agent(request: ChatRequest):
         )
 
 
+# Streaming chat endpoint
+@app.post("/api/chat/stream")
+async def stream_chat_with_agent(request: ChatRequest):
+    """
+    Stream the neurosurgery AI agent's answer as server-sent events.
+    
+    Events, in order:
+        session: {"session_id"} as soon as the request is accepted
+        delta: {"text"} for each piece of generated text
+        answer: {"answer", "source", "session_id", "routing"} once generation completes
+        timing: embedding, retrieval, generation and history save durations in milliseconds
+        done: {"session_id", "saved"} after the turn has been persisted
+    
+    Args:
+        request: ChatRequest containing the user's query and optional session_id
+        
+    Returns:
+        StreamingResponse with media type text/event-stream
+    """
+    # Validate input
+    if not request.query or not request.query.strip():
+        raise HTTPException(status_code=400, detail="Query cannot be empty")
+    
+    query = request.query.strip()
+    
+    # Generate session ID if not provided
+    session_id = request.session_id or str(uuid.uuid4())
+    
+    async def event_stream():
+        yield format_sse("session", {"session_id": session_id})
+        
+        with IN_FLIGHT.track_in_progress(kind="chat_stream"):
+            request_start = time.perf_counter()
+            
+            # Make the previous turn visible to the agent's conversation memory
+            await wait_for_chat_saves(session_id)
+            
+            result: Dict[str, Any] = {}
+            async for chunk in stream_neurosurgery_agent(
+                question=query,
+                session_id=session_id,
+                user_id="anonymous"  # TODO: Replace with actual user ID when auth is implemented
+            ):
+                if chunk["type"] == "delta":
+                    yield format_sse("delta", {"text": chunk["text"]})
+                else:
+                    result = chunk
+            
+            CHAT_STAGE_SECONDS.observe(time.perf_counter() - request_start, stage="request")
+            CHAT_REQUESTS.inc(endpoint="chat_stream", outcome=chat_outcome(result))
+        
+        # Start persisting the turn while the answer is sent; the save completes
+        # even if the client disconnects
+        save_start = time.perf_counter()
+        save_task = save_chat_turn_behind(session_id, query, result)
+        
+        yield format_sse("answer", {
+            "answer": result["answer"],
+            "source": result.get("source", "Neurosurgery AI Agent"),
+            "session_id": session_id,
+            "routing": result.get("routing")
+        })
+        
+        saved = await asyncio.shield(save_task)
+        timing = dict(result.get("timing", {}))
+        timing["history_save_ms"] = (time.perf_counter() - save_start) * 1000
+        
+        yield format_sse("timing", timing)
+        yield format_sse("done", {"session_id": session_id, "saved": saved})
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no"  # Disable proxy buffering so deltas arrive immediately
+        }
+    )
+
+
+# Metrics endpoint
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """Per-stage latency histograms, throughput counters and cache statistics in the Prometheus text format."""
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
 # Chat history endpoint
 @app.get("/api/chat/{session_id}", response_model=ChatHistoryResponse)
-async def get_chat_history(session_id: str):
+async def get_chat_history(session_id: str, limit: Optional[int] = None, before: Optional[int] = None):
     """
     Get chat history for a specific session.
     
     Args:
         session_id: The session ID to retrieve history for
+        limit: Optional page size; when set, only the newest `limit` messages
+            (older than `before`, if given) are returned
+        before: Cursor from a previous page's next_cursor
         
     Returns:
-        ChatHistoryResponse with messages and session_id
+        ChatHistoryResponse with messages, session_id and the cursor for the
+        next (older) page when paginating
     """
     try:
-        messages = await db_service.load_chat_session(session_id) or []
+        await wait_for_chat_saves(session_id)
+        
+        if limit is None and before is None:
+            messages = await db_service.load_chat_session(session_id) or []
+            
+            return ChatHistoryResponse(
+                messages=messages,
+                session_id=session_id
+            )
+        
+        if limit is not None and limit <= 0:
+            raise HTTPException(status_code=400, detail="limit must be positive")
+        
+        page = await db_service.load_chat_messages_page(session_id, limit or 50, before)
         
         return ChatHistoryResponse(
-            messages=messages,
-            session_id=session_id
+            messages=page["messages"],
+            session_id=session_id,
+            next_cursor=page["next_cursor"]
         )
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=500,
@@ -205,44 +533,44 @@ async def get_chat_history(session_id: str):
 
 # User sessions endpoint
 @app.get("/api/sessions", response_model=UserSessionsResponse)
-async def get_user_sessions(user_id: str = "anonymous"):
+async def get_user_sessions(user_id: str = "anonymous", limit: Optional[int] = None, cursor: Optional[str] = None):
     """
     Get all chat sessions for a user.
     
     Args:
         user_id: User identifier (defaults to "anonymous")
+        limit: Optional page size
+        cursor: next_cursor from a previous page
         
     Returns:
         UserSessionsResponse with list of session summaries
     """
     try:
-        sessions_data = await db_service.get_user_sessions(user_id)
-        
-        sessions = []
-        for session in sessions_data:
-            # Load messages to get count and generate title
-            messages = await db_service.load_chat_session(session["session_id"]) or []
-            
-            # Generate title from first user message or use default
-            title = "New Chat"
-            if messages:
-                first_user_msg = next((msg for msg in messages if msg["role"] == "user"), None)
-                if first_user_msg:
-                    # Use first 50 characters of first message as title
-                    title = first_user_msg["content"][:50]
-                    if len(first_user_msg["content"]) > 50:
-                        title += "..."
-            
-            sessions.append(SessionSummary(
+        if limit is not None and limit <= 0:
+            raise HTTPException(status_code=400, detail="limit must be positive")
+        
+        # Include turns of this user's sessions that are still being saved
+        await wait_for_chat_saves(user_id=user_id)
+        try:
+            page = await db_service.get_user_sessions(user_id, limit, cursor)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        
+        sessions = [
+            SessionSummary(
                 session_id=session["session_id"],
-                title=title,
+                title=session.get("title") or "New Chat",
                 created_at=session["created_at"],
                 updated_at=session["updated_at"],
-                message_count=len(messages)
-            ))
+                message_count=session.get("message_count") or 0
+            )
+            for session in page["sessions"]
+        ]
         
-        return UserSessionsResponse(sessions=sessions)
+        return UserSessionsResponse(sessions=sessions, next_cursor=page["next_cursor"])
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=500,
@@ -264,6 +592,8 @@ async def delete_chat_session(session_id: str, user_id: str = "anonymous"):
         Success message
     """
     try:
+        # A pending save would otherwise recreate the session's messages
+        await wait_for_chat_saves(session_id)
         success = await db_service.delete_chat_session(session_id, user_id)
         
         if not success:
@@ -284,7 +614,7 @@ async def delete_chat_session(session_id: str, user_id: str = "anonymous"):
 
 
 # Document upload endpoint
-@app.post("/api/documents/upload", response_model=UploadResponse)
+@app.post("/api/documents/upload", response_model=UploadResponse, status_code=202)
 async def upload_document(
     file: UploadFile = File(...),
     user_id: str = Form(default="anonymous")
@@ -292,42 +622,51 @@ async def upload_document(
     """
     Upload a document for RAG processing.
     
+    The document is processed in the background; poll
+    /api/documents/jobs/{job_id} for progress and the resulting document.
+    
     Args:
         file: The uploaded file
         user_id: User identifier
         
     Returns:
-        Upload response with document metadata
+        Upload response with the queued ingestion job
     """
     try:
         # Validate file
         if not file.filename:
             raise HTTPException(status_code=400, detail="No file provided")
         
-        # Read file content
-        content = await file.read()
+        # Read the upload in blocks so large files are never held in memory whole
+        first_block = await file.read(UPLOAD_READ_SIZE)
         
-        if len(content) == 0:
+        if len(first_block) == 0:
             raise HTTPException(status_code=400, detail="Empty file provided")
         
-        # Process and store document
-        document = await document_service.upload_document(
+        async def file_blocks():
+            yield first_block
+            while block := await file.read(UPLOAD_READ_SIZE):
+                yield block
+        
+        # Queue the document for background processing
+        job = await ingestion_queue.submit(
             filename=file.filename,
-            content=content,
-            mime_type=file.content_type or "text/plain",
+            blocks=file_blocks(),
+            mime_type=upload_mime_type(file.filename, file.content_type),
             user_id=user_id
         )
         
-        if not document:
+        if not job:
             raise HTTPException(
-                status_code=500,
-                detail="Failed to process document. Please ensure it's a text file."
+                status_code=503,
+                detail="Document processing is busy. Please try again shortly.",
+                headers={"Retry-After": "5"}
             )
         
         return UploadResponse(
             success=True,
-            message="Document uploaded and processed successfully",
-            document=DocumentResponse(**document)
+            message="Document queued for processing",
+            job=IngestionJobResponse(**job)
         )
         
     except HTTPException:
@@ -339,6 +678,36 @@ async def upload_document(
         )
 
 
+# Ingestion job status endpoint
+@app.get("/api/documents/jobs/{job_id}", response_model=IngestionJobResponse)
+async def get_ingestion_job(job_id: str, user_id: str = "anonymous"):
+    """
+    Get the status and progress of a document ingestion job.
+    
+    Args:
+        job_id: ID returned by the upload endpoint
+        user_id: User identifier
+        
+    Returns:
+        Job status, chunk progress and, once completed, the document
+    """
+    try:
+        job = await ingestion_queue.get_job(job_id, user_id)
+        
+        if not job:
+            raise HTTPException(status_code=404, detail="Ingestion job not found")
+        
+        return IngestionJobResponse(**job)
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Error retrieving ingestion job: {str(e)}"
+        )
+
+
 # Get user documents endpoint
 @app.get("/api/documents", response_model=DocumentListResponse)
 async def get_documents(user_id: str = "anonymous"):
@@ -407,6 +776,8 @@ async def root():
         "docs": "/docs",
         "health": "/health",
         "chat_endpoint": "/api/chat",
+        "chat_stream_endpoint": "/api/chat/stream",
+        "metrics_endpoint": "/metrics",
         "documents_endpoint": "/api/documents"
     }
 
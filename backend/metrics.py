@@ -0,0 +1,262 @@
+"""
+In-Process Metrics in the Prometheus Text Format
+
+Counters, gauges and histograms for chat and ingestion stages, rendered by the
+/metrics endpoint. Recording a value is a dictionary lookup and a few
+additions, so instrumentation stays cheap on the request path. Values that
+other components already track (cache hit counters, index sizes) are read only
+when metrics are scraped.
+"""
+
+import time
+import math
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import List, Dict, Any, Optional, Tuple, Callable, Iterator, Sequence
+
+# Latency buckets in seconds, from sub-millisecond cache hits to slow generations
+DEFAULT_BUCKETS = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0
+)
+
+LabelValues = Tuple[str, ...]
+
+
+class Metric:
+    type_name = "untyped"
+
+    def __init__(
+        self,
+        name: str,
+        help_text: str,
+        labelnames: Sequence[str] = (),
+        function: Optional[Callable[[], Any]] = None
+    ):
+        """
+        Args:
+            name: Metric name
+            help_text: Description shown in the HELP line
+            labelnames: Names of the labels values are recorded under
+            function: Optional callable computing the value at scrape time instead,
+                returning a number or a dict mapping label value tuples to numbers
+        """
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self.function = function
+        self._values: Dict[LabelValues, float] = {}
+
+    def _key(self, labels: Dict[str, Any]) -> LabelValues:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def _format_labels(self, values: LabelValues, extra: Optional[Tuple[str, str]] = None) -> str:
+        pairs = list(zip(self.labelnames, values))
+        if extra is not None:
+            pairs.append(extra)
+        if not pairs:
+            return ""
+        return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+    def samples(self) -> List[str]:
+        values = self._values
+        if self.function is not None:
+            try:
+                result = self.function()
+            except Exception as e:
+                print(f"Error collecting metric {self.name}: {e}")
+                return []
+            values = result if isinstance(result, dict) else {(): result}
+
+        return [
+            f"{self.name}{self._format_labels(tuple(str(v) for v in key))} {_number(value)}"
+            for key, value in sorted(values.items())
+            if value is not None
+        ]
+
+    def value(self, **labels: Any) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.type_name}"]
+        lines.extend(self.samples())
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    """Monotonically increasing count, e.g. requests or errors."""
+
+    type_name = "counter"
+
+    def inc(self, amount: float = 1.0, **labels: Any) -> None:
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0.0) + amount
+
+
+class Gauge(Metric):
+    """Value that goes up and down, e.g. requests in flight."""
+
+    type_name = "gauge"
+
+    def set(self, value: float, **labels: Any) -> None:
+        self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1.0, **labels: Any) -> None:
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels: Any) -> None:
+        self.inc(-amount, **labels)
+
+    @contextmanager
+    def track_in_progress(self, **labels: Any) -> Iterator[None]:
+        """Count the enclosed block as in progress while it runs."""
+        self.inc(**labels)
+        try:
+            yield
+        finally:
+            self.dec(**labels)
+
+
+class Histogram(Metric):
+    """Distribution of observed values (latencies in seconds) over fixed buckets."""
+
+    type_name = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help_text: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS
+    ):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # label values -> [per-bucket counts (last is +Inf), sum, count]
+        self._series: Dict[LabelValues, List[Any]] = {}
+
+    def observe(self, value: float, **labels: Any) -> None:
+        key = self._key(labels)
+        series = self._series.get(key)
+        if series is None:
+            series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1] += value
+        series[2] += 1
+
+    @contextmanager
+    def time(self, **labels: Any) -> Iterator[None]:
+        """Observe the duration of the enclosed block in seconds."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def count(self, **labels: Any) -> int:
+        series = self._series.get(self._key(labels))
+        return series[2] if series else 0
+
+    def samples(self) -> List[str]:
+        lines = []
+        for key, (counts, total, count) in sorted(self._series.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (math.inf,), counts):
+                cumulative += bucket_count
+                le = "+Inf" if bound == math.inf else _number(bound)
+                lines.append(f"{self.name}_bucket{self._format_labels(key, ('le', le))} {cumulative}")
+            lines.append(f"{self.name}_sum{self._format_labels(key)} {_number(total)}")
+            lines.append(f"{self.name}_count{self._format_labels(key)} {count}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> Metric:
+        """Add a metric, replacing any registered under the same name."""
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(
+        self,
+        name: str,
+        help_text: str,
+        labelnames: Sequence[str] = (),
+        function: Optional[Callable[[], Any]] = None
+    ) -> Counter:
+        return self.register(Counter(name, help_text, labelnames, function))
+
+    def gauge(
+        self,
+        name: str,
+        help_text: str,
+        labelnames: Sequence[str] = (),
+        function: Optional[Callable[[], Any]] = None
+    ) -> Gauge:
+        return self.register(Gauge(name, help_text, labelnames, function))
+
+    def histogram(
+        self,
+        name: str,
+        help_text: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS
+    ) -> Histogram:
+        return self.register(Histogram(name, help_text, labelnames, buckets))
+
+    def render(self) -> str:
+        """Return all metrics in the Prometheus text exposition format."""
+        return "\n".join(metric.render() for metric in self._metrics.values()) + "\n"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _number(value: float) -> str:
+    value = float(value)
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if math.isnan(value):
+        return "NaN"
+    return str(int(value)) if value.is_integer() else repr(value)
+
+
+# Process-wide registry and the metrics recorded across the backend
+registry = MetricsRegistry()
+
+CHAT_STAGE_SECONDS = registry.histogram(
+    "neurosurgery_chat_stage_seconds",
+    "Duration of chat request stages",
+    ["stage"]
+)
+CHAT_REQUESTS = registry.counter(
+    "neurosurgery_chat_requests_total",
+    "Chat requests handled, by endpoint and outcome",
+    ["endpoint", "outcome"]
+)
+INGESTION_STAGE_SECONDS = registry.histogram(
+    "neurosurgery_ingestion_stage_seconds",
+    "Duration of document ingestion stages (extract and chunk are per document, embed and insert per batch)",
+    ["stage"]
+)
+INGESTED_CHUNKS = registry.counter(
+    "neurosurgery_ingested_chunks_total",
+    "Document chunks stored"
+)
+GEMINI_CALLS = registry.counter(
+    "neurosurgery_gemini_calls_total",
+    "Gemini API calls, by operation",
+    ["operation"]
+)
+GEMINI_ERRORS = registry.counter(
+    "neurosurgery_gemini_errors_total",
+    "Failed Gemini API calls, by operation",
+    ["operation"]
+)
+IN_FLIGHT = registry.gauge(
+    "neurosurgery_in_flight",
+    "Requests and ingestion jobs currently in progress",
+    ["kind"]
+)
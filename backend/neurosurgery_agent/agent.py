@@ -6,8 +6,22 @@ Google's Agent Development Kit (ADK) with Gemini models and RAG functionality.
 """
 
 import os
+import time
+import uuid
+import asyncio
+from google.adk import Runner
 from google.adk.agents import Agent
-from typing import Dict, Any, Optional
+from google.adk.agents.callback_context import CallbackContext
+from google.adk.agents.run_config import RunConfig, StreamingMode
+from google.adk.events import Event
+from google.adk.models import LlmRequest
+from google.adk.sessions import InMemorySessionService
+from google.genai import types
+from typing import AsyncGenerator, Dict, Any, Optional
+from answer_cache import SemanticAnswerCache
+from retrieval_router import RetrievalRouter, NO_RETRIEVAL
+from conversation_memory import ConversationMemory
+from metrics import CHAT_STAGE_SECONDS, GEMINI_CALLS, GEMINI_ERRORS
 
 # Load environment variables
 from dotenv import load_dotenv
@@ -16,12 +30,54 @@ load_dotenv()
 # Set up Google API key as environment variable for ADK
 os.environ["GOOGLE_API_KEY"] = os.getenv("GOOGLE_API_KEY", "")
 
+APP_NAME = "neurosurgery_app"
+ADK_USER_ID = "user_1"
+
+# Session state keys holding the per-call RAG context and the summary of the
+# conversation's older turns
+RAG_CONTEXT_STATE_KEY = "rag_context"
+CONVERSATION_SUMMARY_STATE_KEY = "conversation_summary"
+
+NO_FINAL_RESPONSE = "Agent did not produce a final response."
+
+AGENT_SOURCE = "Neurosurgery AI Agent with Google ADK"
+
+
+def inject_rag_context(callback_context: CallbackContext, llm_request: LlmRequest) -> None:
+    """
+    Prepend the per-call RAG context and conversation summary from session state
+    to the system instruction.
+    
+    The context is applied here rather than through the instruction template so that
+    braces inside document text are never treated as state placeholders.
+    """
+    parts = []
+    
+    summary = callback_context.state.get(CONVERSATION_SUMMARY_STATE_KEY)
+    if summary and summary.strip():
+        parts.append(f"Summary of the earlier conversation with this user:\n{summary}")
+    
+    context = callback_context.state.get(RAG_CONTEXT_STATE_KEY)
+    if context and context.strip():
+        parts.append(context)
+    
+    if not parts:
+        return None
+    
+    instruction = llm_request.config.system_instruction
+    if instruction:
+        parts.append(instruction)
+    llm_request.config.system_instruction = "\n\n".join(parts)
+    return None
+
+
 def create_neurosurgery_agent(context: Optional[str] = None) -> Agent:
     """
     Create a neurosurgery agent with optional RAG context.
     
     Args:
-        context: Optional context from RAG system
+        context: Optional context from RAG system. Prefer passing context per call
+            through NeurosurgeryAgentRuntime instead of building a new agent.
         
     Returns:
         Configured Agent instance
@@ -55,13 +111,321 @@ Remember: Your responses are for informational purposes only and should not repl
         name="neurosurgery_specialist",
         model="gemini-2.0-flash",
         description="Specialized AI assistant for neurosurgery information and guidance",
-        instruction=instruction
+        instruction=instruction,
+        before_model_callback=inject_rag_context
     )
 
 # Create the default agent without context
 root_agent = create_neurosurgery_agent()
 
 
+class NeurosurgeryAgentRuntime:
+    """
+    Process-wide agent runtime shared by all chat requests.
+    
+    The agent, session service, runner and RAG service (with its Gemini client) are
+    built once; each call only performs retrieval and the model call. Answers to
+    opening questions are cached per user so near-duplicates skip both. With
+    conversation memory, each call also sees the chat session's recent turns and
+    a summary of older ones.
+    """
+    
+    def __init__(self, rag_service, memory: Optional[ConversationMemory] = None):
+        self.rag_service = rag_service
+        self.memory = memory
+        self.answer_cache = SemanticAnswerCache.from_env("ANSWER_CACHE")
+        self.router = RetrievalRouter.from_env("RETRIEVAL_ROUTER")
+        self.agent = root_agent
+        self.session_service = InMemorySessionService()
+        self.runner = Runner(
+            agent=self.agent,
+            app_name=APP_NAME,
+            session_service=self.session_service
+        )
+    
+    async def stream(
+        self,
+        question: str,
+        rag_context: str = "",
+        streaming: bool = False,
+        history: Optional[Dict[str, Any]] = None
+    ) -> AsyncGenerator[Event, None]:
+        """
+        Run the shared agent once with the given RAG context and yield its ADK events.
+        
+        Args:
+            question: The user's question
+            rag_context: Context string passed to the model for this call only
+            streaming: Request partial text events from the model (SSE mode)
+            history: Optional conversation context from ConversationMemory.load
+                ("summary" and recent "messages")
+            
+        Yields:
+            ADK events in the order the runner produces them
+        """
+        history = history or {}
+        
+        # Each invocation gets its own short-lived ADK session so concurrent
+        # requests never share state; it is dropped once the call completes.
+        # The chat storage is the persistent record: the session is seeded with
+        # the conversation's recent turns, and the summary of older ones goes
+        # into the system instruction.
+        adk_session_id = str(uuid.uuid4())
+        session = self.session_service.create_session(
+            app_name=APP_NAME,
+            user_id=ADK_USER_ID,
+            session_id=adk_session_id,
+            state={
+                RAG_CONTEXT_STATE_KEY: rag_context,
+                CONVERSATION_SUMMARY_STATE_KEY: history.get("summary", "")
+            }
+        )
+        for message in history.get("messages", []):
+            is_user = message["role"] == "user"
+            self.session_service.append_event(session, Event(
+                author="user" if is_user else self.agent.name,
+                content=types.Content(
+                    role="user" if is_user else "model",
+                    parts=[types.Part(text=message["content"])]
+                )
+            ))
+        
+        run_config = RunConfig(streaming_mode=StreamingMode.SSE) if streaming else RunConfig()
+        
+        GEMINI_CALLS.inc(operation="generate")
+        generation_start = time.perf_counter()
+        try:
+            # Prepare the user's message in ADK format
+            content = types.Content(role='user', parts=[types.Part(text=question)])
+            
+            async for event in self.runner.run_async(
+                user_id=ADK_USER_ID,
+                session_id=adk_session_id,
+                new_message=content,
+                run_config=run_config
+            ):
+                yield event
+        except Exception:
+            GEMINI_ERRORS.inc(operation="generate")
+            raise
+        finally:
+            CHAT_STAGE_SECONDS.observe(time.perf_counter() - generation_start, stage="generation")
+            self.session_service.delete_session(
+                app_name=APP_NAME,
+                user_id=ADK_USER_ID,
+                session_id=adk_session_id
+            )
+    
+    async def run(self, question: str, rag_context: str = "", history: Optional[Dict[str, Any]] = None) -> str:
+        """
+        Run the shared agent once with the given RAG context.
+        
+        Args:
+            question: The user's question
+            rag_context: Context string passed to the model for this call only
+            history: Optional conversation context from ConversationMemory.load
+            
+        Returns:
+            The final response text
+        """
+        final_response_text = None
+        
+        # Drain the stream instead of breaking out of it so ADK's nested
+        # generators (and their tracing spans) finish inside this task
+        async for event in self.stream(question, rag_context, history=history):
+            if final_response_text is None:
+                final_response_text = final_response_text_from(event)
+        
+        return final_response_text or NO_FINAL_RESPONSE
+    
+    async def prepare(self, question: str, user_id: str, session_id: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Run the stages before generation, overlapping their independent I/O.
+        
+        The retrieval router and the user's corpus descriptor decide what runs:
+        retrieval is skipped for questions that don't need documents (requests
+        to rework the previous answer wait for the history to confirm there is
+        one) and for users with no indexed chunks, broad questions retrieve more chunks, and
+        the query is only embedded if retrieval or the answer cache needs it.
+        The conversation history loads while the other stages run. The query
+        embedding and retrieval start together: keyword search runs while the
+        query is embedded, and vector search joins that in-flight embedding
+        instead of requesting its own. The answer cache (used only for a conversation's
+        first question, since later answers depend on earlier turns) is checked
+        as soon as the embedding is ready; on a hit the retrieval still in
+        flight is cancelled.
+        
+        Args:
+            question: The user's question
+            user_id: User ID for the answer cache and RAG context retrieval
+            session_id: Chat session whose earlier turns are loaded, if any
+            
+        Returns:
+            Dictionary with the "routing" decision (route, reason, max_chunks,
+            router_ms, estimated_saved_ms), the user's "corpus" descriptor (None
+            if unavailable), the document set "version" (None if unknown), the
+            conversation "history", the "query_vector" (or None), whether the
+            answer is "cacheable", a "cached" answer (or None), the
+            "rag_context" (empty on a cache hit or when retrieval was skipped)
+            and stage "timing" in milliseconds
+        """
+        timing: Dict[str, float] = {}
+        start = time.perf_counter()
+        
+        history: Dict[str, Any] = {"summary": "", "messages": []}
+        history_task = None
+        if self.memory is not None and self.memory.enabled and session_id:
+            history_task = asyncio.ensure_future(self.memory.load(session_id))
+        
+        embedding = None
+        retrieval = None
+        
+        try:
+            # A follow-up only skips retrieval if there is an earlier answer to
+            # rework, so wait for the history it's already loading
+            follow_up_has_history = False
+            if history_task is not None and self.router.is_follow_up(question):
+                history = await history_task
+                follow_up_has_history = has_history(history)
+            routing = self.router.route(question, has_history=follow_up_has_history)
+            timing["router_ms"] = routing["router_ms"]
+            
+            corpus_start = time.perf_counter()
+            corpus = await self.rag_service.corpus.get(user_id)
+            timing["corpus_ms"] = (time.perf_counter() - corpus_start) * 1000
+            
+            # Without a descriptor, assume there may be documents and don't cache
+            version = corpus["version"] if corpus else None
+            has_chunks = corpus is None or corpus["chunks"] > 0
+            cacheable = self.answer_cache.enabled and version is not None
+            
+            # Only count retrievals the router skipped, not ones with nothing to search
+            retrieve = has_chunks and routing["route"] != NO_RETRIEVAL
+            routing["estimated_saved_ms"] = 0.0
+            if has_chunks and not retrieve:
+                routing["estimated_saved_ms"] = self.router.record_skip()
+            
+            # With nothing else to overlap, find out whether this is the
+            # conversation's first question before embedding it for the cache
+            if cacheable and not retrieve and history_task is not None:
+                history = await history_task
+                cacheable = not has_history(history)
+            
+            if retrieve or cacheable:
+                embedding_start = time.perf_counter()
+                embedding = asyncio.ensure_future(
+                    self.rag_service.embed_query(question, task_type="QUESTION_ANSWERING")
+                )
+            if retrieve:
+                retrieval_start = time.perf_counter()
+                retrieval = asyncio.ensure_future(
+                    self.rag_service.get_rag_context(question, user_id, routing["max_chunks"])
+                )
+            
+            query_vector = None
+            if embedding is not None:
+                query_vector = await embedding
+                timing["embedding_ms"] = (time.perf_counter() - embedding_start) * 1000
+            
+            if history_task is not None:
+                history = await history_task
+                timing["history_ms"] = (time.perf_counter() - start) * 1000
+                cacheable = cacheable and not has_history(history)
+            
+            cached = None
+            if cacheable and query_vector is not None:
+                cache_start = time.perf_counter()
+                cached = self.answer_cache.get(user_id, version, query_vector)
+                CHAT_STAGE_SECONDS.observe(time.perf_counter() - cache_start, stage="answer_cache")
+                timing["answer_cache_ms"] = (time.perf_counter() - cache_start) * 1000
+            
+            rag_context = ""
+            if retrieval is not None and not cached:
+                rag_context = await retrieval
+                timing["retrieval_ms"] = (time.perf_counter() - retrieval_start) * 1000
+                self.router.record_retrieval(timing["retrieval_ms"])
+        finally:
+            # Don't leave the stages running on a cache hit, or if the request is
+            # cancelled or fails
+            for task in (history_task, embedding, retrieval):
+                if task is not None:
+                    task.cancel()
+        
+        return {
+            "routing": routing,
+            "corpus": corpus,
+            "version": version,
+            "history": history,
+            "query_vector": query_vector,
+            "cacheable": cacheable,
+            "cached": cached,
+            "rag_context": rag_context,
+            "timing": timing
+        }
+    
+    def remember_answer(self, user_id: str, prepared: Dict[str, Any], answer: str, rag_context_used: bool) -> None:
+        """
+        Cache an answer for later near-duplicate questions.
+        
+        Args:
+            user_id: User ID the answer belongs to
+            prepared: Result of prepare for the question (its version and embedding
+                are stored with the answer; answers that aren't cacheable are skipped)
+            answer: The answer text
+            rag_context_used: Whether document context informed the answer
+        """
+        query_vector = prepared["query_vector"]
+        if not prepared["cacheable"] or query_vector is None or answer == NO_FINAL_RESPONSE:
+            return
+        
+        self.answer_cache.set(user_id, prepared["version"], query_vector, {
+            "answer": answer,
+            "rag_context_used": rag_context_used
+        })
+
+
+def has_history(history: Dict[str, Any]) -> bool:
+    """Whether conversation context from ConversationMemory.load has any earlier turns."""
+    return bool(history.get("messages") or history.get("summary"))
+
+
+def answer_source(rag_context_used: bool, cached: bool = False) -> str:
+    """Describe where an answer came from, for the response's source field."""
+    source = AGENT_SOURCE
+    if rag_context_used:
+        source += " (Enhanced with your documents)"
+    if cached:
+        source += " (Cached answer)"
+    return source
+
+
+def final_response_text_from(event: Event) -> Optional[str]:
+    """Return the answer text carried by a final-response event, or None."""
+    if not event.is_final_response():
+        return None
+    if event.content and event.content.parts:
+        return event.content.parts[0].text
+    if event.actions and event.actions.escalate:
+        return f"Agent escalated: {event.error_message or 'No specific message.'}"
+    return None
+
+
+_agent_runtime: Optional[NeurosurgeryAgentRuntime] = None
+
+
+def get_agent_runtime() -> NeurosurgeryAgentRuntime:
+    """Return the process-wide agent runtime, creating it on first use."""
+    global _agent_runtime
+    if _agent_runtime is None:
+        from database import db_service
+        from rag_service import RAGService
+        
+        rag_service = RAGService(db_service.supabase)
+        memory = ConversationMemory.from_env(db_service, rag_service.genai_client)
+        _agent_runtime = NeurosurgeryAgentRuntime(rag_service, memory)
+    return _agent_runtime
+
+
 async def query_neurosurgery_agent(question: str, session_id: str = "default", user_id: str = "anonymous") -> Dict[str, Any]:
     """
     Query the neurosurgery agent with a question, using RAG context when available.
@@ -75,71 +439,117 @@ async def query_neurosurgery_agent(question: str, session_id: str = "default", u
         Dictionary containing the response and metadata
     """
     try:
-        from google.adk.sessions import InMemorySessionService
-        from google.adk import Runner
-        from google.genai import types
+        runtime = get_agent_runtime()
+        prepared = await runtime.prepare(question, user_id, session_id)
         
-        # Import RAG service for context retrieval
-        from database import db_service
-        from rag_service import RAGService
+        cached = prepared["cached"]
+        if cached:
+            return {
+                "answer": cached["answer"],
+                "source": answer_source(cached["rag_context_used"], cached=True),
+                "session_id": session_id,
+                "rag_context_used": cached["rag_context_used"],
+                "cached": True,
+                "routing": prepared["routing"]
+            }
         
-        # Get RAG context for the question
-        rag_service = RAGService(db_service.supabase)
-        rag_context = await rag_service.get_rag_context(question, user_id)
+        rag_context = prepared["rag_context"]
+        final_response_text = await runtime.run(question, rag_context, prepared["history"])
+        runtime.remember_answer(user_id, prepared, final_response_text, bool(rag_context))
         
-        # Create agent with RAG context
-        agent = create_neurosurgery_agent(rag_context)
+        return {
+            "answer": final_response_text,
+            "source": answer_source(bool(rag_context)),
+            "session_id": session_id,
+            "rag_context_used": bool(rag_context),
+            "cached": False,
+            "routing": prepared["routing"]
+        }
+        
+    except Exception as e:
+        # Handle errors gracefully
+        return {
+            "answer": f"I apologize, but I encountered an error while processing your neurosurgery question: {str(e)}. Please try again or rephrase your question.",
+            "source": "Error handling",
+            "session_id": session_id,
+            "error": str(e)
+        }
+
+
+async def stream_neurosurgery_agent(question: str, session_id: str = "default", user_id: str = "anonymous") -> AsyncGenerator[Dict[str, Any], None]:
+    """
+    Stream the neurosurgery agent's answer as the model generates it.
+    
+    Args:
+        question: The neurosurgery-related question
+        session_id: Session identifier for conversation continuity
+        user_id: User ID for RAG context retrieval
         
-        # Create session service and runner
-        session_service = InMemorySessionService()
-        app_name = "neurosurgery_app"
-        adk_user_id = "user_1"
+    Yields:
+        {"type": "delta", "text": ...} for each partial piece of text, followed by one
+        {"type": "final", ...} dictionary with the same fields as query_neurosurgery_agent
+        plus a "timing" dictionary (milliseconds)
+    """
+    timing: Dict[str, float] = {}
+    
+    try:
+        runtime = get_agent_runtime()
+        prepared = await runtime.prepare(question, user_id, session_id)
+        timing.update(prepared["timing"])
         
-        # Create session
-        session = session_service.create_session(
-            app_name=app_name,
-            user_id=adk_user_id,
-            session_id=session_id
-        )
+        cached = prepared["cached"]
+        if cached:
+            yield {"type": "delta", "text": cached["answer"]}
+            yield {
+                "type": "final",
+                "answer": cached["answer"],
+                "source": answer_source(cached["rag_context_used"], cached=True),
+                "session_id": session_id,
+                "rag_context_used": cached["rag_context_used"],
+                "cached": True,
+                "routing": prepared["routing"],
+                "timing": timing
+            }
+            return
         
-        # Create runner
-        runner = Runner(
-            agent=agent,
-            app_name=app_name,
-            session_service=session_service
-        )
+        rag_context = prepared["rag_context"]
         
-        # Prepare the user's message in ADK format
-        content = types.Content(role='user', parts=[types.Part(text=question)])
+        generation_start = time.perf_counter()
+        final_response_text = None
         
-        # Run the agent and collect the final response
-        final_response_text = "Agent did not produce a final response."
+        async for event in runtime.stream(question, rag_context, streaming=True, history=prepared["history"]):
+            if event.partial:
+                if event.content and event.content.parts and event.content.parts[0].text:
+                    if "time_to_first_token_ms" not in timing:
+                        CHAT_STAGE_SECONDS.observe(time.perf_counter() - generation_start, stage="first_token")
+                        timing["time_to_first_token_ms"] = (time.perf_counter() - generation_start) * 1000
+                    yield {"type": "delta", "text": event.content.parts[0].text}
+            elif final_response_text is None:
+                final_response_text = final_response_text_from(event)
         
-        async for event in runner.run_async(user_id=adk_user_id, session_id=session_id, new_message=content):
-            if event.is_final_response():
-                if event.content and event.content.parts:
-                    final_response_text = event.content.parts[0].text
-                elif event.actions and event.actions.escalate:
-                    final_response_text = f"Agent escalated: {event.error_message or 'No specific message.'}"
-                break
+        timing["generation_ms"] = (time.perf_counter() - generation_start) * 1000
         
-        # Add context indicator if RAG was used
-        source = "Neurosurgery AI Agent with Google ADK"
-        if rag_context:
-            source += " (Enhanced with your documents)"
+        answer = final_response_text or NO_FINAL_RESPONSE
+        runtime.remember_answer(user_id, prepared, answer, bool(rag_context))
         
-        return {
-            "answer": final_response_text,
-            "source": source,
+        yield {
+            "type": "final",
+            "answer": answer,
+            "source": answer_source(bool(rag_context)),
             "session_id": session_id,
-            "rag_context_used": bool(rag_context)
+            "rag_context_used": bool(rag_context),
+            "cached": False,
+            "routing": prepared["routing"],
+            "timing": timing
         }
         
     except Exception as e:
         # Handle errors gracefully
-        return {
+        yield {
+            "type": "final",
             "answer": f"I apologize, but I encountered an error while processing your neurosurgery question: {str(e)}. Please try again or rephrase your question.",
             "source": "Error handling",
             "session_id": session_id,
-            "error": str(e)
-        }
\ No newline at end of file
+            "error": str(e),
+            "timing": timing
+        }
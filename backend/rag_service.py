@@ -5,17 +5,112 @@ Handles document embedding generation and similarity search for RAG functionalit
 """
 
 import os
+import json
+import asyncio
+import hashlib
 import numpy as np
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Tuple, Callable, Awaitable, AsyncIterable
 from google import genai
 from google.genai import types
-from supabase import Client
+from supabase import AsyncClient
 from dotenv import load_dotenv
+from embedding_cache import EmbeddingCache, make_cache_key, normalize_text
+from single_flight import SingleFlight
+from vector_index import LocalVectorIndex
+from corpus import CorpusRegistry
+from chunking import stitch_chunks
+from metrics import CHAT_STAGE_SECONDS, INGESTION_STAGE_SECONDS, INGESTED_CHUNKS, GEMINI_CALLS, GEMINI_ERRORS
 
 load_dotenv()
 
+# Called with (chunks embedded so far, total chunks) during ingestion
+ProgressCallback = Callable[[int, int], Awaitable[None]]
+
+# Number of content hashes looked up per chunk_embeddings request
+CHUNK_EMBEDDING_LOOKUP_BATCH = 100
+
+
+def plan_embedding_batches(texts: List[str], max_items: int, max_chars: int) -> List[Tuple[int, int]]:
+    """
+    Split texts into contiguous batches bounded by item count and total characters.
+    
+    Args:
+        texts: Texts to embed
+        max_items: Maximum number of texts per batch
+        max_chars: Maximum total characters per batch (a single longer text gets its own batch)
+        
+    Returns:
+        List of (start, end) index ranges covering texts in order
+    """
+    batches = []
+    start = 0
+    chars = 0
+    
+    for i, text in enumerate(texts):
+        if i > start and (i - start >= max_items or chars + len(text) > max_chars):
+            batches.append((start, i))
+            start = i
+            chars = 0
+        chars += len(text)
+    
+    if start < len(texts):
+        batches.append((start, len(texts)))
+    
+    return batches
+
+
+def to_vector_literal(vector: np.ndarray) -> str:
+    """
+    Encode an embedding as a pgvector text literal.
+    
+    pgvector stores float4, so 9 significant digits round-trip exactly; this is
+    roughly half the size of the JSON list of float64 reprs from tolist().
+    
+    Args:
+        vector: Embedding vector
+        
+    Returns:
+        Literal such as "[0.0123,-0.0456,...]"
+    """
+    return "[" + ",".join(f"{x:.9g}" for x in np.asarray(vector, dtype=np.float32).tolist()) + "]"
+
+
+def reciprocal_rank_fusion(
+    result_lists: List[List[Dict[str, Any]]],
+    limit: int,
+    k: int = 60
+) -> List[Dict[str, Any]]:
+    """
+    Merge ranked chunk lists with reciprocal rank fusion.
+    
+    Each chunk scores sum(1 / (k + rank)) over the lists it appears in, so chunks
+    ranked well by several retrievers rise to the top without having to
+    calibrate their raw scores against each other.
+    
+    Args:
+        result_lists: Chunk lists, each ordered best first
+        limit: Maximum number of chunks to return
+        k: Rank offset damping the influence of top positions
+        
+    Returns:
+        Merged chunks with a "fusion_score" field, best first
+    """
+    scores: Dict[str, float] = {}
+    chunks: Dict[str, Dict[str, Any]] = {}
+    
+    for results in result_lists:
+        for rank, chunk in enumerate(results, 1):
+            chunk_id = chunk["id"]
+            scores[chunk_id] = scores.get(chunk_id, 0.0) + 1.0 / (k + rank)
+            # Keep fields from every list (e.g. similarity and keyword_rank)
+            chunks[chunk_id] = {**chunk, **chunks.get(chunk_id, {})}
+    
+    ranked = sorted(scores, key=scores.get, reverse=True)[:limit]
+    return [{**chunks[chunk_id], "fusion_score": scores[chunk_id]} for chunk_id in ranked]
+
+
 class RAGService:
-    def __init__(self, supabase_client: Client):
+    def __init__(self, supabase_client: AsyncClient):
         """Initialize RAG service with Gemini embeddings and Supabase client."""
         self.supabase = supabase_client
         
@@ -25,124 +120,531 @@ class RAGService:
         # Embedding configuration
         self.embedding_model = "gemini-embedding-001"
         self.embedding_dimension = 768
+        
+        # Batching limits for embed_content requests
+        self.embedding_batch_size = int(os.getenv("EMBEDDING_BATCH_SIZE", 100))
+        self.embedding_batch_max_chars = int(os.getenv("EMBEDDING_BATCH_MAX_CHARS", 200_000))
+        self.embedding_max_retries = int(os.getenv("EMBEDDING_MAX_RETRIES", 2))
+        self.embedding_max_concurrency = int(os.getenv("EMBEDDING_MAX_CONCURRENCY", 4))
+        self._embedding_semaphore = asyncio.Semaphore(self.embedding_max_concurrency)
+        
+        # Chunking configuration: approximate tokens per chunk and of trailing
+        # sentences repeated in the next chunk
+        self.chunk_max_tokens = int(os.getenv("CHUNK_MAX_TOKENS", 512))
+        self.chunk_overlap_tokens = int(os.getenv("CHUNK_OVERLAP_TOKENS", 64))
+        
+        # Chunks embedded and inserted per rolling batch during ingestion
+        self.ingestion_batch_chunks = int(os.getenv(
+            "INGESTION_BATCH_CHUNKS", self.embedding_batch_size * self.embedding_max_concurrency
+        ))
+        
+        # Cache for query embeddings (repeated and retried questions)
+        self.query_embedding_cache = EmbeddingCache.from_env("EMBEDDING_CACHE")
+        
+        # Identical concurrent query embeddings and retrievals share one call
+        self.embedding_flights = SingleFlight("query_embedding")
+        self.retrieval_flights = SingleFlight("retrieval")
+        
+        # Vector search backend: "pgvector" (search_document_chunks RPC) or
+        # "local" (in-process index loaded per user)
+        self.vector_search_backend = os.getenv("VECTOR_SEARCH_BACKEND", "pgvector").lower()
+        self.similarity_threshold = 0.7
+        
+        # pgvector query-time recall settings (HNSW candidate list, IVFFlat lists probed)
+        self.pgvector_ef_search = int(os.getenv("PGVECTOR_EF_SEARCH", 40))
+        self.pgvector_probes = int(os.getenv("PGVECTOR_PROBES", 10))
+        
+        # Quantized index to search ("none", "halfvec" or "binary"; must match the
+        # index built by rebuild_document_chunks_index) and how many candidates per
+        # result are re-ranked with full-precision vectors
+        self.pgvector_quantization = os.getenv("PGVECTOR_QUANTIZATION", "none").lower()
+        self.pgvector_rescore_multiplier = int(os.getenv("PGVECTOR_RESCORE_MULTIPLIER", 4))
+        
+        # Retrieval mode: "hybrid" fuses vector and keyword rankings, "vector"
+        # uses keyword search only as a fallback
+        self.retrieval_mode = os.getenv("RETRIEVAL_MODE", "hybrid").lower()
+        self.hybrid_candidate_multiplier = int(os.getenv("HYBRID_CANDIDATE_MULTIPLIER", 4))
+        self.rrf_k = int(os.getenv("RRF_K", 60))
+        
+        # Two-stage (Matryoshka) retrieval: search the first N embedding dimensions,
+        # then re-rank the candidates with all of them (0 disables)
+        self.coarse_search_dimensions = int(os.getenv("COARSE_SEARCH_DIMENSIONS", 0))
+        
+        self.vector_index: Optional[LocalVectorIndex] = None
+        if self.vector_search_backend == "local":
+            self.vector_index = LocalVectorIndex.from_env(
+                self.supabase, self.embedding_dimension, self.coarse_search_dimensions
+            )
+        
+        # Per-user document and chunk counts with a document set version stamp
+        self.corpus = CorpusRegistry.from_env(self.supabase)
     
-    def generate_embeddings(self, texts: List[str], task_type: str = "RETRIEVAL_DOCUMENT") -> List[np.ndarray]:
+    async def generate_embeddings(
+        self,
+        texts: List[str],
+        task_type: str = "RETRIEVAL_DOCUMENT",
+        on_batch_complete: Optional[Callable[[int], Awaitable[None]]] = None
+    ) -> List[np.ndarray]:
         """
         Generate embeddings for a list of texts using Gemini.
         
+        Texts are split into size-bounded batches that run concurrently (at most
+        embedding_max_concurrency requests in flight per service). A failed batch is
+        retried on its own; results are reassembled in input order.
+        
         Args:
             texts: List of text strings to embed
             task_type: Task type for optimization (RETRIEVAL_DOCUMENT or QUESTION_ANSWERING)
+            on_batch_complete: Optional coroutine called with the size of each finished batch
             
         Returns:
-            List of normalized embedding vectors
+            List of normalized embedding vectors (empty if any batch ultimately failed)
         """
+        if not texts:
+            return []
+        
         try:
-            # Generate embeddings using Gemini
-            result = self.genai_client.models.embed_content(
-                model=self.embedding_model,
-                contents=texts,
-                config=types.EmbedContentConfig(
-                    task_type=task_type,
-                    output_dimensionality=self.embedding_dimension
-                )
-            )
+            batches = plan_embedding_batches(texts, self.embedding_batch_size, self.embedding_batch_max_chars)
+            
+            batch_results = await asyncio.gather(*[
+                self._embed_batch(texts[start:end], task_type, on_batch_complete) for start, end in batches
+            ])
             
-            # Convert to numpy arrays and normalize
-            embeddings = []
-            for embedding_obj in result.embeddings:
-                embedding_array = np.array(embedding_obj.values)
-                # Normalize for cosine similarity (required for dimensions other than 3072)
-                normalized_embedding = embedding_array / np.linalg.norm(embedding_array)
-                embeddings.append(normalized_embedding)
+            # Convert to one matrix and normalize every row at once
+            # (normalization is required for dimensions other than 3072)
+            matrix = np.vstack(batch_results)
+            norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+            norms[norms == 0] = 1.0
+            matrix /= norms
             
-            return embeddings
+            return list(matrix)
             
         except Exception as e:
             print(f"Error generating embeddings: {e}")
             return []
     
-    def chunk_text(self, text: str, chunk_size: int = 500, overlap: int = 50) -> List[str]:
+    async def _embed_batch(
+        self,
+        texts: List[str],
+        task_type: str,
+        on_batch_complete: Optional[Callable[[int], Awaitable[None]]] = None
+    ) -> np.ndarray:
+        """
+        Embed one batch with bounded concurrency, retrying with exponential backoff.
+        
+        Args:
+            texts: Texts in this batch
+            task_type: Task type for optimization
+            on_batch_complete: Optional coroutine called with len(texts) on success
+            
+        Returns:
+            Matrix of raw (unnormalized) embeddings, one row per text
+        """
+        for attempt in range(self.embedding_max_retries + 1):
+            try:
+                async with self._embedding_semaphore:
+                    GEMINI_CALLS.inc(operation="embed")
+                    result = await self.genai_client.aio.models.embed_content(
+                        model=self.embedding_model,
+                        contents=texts,
+                        config=types.EmbedContentConfig(
+                            task_type=task_type,
+                            output_dimensionality=self.embedding_dimension
+                        )
+                    )
+                
+                if len(result.embeddings) != len(texts):
+                    raise ValueError(f"Expected {len(texts)} embeddings, got {len(result.embeddings)}")
+                
+                embeddings = np.array([embedding_obj.values for embedding_obj in result.embeddings], dtype=np.float64)
+                
+                if on_batch_complete:
+                    await on_batch_complete(len(texts))
+                
+                return embeddings
+                
+            except Exception as e:
+                GEMINI_ERRORS.inc(operation="embed")
+                if attempt == self.embedding_max_retries:
+                    raise
+                delay = 0.5 * (2 ** attempt)
+                print(f"Embedding batch of {len(texts)} failed ({e}), retrying in {delay:.1f}s")
+                await asyncio.sleep(delay)
+    
+    async def embed_query(self, query: str, task_type: str = "QUESTION_ANSWERING") -> Optional[np.ndarray]:
+        """
+        Generate the embedding for a search query, using the query embedding cache.
+        
+        Concurrent requests for the same query (after normalization), task type
+        and model share one in-flight lookup and embed call.
+        
+        Args:
+            query: Query text
+            task_type: Task type for optimization
+            
+        Returns:
+            Normalized embedding vector, or None if generation failed
+        """
+        key = make_cache_key(query, task_type, self.embedding_model, self.embedding_dimension)
+        return await self.embedding_flights.run(key, lambda: self._embed_query(key, query, task_type))
+    
+    async def _embed_query(self, key: Tuple, query: str, task_type: str) -> Optional[np.ndarray]:
+        """Look up a query embedding in the cache, generating and caching it on a miss."""
+        with CHAT_STAGE_SECONDS.time(stage="query_embedding"):
+            cached = await self.query_embedding_cache.get(key)
+            if cached is not None:
+                return cached
+            
+            embeddings = await self.generate_embeddings([query], task_type=task_type)
+            if not embeddings:
+                return None
+            
+            await self.query_embedding_cache.set(key, embeddings[0])
+            return embeddings[0]
+    
+    def chunk_content_hash(self, chunk: str) -> str:
+        """
+        Content address for a chunk's embedding.
+        
+        Args:
+            chunk: Chunk text
+            
+        Returns:
+            SHA-256 hex digest of the embedding model, dimension and chunk text
+        """
+        payload = f"{self.embedding_model}\x1f{self.embedding_dimension}\x1f{chunk}"
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+    
+    async def lookup_chunk_embeddings(self, content_hashes: List[str]) -> Dict[str, np.ndarray]:
         """
-        Split text into overlapping chunks for better retrieval.
+        Fetch previously computed chunk embeddings from the content-addressed store.
         
         Args:
-            text: Text to chunk
-            chunk_size: Approximate number of words per chunk
-            overlap: Number of words to overlap between chunks
+            content_hashes: Hashes from chunk_content_hash
             
         Returns:
-            List of text chunks
+            Mapping of hash to embedding for the hashes that were found
+        """
+        found: Dict[str, np.ndarray] = {}
+        
+        try:
+            # Batch lookups to keep the PostgREST query string short
+            for i in range(0, len(content_hashes), CHUNK_EMBEDDING_LOOKUP_BATCH):
+                batch = content_hashes[i:i + CHUNK_EMBEDDING_LOOKUP_BATCH]
+                result = await self.supabase.table("chunk_embeddings").select(
+                    "content_hash, embedding"
+                ).in_("content_hash", batch).execute()
+                
+                for row in result.data or []:
+                    embedding = row["embedding"]
+                    # pgvector values come back from PostgREST as "[x,y,...]" strings
+                    if isinstance(embedding, str):
+                        embedding = json.loads(embedding)
+                    found[row["content_hash"]] = np.array(embedding)
+            
+        except Exception as e:
+            print(f"Error looking up chunk embeddings: {e}")
+        
+        return found
+    
+    async def save_chunk_embeddings(self, embeddings_by_hash: Dict[str, np.ndarray]) -> None:
         """
-        words = text.split()
-        chunks = []
+        Add newly computed chunk embeddings to the content-addressed store.
         
-        for i in range(0, len(words), chunk_size - overlap):
-            chunk = ' '.join(words[i:i + chunk_size])
-            if chunk.strip():
-                chunks.append(chunk.strip())
+        Args:
+            embeddings_by_hash: Mapping of chunk hash to embedding
+        """
+        if not embeddings_by_hash:
+            return
         
-        return chunks
+        try:
+            rows = [
+                {"content_hash": content_hash, "embedding": to_vector_literal(embedding)}
+                for content_hash, embedding in embeddings_by_hash.items()
+            ]
+            await self.supabase.table("chunk_embeddings").upsert(
+                rows, on_conflict="content_hash", ignore_duplicates=True, returning="minimal"
+            ).execute()
+            
+        except Exception as e:
+            print(f"Error saving chunk embeddings: {e}")
     
-    async def store_document_embeddings(self, document_id: str, content: str) -> bool:
+    async def store_chunk_stream(
+        self,
+        document_id: str,
+        chunks: AsyncIterable[Dict[str, Any]],
+        progress_callback: Optional[ProgressCallback] = None
+    ) -> Optional[Dict[str, Any]]:
         """
-        Process document content, generate embeddings, and store in database.
+        Embed and store a stream of chunks in rolling batches.
+        
+        At most ingestion_batch_chunks chunks are held at a time, so memory stays
+        bounded regardless of document size. Chunks whose embeddings are already in
+        the content-addressed store (from any earlier upload) are reused; only new
+        chunk texts are sent to Gemini.
         
         Args:
             document_id: UUID of the document
-            content: Full text content of the document
+            chunks: Chunks ({"content", "start_char", "end_char"}), in document order
+            progress_callback: Optional coroutine called with (chunks embedded, chunks seen so far)
             
         Returns:
-            True if successful, False otherwise
+            Ingestion statistics (chunks, embedded_chunks, cached_chunks, cache_hit_rate)
+            if successful, None otherwise
         """
         try:
             print(f"Starting embedding generation for document {document_id}")
             
-            # Chunk the document content
-            chunks = self.chunk_text(content)
-            print(f"Generated {len(chunks)} chunks")
+            stats = {"chunks": 0, "embedded_chunks": 0, "cached_chunks": 0}
+            batch: List[Dict[str, Any]] = []
+            
+            async for chunk in chunks:
+                batch.append(chunk)
+                if len(batch) >= self.ingestion_batch_chunks:
+                    if not await self._store_chunk_batch(document_id, batch, stats, progress_callback):
+                        return None
+                    batch = []
             
-            if not chunks:
+            if batch and not await self._store_chunk_batch(document_id, batch, stats, progress_callback):
+                return None
+            
+            print(f"Stored {stats['chunks']} chunks")
+            
+            if not stats["chunks"]:
                 print("No chunks generated from document content")
-                return False
+                return None
+            
+            stats["cache_hit_rate"] = stats["cached_chunks"] / stats["chunks"]
+            return stats
+            
+        except Exception as e:
+            print(f"Error storing document embeddings: {e}")
+            import traceback
+            traceback.print_exc()
+            return None
+    
+    async def _store_chunk_batch(
+        self,
+        document_id: str,
+        chunks: List[Dict[str, Any]],
+        stats: Dict[str, int],
+        progress_callback: Optional[ProgressCallback] = None
+    ) -> bool:
+        """
+        Embed and insert one batch of chunks, updating the running statistics.
+        
+        Args:
+            document_id: UUID of the document
+            chunks: Chunks in this batch; chunk indexes continue from stats["chunks"]
+            stats: Running counts (chunks, embedded_chunks, cached_chunks)
+            progress_callback: Optional coroutine called with (chunks embedded, chunks seen so far)
             
-            # Generate embeddings for all chunks
+        Returns:
+            True if every chunk in the batch was stored
+        """
+        first_index = stats["chunks"]
+        total = first_index + len(chunks)
+        
+        # Reuse stored embeddings for chunks we have seen before
+        texts = [chunk["content"] for chunk in chunks]
+        content_hashes = [self.chunk_content_hash(text) for text in texts]
+        unique_hashes = list(dict.fromkeys(content_hashes))
+        embeddings_by_hash = await self.lookup_chunk_embeddings(unique_hashes)
+        
+        chunk_by_hash = dict(zip(content_hashes, texts))
+        missing_hashes = [h for h in unique_hashes if h not in embeddings_by_hash]
+        print(f"Reusing {len(unique_hashes) - len(missing_hashes)} stored embeddings, {len(missing_hashes)} new chunks")
+        
+        # Progress counts chunks whose embedding is ready, reused ones included
+        embedded_count = total - len(missing_hashes)
+        if progress_callback:
+            await progress_callback(embedded_count, total)
+        
+        async def on_batch_complete(batch_size: int) -> None:
+            nonlocal embedded_count
+            embedded_count += batch_size
+            if progress_callback:
+                await progress_callback(embedded_count, total)
+        
+        if missing_hashes:
+            # Generate embeddings only for new chunks
             print("Generating embeddings with Gemini...")
-            embeddings = self.generate_embeddings(chunks, task_type="RETRIEVAL_DOCUMENT")
-            print(f"Generated {len(embeddings)} embeddings")
+            with INGESTION_STAGE_SECONDS.time(stage="embed"):
+                new_embeddings = await self.generate_embeddings(
+                    [chunk_by_hash[h] for h in missing_hashes],
+                    task_type="RETRIEVAL_DOCUMENT",
+                    on_batch_complete=on_batch_complete
+                )
+            print(f"Generated {len(new_embeddings)} embeddings")
             
-            if len(embeddings) != len(chunks):
-                print(f"Embedding count mismatch: {len(embeddings)} vs {len(chunks)}")
+            if len(new_embeddings) != len(missing_hashes):
+                print(f"Embedding count mismatch: {len(new_embeddings)} vs {len(missing_hashes)}")
                 return False
             
-            # Store chunks and embeddings in database
-            chunk_data = []
-            for i, (chunk, embedding) in enumerate(zip(chunks, embeddings)):
-                chunk_data.append({
-                    "document_id": document_id,
-                    "chunk_index": i,
-                    "content": chunk,
-                    "embedding": embedding.tolist()  # Convert numpy array to list for JSON
-                })
+            new_by_hash = dict(zip(missing_hashes, new_embeddings))
+            await self.save_chunk_embeddings(new_by_hash)
+            embeddings_by_hash.update(new_by_hash)
+        
+        # Store chunks and embeddings in database
+        chunk_data = []
+        for i, (chunk, content_hash) in enumerate(zip(chunks, content_hashes), first_index):
+            chunk_data.append({
+                "document_id": document_id,
+                "chunk_index": i,
+                "content": chunk["content"],
+                "start_char": chunk["start_char"],
+                "end_char": chunk["end_char"],
+                "embedding": to_vector_literal(embeddings_by_hash[content_hash])
+            })
+        
+        print(f"Inserting {len(chunk_data)} chunks into database...")
+        # Don't have PostgREST echo the inserted rows (and their embeddings) back
+        with INGESTION_STAGE_SECONDS.time(stage="insert"):
+            result = await self.supabase.table("document_chunks").insert(
+                chunk_data, count="exact", returning="minimal"
+            ).execute()
+        
+        success = result.count == len(chunk_data)
+        print(f"Database insertion {'successful' if success else 'failed'}")
+        
+        if success:
+            INGESTED_CHUNKS.inc(len(chunk_data))
+            stats["chunks"] = total
+            stats["embedded_chunks"] += len(missing_hashes)
+            stats["cached_chunks"] += len(chunks) - len(missing_hashes)
+        
+        return success
+    
+    def reassemble_chunks(self, chunks: List[Dict[str, Any]], overlap: int = 50) -> str:
+        """
+        Rebuild document text from its ordered chunks.
+        
+        Chunks with character offsets are stitched at their positions, keeping
+        the text's line breaks. Chunks stored before offsets were recorded are
+        500-word windows; their overlapping words are dropped and whitespace is
+        normalized to single spaces.
+        
+        Args:
+            chunks: Chunk rows (content, start_char, end_char) ordered by chunk_index
+            overlap: Word overlap of chunks without offsets
             
-            print(f"Inserting {len(chunk_data)} chunks into database...")
-            # Insert all chunks at once
-            result = self.supabase.table("document_chunks").insert(chunk_data).execute()
+        Returns:
+            Reassembled text
+        """
+        if chunks and all(chunk.get("start_char") is not None for chunk in chunks):
+            return stitch_chunks(chunks)
+        
+        parts = []
+        for i, chunk in enumerate(chunks):
+            words = chunk["content"].split()
+            parts.append(' '.join(words if i == 0 else words[overlap:]))
+        return ' '.join(part for part in parts if part)
+    
+    async def search_similar_chunks(
+        self,
+        query: str,
+        user_id: str = "anonymous",
+        limit: int = 5
+    ) -> List[Dict[str, Any]]:
+        """
+        Search for document chunks relevant to the query.
+        
+        In "hybrid" retrieval mode, vector and keyword search run concurrently and
+        their rankings are merged with reciprocal rank fusion. In "vector" mode,
+        keyword search is only used as a fallback when vector search fails.
+        
+        Args:
+            query: Search query text
+            user_id: User ID to filter documents
+            limit: Maximum number of chunks to return
             
-            success = len(result.data) == len(chunk_data)
-            print(f"Database insertion {'successful' if success else 'failed'}")
+        Returns:
+            List of relevant chunks with metadata
+        """
+        if self.retrieval_mode != "hybrid":
+            try:
+                return await self.vector_search(query, user_id, limit)
+            except Exception as e:
+                print(f"Error searching similar chunks: {e}")
+                # Fallback to keyword search if vector search fails
+                return await self.keyword_search(query, user_id, limit)
+        
+        candidates = limit * self.hybrid_candidate_multiplier
+        vector_results, keyword_results = await asyncio.gather(
+            self.vector_search(query, user_id, candidates),
+            self.keyword_search(query, user_id, candidates),
+            return_exceptions=True
+        )
+        
+        if isinstance(vector_results, Exception):
+            print(f"Error searching similar chunks: {vector_results}")
+            vector_results = []
+        if isinstance(keyword_results, Exception):
+            print(f"Error in keyword search: {keyword_results}")
+            keyword_results = []
+        
+        return reciprocal_rank_fusion([vector_results, keyword_results], limit, self.rrf_k)
+    
+    async def vector_search(
+        self,
+        query: str,
+        user_id: str = "anonymous",
+        limit: int = 5
+    ) -> List[Dict[str, Any]]:
+        """
+        Search for chunks by embedding similarity.
+        
+        Args:
+            query: Search query text
+            user_id: User ID to filter documents
+            limit: Maximum number of chunks to return
             
-            return success
+        Returns:
+            Chunks above the similarity threshold, most similar first
             
-        except Exception as e:
-            print(f"Error storing document embeddings: {e}")
-            import traceback
-            traceback.print_exc()
-            return False
+        Raises:
+            RuntimeError: If the query embedding could not be generated
+        """
+        # Generate embedding for the query (joining an in-flight request for it)
+        query_vector = await self.embed_query(query, task_type="QUESTION_ANSWERING")
+        
+        if query_vector is None:
+            raise RuntimeError("Failed to generate query embedding")
+        
+        with CHAT_STAGE_SECONDS.time(stage="vector_search"):
+            return await self._search_vectors(query_vector, user_id, limit)
+    
+    async def _search_vectors(self, query_vector: np.ndarray, user_id: str, limit: int) -> List[Dict[str, Any]]:
+        """Run the vector search for an embedded query on the configured backend."""
+        if self.vector_index is not None:
+            return await self.vector_index.search(
+                user_id, query_vector, limit, self.similarity_threshold
+            )
+        
+        query_embedding = to_vector_literal(query_vector)
+        
+        # Search for similar chunks using cosine similarity
+        # Note: Supabase uses 1 - cosine_distance for similarity
+        result = await self.supabase.rpc(
+            "search_document_chunks",
+            {
+                "query_embedding": query_embedding,
+                "user_id_filter": user_id,
+                "similarity_threshold": self.similarity_threshold,
+                "match_count": limit,
+                "ef_search": self.pgvector_ef_search,
+                "probes": self.pgvector_probes,
+                "quantization": self.pgvector_quantization,
+                "rescore_multiplier": self.pgvector_rescore_multiplier,
+                "coarse_dimensions": self.coarse_search_dimensions
+            }
+        ).execute()
+        
+        return result.data or []
     
-    async def search_similar_chunks(self, query: str, user_id: str = "anonymous", limit: int = 5) -> List[Dict[str, Any]]:
+    async def keyword_search(self, query: str, user_id: str = "anonymous", limit: int = 5) -> List[Dict[str, Any]]:
         """
-        Search for document chunks similar to the query.
+        Search for chunks by full-text match (GIN-indexed tsvector).
         
         Args:
             query: Search query text
@@ -150,52 +652,64 @@ class RAGService:
             limit: Maximum number of chunks to return
             
         Returns:
-            List of similar chunks with metadata
+            Chunks containing any of the query's terms, best matches first
         """
         try:
-            # Generate embedding for the query
-            query_embeddings = self.generate_embeddings([query], task_type="QUESTION_ANSWERING")
-            
-            if not query_embeddings:
-                print("Failed to generate query embedding")
-                return []
-            
-            query_embedding = query_embeddings[0].tolist()
-            
-            # Search for similar chunks using cosine similarity
-            # Note: Supabase uses 1 - cosine_distance for similarity
-            result = self.supabase.rpc(
-                "search_document_chunks",
-                {
-                    "query_embedding": query_embedding,
-                    "user_id_filter": user_id,
-                    "similarity_threshold": 0.7,
-                    "match_count": limit
-                }
-            ).execute()
+            with CHAT_STAGE_SECONDS.time(stage="keyword_search"):
+                result = await self.supabase.rpc(
+                    "search_document_chunks_text",
+                    {
+                        "query_text": query,
+                        "user_id_filter": user_id,
+                        "match_count": limit
+                    }
+                ).execute()
             
             return result.data or []
             
         except Exception as e:
-            print(f"Error searching similar chunks: {e}")
-            # Fallback to simple text search if vector search fails
-            try:
-                result = self.supabase.table("document_chunks").select(
-                    "*, documents!inner(user_id, filename)"
-                ).ilike("content", f"%{query}%").eq(
-                    "documents.user_id", user_id
-                ).limit(limit).execute()
-                
-                return result.data or []
-                
-            except Exception as fallback_error:
-                print(f"Fallback search also failed: {fallback_error}")
-                return []
+            print(f"Keyword search failed: {e}")
+            return []
+    
+    async def index_document(self, user_id: str, document_id: str) -> None:
+        """
+        Make a newly stored document searchable.
+        
+        The local vector index loads the document; the pgvector backend searches
+        the table directly.
+        
+        Args:
+            user_id: Owner of the document
+            document_id: ID of the document
+        """
+        if self.vector_index is not None:
+            await self.vector_index.add_document(user_id, document_id)
     
-    async def get_rag_context(self, query: str, user_id: str = "anonymous", max_chunks: int = 3) -> str:
+    def unindex_document(self, user_id: str, document_id: str) -> None:
+        """
+        Remove a deleted document from search.
+        
+        Args:
+            user_id: Owner of the document
+            document_id: ID of the document
+        """
+        if self.vector_index is not None:
+            self.vector_index.remove_document(user_id, document_id)
+    
+    async def get_rag_context(
+        self,
+        query: str,
+        user_id: str = "anonymous",
+        max_chunks: int = 3
+    ) -> str:
         """
         Get relevant context for RAG from document chunks.
         
+        Concurrent identical lookups (same user, normalized query and chunk
+        count) share one retrieval. The query is embedded through embed_query,
+        so a retrieval started alongside the caller's own embedding of the
+        question joins that call instead of making another.
+        
         Args:
             query: User's question/query
             user_id: User ID to filter documents
@@ -204,8 +718,14 @@ class RAGService:
         Returns:
             Formatted context string for the agent
         """
+        key = (user_id, normalize_text(query), max_chunks)
+        return await self.retrieval_flights.run(key, lambda: self._build_rag_context(query, user_id, max_chunks))
+    
+    async def _build_rag_context(self, query: str, user_id: str, max_chunks: int) -> str:
+        """Retrieve chunks for a query and format them as context for the agent."""
         try:
-            similar_chunks = await self.search_similar_chunks(query, user_id, max_chunks)
+            with CHAT_STAGE_SECONDS.time(stage="retrieval"):
+                similar_chunks = await self.search_similar_chunks(query, user_id, max_chunks)
             
             if not similar_chunks:
                 return ""
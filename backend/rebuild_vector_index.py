@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Rebuild the document chunk embedding index.
+
+Calls the rebuild_document_chunks_index database function, which is only
+executable by the service role, so SUPABASE_SERVICE_ROLE_KEY must be set.
+Run it after bulk uploads, or periodically for IVFFlat indexes, whose
+centroids only reflect the rows present when they were built.
+
+Usage:
+    python rebuild_vector_index.py                    # HNSW (default)
+    python rebuild_vector_index.py --type ivfflat     # lists sized from row count
+    python rebuild_vector_index.py --type ivfflat --lists 200
+    python rebuild_vector_index.py --quantization halfvec   # half-size index
+    python rebuild_vector_index.py --coarse-dimensions 256  # 256-dim prefix index
+"""
+
+import os
+import sys
+import asyncio
+import argparse
+from dotenv import load_dotenv
+from supabase import acreate_client
+
+
+async def rebuild(args: argparse.Namespace) -> bool:
+    """Run the rebuild and print the resulting index settings."""
+    supabase_url = os.getenv("SUPABASE_URL")
+    service_key = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
+
+    if not supabase_url or not service_key:
+        print("❌ SUPABASE_URL and SUPABASE_SERVICE_ROLE_KEY must be set")
+        return False
+
+    supabase = await acreate_client(supabase_url, service_key)
+
+    print(
+        f"🔧 Rebuilding document chunk index as {args.type} "
+        f"(quantization: {args.quantization}, coarse dimensions: {args.coarse_dimensions or 'all'})..."
+    )
+    try:
+        result = await supabase.rpc(
+            "rebuild_document_chunks_index",
+            {
+                "index_type": args.type,
+                "hnsw_m": args.m,
+                "hnsw_ef_construction": args.ef_construction,
+                "ivfflat_lists": args.lists,
+                "quantization": args.quantization,
+                "coarse_dimensions": args.coarse_dimensions
+            }
+        ).execute()
+    except Exception as e:
+        print(f"❌ Index rebuild failed: {e}")
+        print("   Large tables may exceed the API statement timeout; run")
+        print("   SELECT rebuild_document_chunks_index(...) in the SQL editor instead.")
+        return False
+
+    print(f"✅ Index rebuilt: {result.data}")
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rebuild the document chunk embedding index")
+    parser.add_argument("--type", choices=["hnsw", "ivfflat"], default="hnsw", help="Index type")
+    parser.add_argument("--m", type=int, default=16, help="HNSW graph degree")
+    parser.add_argument("--ef-construction", type=int, default=64, help="HNSW build candidate list size")
+    parser.add_argument("--lists", type=int, default=None, help="IVFFlat lists (default: sized from row count)")
+    parser.add_argument(
+        "--quantization", choices=["none", "halfvec", "binary"], default="none",
+        help="Index a quantized copy of the embeddings (set PGVECTOR_QUANTIZATION to match)"
+    )
+    parser.add_argument(
+        "--coarse-dimensions", type=int, default=0,
+        help="Index only this many leading (Matryoshka) dimensions (set COARSE_SEARCH_DIMENSIONS to match)"
+    )
+    args = parser.parse_args()
+
+    load_dotenv()
+    if not asyncio.run(rebuild(args)):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,190 @@
+"""
+Retrieval Router for Chat Questions
+
+Decides before retrieval whether a question needs the user's documents at all:
+small talk, requests to rework the previous answer (in a conversation that has
+one) and short generic definition questions are answered without retrieval, broad questions (summaries,
+comparisons, lists) get more chunks than usual, and everything else gets the
+normal amount. The decision uses cheap local pattern rules, so routing takes
+microseconds.
+"""
+
+import os
+import re
+import time
+from typing import Dict, Any, Optional, Tuple
+
+NO_RETRIEVAL = "none"
+RETRIEVE = "retrieve"
+RETRIEVE_MORE = "retrieve_more"
+
+ROUTES = (NO_RETRIEVAL, RETRIEVE, RETRIEVE_MORE)
+
+# Greetings and thanks with nothing but courtesy filler ("thanks so much",
+# "hi there"; "hi, what is hydrocephalus?" is a question), or a bare acknowledgement
+SMALL_TALK = re.compile(
+    r"^((ok|okay|cool|great|perfect|nice|got it)\W+)?"
+    r"(hi|hello|hey|good (morning|afternoon|evening)|thanks|thank you|thx|cheers|bye|goodbye)"
+    r"(\W+(there|so much|very much|a lot|again|doc|doctor|everyone|all|"
+    r"for (the|your|all the) (help|answer|answers|explanation)))*\W*$"
+    r"|^(ok|okay|cool|great|perfect|nice|got it|yes|no|sure)\W*$"
+)
+
+# Requests to rework the previous answer rather than ask something new: the
+# verb's object is the previous answer itself ("simplify that", "put it in a
+# table"), not something named after it ("explain how this procedure works")
+FOLLOW_UP = re.compile(
+    r"^((can|could|would|will) you |please )?(please )?"
+    r"(shorten|summari[sz]e|simplify|rephrase|reword|rewrite|expand( on)?|elaborate( on)?|"
+    r"explain|clarify|translate|repeat|continue|make|put|format)"
+    r" (that|this|it|your (last |previous )?(answer|response|reply))"
+    r"( (again|please|briefly|further|more|less|shorter|simpler|longer|clearer|"
+    r"more (simply|clearly|briefly|concisely)|in (more |less |greater )?detail|"
+    r"in (simple|simpler|plain|lay) (terms|words|english|language)|"
+    r"in (a |an )?(table|list|paragraph|sentence|few sentences|bullet points|bullets)|"
+    r"in \w+ (words|sentences|bullet points)|"
+    r"as (a |an )?(table|list|summary|paragraph|bullet points|bullets)|"
+    r"into \w+|for (me|a patient|patients))){0,2}\W*$"
+    r"|^(shorter|simpler|longer|more detail|less detail|tl;?dr|go on|continue|say that again|what do you mean)"
+    r"( please)?\W*$"
+)
+
+# Short "what is X" / "define X" questions about a general term of up to three
+# words (a preposition means a specific question, e.g. "the dose of mannitol")
+DEFINITION = re.compile(
+    r"^(what is|what's|what are|define|definition of|meaning of|what does) (a |an |the )?"
+    r"(?!.*\b(of|for|in|after|before|with|to|on|from|between|during|my|your)\b)"
+    r"[\w\-]+( [\w\-]+){0,2}( mean)?\W*$"
+)
+
+# Explicit references to the user's uploaded material
+DOCUMENT_REFERENCE = re.compile(
+    r"\b(my|our|the|this|these|uploaded|attached) (uploaded |attached )?"
+    r"(documents?|files?|papers?|notes|pdfs?|articles?|uploads?|guidelines?|protocols?|reports?)\b"
+    r"|\baccording to\b|\bin the (text|source|literature provided)\b"
+)
+
+# Broad questions that draw on many passages
+BROAD = re.compile(
+    r"^(summari[sz]e|give (me )?an overview|overview of|list (all|every|the)|compare|contrast)\b"
+    r"|\b(differences? between|compared? (to|with)|pros and cons|all (the )?(steps|options|types|risks|complications))\b"
+)
+
+# Questions at least this many words long are treated as broad
+LONG_QUESTION_WORDS = 40
+
+
+class RetrievalRouter:
+    def __init__(self, enabled: bool = True, chunks: int = 3, more_chunks: int = 6):
+        """
+        Initialize the router.
+
+        Args:
+            enabled: When False every question is routed to normal retrieval
+            chunks: Chunks retrieved for the "retrieve" route
+            more_chunks: Chunks retrieved for the "retrieve_more" route
+        """
+        self.enabled = enabled
+        self.chunks = chunks
+        self.more_chunks = more_chunks
+
+        self.counts: Dict[str, int] = {route: 0 for route in ROUTES}
+        self.routing_ms = 0.0
+        self.estimated_saved_ms = 0.0
+
+        # Moving average of retrieval latency, used to estimate what a skipped
+        # retrieval would have cost
+        self.average_retrieval_ms: Optional[float] = None
+
+    @classmethod
+    def from_env(cls, prefix: str = "RETRIEVAL_ROUTER") -> "RetrievalRouter":
+        """Create a router configured from <prefix> (on/off), <prefix>_CHUNKS and <prefix>_MORE_CHUNKS."""
+        return cls(
+            enabled=os.getenv(prefix, "on").lower() not in ("off", "false", "0"),
+            chunks=int(os.getenv(f"{prefix}_CHUNKS", 3)),
+            more_chunks=int(os.getenv(f"{prefix}_MORE_CHUNKS", 6))
+        )
+
+    def route(self, question: str, has_history: bool = False) -> Dict[str, Any]:
+        """
+        Choose how much retrieval a question needs.
+
+        Args:
+            question: The user's question
+            has_history: Whether the conversation has earlier turns; follow-ups
+                are only answered without retrieval when there is an answer to rework
+
+        Returns:
+            {"route", "reason", "max_chunks", "router_ms"}
+        """
+        start = time.perf_counter()
+        route, reason = self._classify(question, has_history)
+        router_ms = (time.perf_counter() - start) * 1000
+
+        self.counts[route] += 1
+        self.routing_ms += router_ms
+
+        return {
+            "route": route,
+            "reason": reason,
+            "max_chunks": {NO_RETRIEVAL: 0, RETRIEVE: self.chunks, RETRIEVE_MORE: self.more_chunks}[route],
+            "router_ms": router_ms
+        }
+
+    def is_follow_up(self, question: str) -> bool:
+        """Whether a question asks to rework the previous answer (callers load history only then)."""
+        return self.enabled and bool(FOLLOW_UP.match(_normalize(question)))
+
+    def record_retrieval(self, retrieval_ms: float) -> None:
+        """Update the retrieval latency average after a retrieval ran."""
+        if self.average_retrieval_ms is None:
+            self.average_retrieval_ms = retrieval_ms
+        else:
+            self.average_retrieval_ms += 0.1 * (retrieval_ms - self.average_retrieval_ms)
+
+    def record_skip(self) -> float:
+        """
+        Account for a skipped retrieval.
+
+        Returns:
+            Estimated milliseconds saved (the average retrieval latency so far)
+        """
+        saved = self.average_retrieval_ms or 0.0
+        self.estimated_saved_ms += saved
+        return saved
+
+    def stats(self) -> Dict[str, Any]:
+        """Return routing counters."""
+        total = sum(self.counts.values())
+        return {
+            "enabled": self.enabled,
+            "routes": dict(self.counts),
+            "average_router_ms": self.routing_ms / total if total else 0.0,
+            "average_retrieval_ms": self.average_retrieval_ms or 0.0,
+            "estimated_saved_ms": self.estimated_saved_ms
+        }
+
+    def _classify(self, question: str, has_history: bool) -> Tuple[str, str]:
+        """Return the route and a short reason for it."""
+        if not self.enabled:
+            return RETRIEVE, "router disabled"
+
+        text = _normalize(question)
+        broad = BROAD.search(text) or text.count("?") > 1 or len(text.split()) >= LONG_QUESTION_WORDS
+
+        if SMALL_TALK.match(text):
+            return NO_RETRIEVAL, "small talk"
+        if DOCUMENT_REFERENCE.search(text):
+            return (RETRIEVE_MORE, "broad question") if broad else (RETRIEVE, "refers to documents")
+        if has_history and FOLLOW_UP.match(text):
+            return NO_RETRIEVAL, "follow-up on previous answer"
+        if broad:
+            return RETRIEVE_MORE, "broad question"
+        if DEFINITION.match(text):
+            return NO_RETRIEVAL, "general definition"
+        return RETRIEVE, "default"
+
+
+def _normalize(question: str) -> str:
+    """Lowercase a question and collapse its whitespace."""
+    return " ".join(question.lower().split())
@@ -0,0 +1,86 @@
+"""
+Single-Flight Coalescing of Identical Concurrent Calls
+
+When several requests need the same result at the same time (the same
+question embedded, the same retrieval run), only the first starts the work;
+the others wait for its result instead of repeating the call. Nothing is kept
+once the call completes, so this complements caches rather than replacing
+them: it covers the window before a result exists to be cached.
+"""
+
+import asyncio
+from typing import Dict, Any, Callable, Awaitable, Hashable, List, TypeVar
+
+T = TypeVar("T")
+
+
+class SingleFlight:
+    def __init__(self, name: str):
+        """
+        Initialize a coalescing group.
+
+        Args:
+            name: Name reported in stats
+        """
+        self.name = name
+
+        # key -> [shared task, number of callers waiting on it]
+        self._flights: Dict[Hashable, List[Any]] = {}
+
+        self.calls = 0
+        self.coalesced = 0
+
+    async def run(self, key: Hashable, call: Callable[[], Awaitable[T]]) -> T:
+        """
+        Return call()'s result, sharing one in-flight call among concurrent callers with the same key.
+
+        A caller that is cancelled stops waiting without cancelling the shared
+        call, unless it was the last caller waiting for it. Errors are raised
+        to every caller.
+
+        Args:
+            key: Identifies calls with interchangeable results
+            call: Starts the work when no identical call is in flight
+
+        Returns:
+            The shared call's result
+        """
+        flight = self._flights.get(key)
+        if flight is None:
+            self.calls += 1
+            task = asyncio.ensure_future(call())
+            flight = self._flights[key] = [task, 0]
+            task.add_done_callback(lambda done: self._finish(key, done))
+        else:
+            self.coalesced += 1
+
+        task = flight[0]
+        flight[1] += 1
+        try:
+            return await asyncio.shield(task)
+        except asyncio.CancelledError:
+            if not task.done() and flight[1] == 1:
+                # Nobody else wants the result; later callers start afresh
+                task.cancel()
+                if self._flights.get(key) is flight:
+                    del self._flights[key]
+            raise
+        finally:
+            flight[1] -= 1
+
+    def stats(self) -> Dict[str, Any]:
+        """Return coalescing counters."""
+        requests = self.calls + self.coalesced
+        return {
+            "in_flight": len(self._flights),
+            "calls": self.calls,
+            "coalesced": self.coalesced,
+            "coalesced_rate": self.coalesced / requests if requests else 0.0
+        }
+
+    def _finish(self, key: Hashable, task: asyncio.Task) -> None:
+        if self._flights.get(key, [None])[0] is task:
+            del self._flights[key]
+        # Mark the outcome as retrieved, even if every caller was cancelled
+        if not task.cancelled():
+            task.exception()
@@ -0,0 +1,51 @@
+"""
+Shared test fixtures.
+
+Services run against the in-memory Supabase and Gemini stand-ins from
+benchmark_api, so the tests need no network access or credentials.
+"""
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmark_api import LocalSupabase, FakeGenaiClient  # noqa: E402 (sets placeholder credentials)
+from database import DatabaseService  # noqa: E402
+
+
+@pytest.fixture
+def supabase() -> LocalSupabase:
+    return LocalSupabase()
+
+
+@pytest.fixture
+def genai_client() -> FakeGenaiClient:
+    return FakeGenaiClient()
+
+
+@pytest.fixture
+def db_service(supabase: LocalSupabase) -> DatabaseService:
+    service = DatabaseService()
+    service.supabase = supabase
+    return service
+
+
+@pytest.fixture
+def rag_service(supabase: LocalSupabase, genai_client: FakeGenaiClient):
+    from rag_service import RAGService
+
+    service = RAGService(supabase)
+    service.genai_client = genai_client
+    return service
+
+
+@pytest.fixture
+def document_service(supabase: LocalSupabase, rag_service):
+    from document_service import DocumentService
+
+    service = DocumentService(supabase, rag_service)
+    yield service
+    service.extractor.shutdown()
@@ -0,0 +1,71 @@
+import numpy as np
+
+import answer_cache
+from answer_cache import SemanticAnswerCache
+
+
+ANSWER = {"answer": "A shunt drains CSF.", "rag_context_used": False}
+
+
+def test_near_duplicate_question_hits():
+    cache = SemanticAnswerCache(similarity_threshold=0.95)
+    cache.set("u1", 1, np.array([1.0, 0.0, 0.0]), ANSWER)
+
+    hit = cache.get("u1", 1, np.array([0.99, 0.05, 0.0]))
+
+    assert hit["answer"] == ANSWER["answer"]
+    assert hit["similarity"] > 0.95
+    assert cache.stats()["hits"] == 1
+
+
+def test_different_question_misses():
+    cache = SemanticAnswerCache(similarity_threshold=0.95)
+    cache.set("u1", 1, np.array([1.0, 0.0, 0.0]), ANSWER)
+
+    assert cache.get("u1", 1, np.array([0.0, 1.0, 0.0])) is None
+    assert cache.stats()["misses"] == 1
+
+
+def test_answers_are_per_user_and_per_document_version():
+    cache = SemanticAnswerCache()
+    vector = np.array([1.0, 0.0, 0.0])
+    cache.set("u1", 1, vector, ANSWER)
+
+    assert cache.get("u2", 1, vector) is None
+    assert cache.get("u1", 2, vector) is None
+    # The answer for the old version was discarded, not just skipped
+    assert cache.get("u1", 1, vector) is None
+
+
+def test_expired_answers_are_discarded(monkeypatch):
+    cache = SemanticAnswerCache(ttl_seconds=10)
+    now = [1000.0]
+    monkeypatch.setattr(answer_cache.time, "time", lambda: now[0])
+    cache.set("u1", 1, np.array([1.0, 0.0, 0.0]), ANSWER)
+
+    now[0] += 11
+
+    assert cache.get("u1", 1, np.array([1.0, 0.0, 0.0])) is None
+    assert cache.stats()["size"] == 0
+
+
+def test_least_recently_used_answer_is_evicted():
+    cache = SemanticAnswerCache(max_entries=2)
+    vectors = [np.eye(3)[index] for index in range(3)]
+    cache.set("u1", 1, vectors[0], {"answer": "a"})
+    cache.set("u1", 1, vectors[1], {"answer": "b"})
+    cache.get("u1", 1, vectors[0])
+    cache.set("u1", 1, vectors[2], {"answer": "c"})
+
+    assert cache.get("u1", 1, vectors[0])["answer"] == "a"
+    assert cache.get("u1", 1, vectors[1]) is None
+    assert cache.get("u1", 1, vectors[2])["answer"] == "c"
+
+
+def test_disabled_cache_stores_nothing():
+    cache = SemanticAnswerCache(max_entries=0)
+    cache.set("u1", 1, np.array([1.0, 0.0, 0.0]), ANSWER)
+
+    assert not cache.enabled
+    assert cache.get("u1", 1, np.array([1.0, 0.0, 0.0])) is None
+    assert cache.stats()["size"] == 0
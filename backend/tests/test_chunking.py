@@ -0,0 +1,88 @@
+import random
+import time
+
+from chunking import SentenceChunker, chunk_document, stitch_chunks
+
+
+def feed_in_pieces(text, piece_sizes, max_tokens, overlap_tokens, rng):
+    chunker = SentenceChunker(max_tokens, overlap_tokens)
+    chunks = []
+    position = 0
+    while position < len(text):
+        size = rng.choice(piece_sizes)
+        chunks += chunker.feed(text[position:position + size])
+        position += size
+    return chunks + chunker.finish()
+
+
+def test_streaming_matches_whole_text_for_any_split():
+    rng = random.Random(1)
+    vocabulary = ["word", "x", "é", ".", "!", "?", ")", '"', " ", "  ", "\n", "\n\n", "\t", "Dr.", "...", ".)", "a" * 50]
+
+    for _ in range(500):
+        weights = [rng.random() for _ in vocabulary]
+        text = "".join(rng.choices(vocabulary, weights, k=rng.randint(0, 300)))
+        max_tokens = rng.choice([2, 3, 5, 8, 20])
+        overlap_tokens = rng.choice([0, 1, 3, 10])
+
+        expected = chunk_document(text, max_tokens, overlap_tokens)
+        assert feed_in_pieces(text, [1, 2, 3, 7, 50], max_tokens, overlap_tokens, rng) == expected
+
+
+def test_chunks_keep_their_offsets():
+    text = "First sentence here. Second one follows!\n\nNew paragraph starts. " * 20
+
+    for chunk in chunk_document(text, max_tokens=12, overlap_tokens=4):
+        assert text[chunk["start_char"]:chunk["end_char"]] == chunk["content"]
+
+
+def test_stitched_chunks_rebuild_the_text():
+    text = "\n\n".join(f"Paragraph {index} has a sentence. And another one." for index in range(30))
+
+    assert stitch_chunks(chunk_document(text, max_tokens=10, overlap_tokens=5)) == text
+
+
+def test_boundary_free_text_is_cut_with_a_bounded_buffer():
+    text = "abcdefgh " * 1_000_000
+    chunker = SentenceChunker(max_tokens=512, overlap_tokens=64)
+    chunks = []
+    peak = 0
+
+    started = time.perf_counter()
+    for position in range(0, len(text), 4096):
+        chunks += chunker.feed(text[position:position + 4096])
+        peak = max(peak, len(chunker._buffer))
+    chunks += chunker.finish()
+    elapsed = time.perf_counter() - started
+
+    # Each piece is scanned once, so this takes well under a second rather than minutes
+    assert elapsed < 10
+    assert peak <= 2 * chunker.max_chars + 4096
+    assert all(len(chunk["content"]) <= chunker.max_chars for chunk in chunks)
+    assert chunks[-1]["end_char"] == len(text.rstrip())
+
+
+def test_text_without_whitespace_is_cut_at_the_budget():
+    chunker = SentenceChunker(max_tokens=16, overlap_tokens=0)
+    chunks = []
+    for _ in range(1000):
+        chunks += chunker.feed("x" * 100)
+        assert len(chunker._buffer) <= 2 * chunker.max_chars + 100
+    chunks += chunker.finish()
+
+    assert "".join(chunk["content"] for chunk in chunks) == "x" * 100_000
+    assert all(len(chunk["content"]) == chunker.max_chars for chunk in chunks[:-1])
+
+
+def test_long_punctuation_runs_stream_like_whole_text():
+    for text in ("!" * 200_000, ("word " * 600 + "!" * 3000 + " tail. ") * 20, "start " + "." * 50_000 + "\n\n end."):
+        chunker = SentenceChunker()
+        chunks = []
+        peak = 0
+        for position in range(0, len(text), 1000):
+            chunks += chunker.feed(text[position:position + 1000])
+            peak = max(peak, len(chunker._buffer))
+        chunks += chunker.finish()
+
+        assert chunks == chunk_document(text)
+        assert peak <= 2 * chunker.max_chars + 1000
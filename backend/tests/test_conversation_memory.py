@@ -0,0 +1,102 @@
+import asyncio
+
+from conversation_memory import ConversationMemory
+
+
+SESSION = "session-1"
+
+
+async def add_turns(db_service, count, start=0):
+    for index in range(start, start + count):
+        await db_service.append_chat_messages(SESSION, [
+            {"id": f"q{index}", "role": "user", "content": f"Question {index}"},
+            {"id": f"a{index}", "role": "assistant", "content": f"Answer {index}"}
+        ], "u1")
+    return await db_service.load_chat_message_range(SESSION, 1000)
+
+
+def test_load_skips_messages_the_summary_covers(db_service, genai_client):
+    memory = ConversationMemory(db_service, genai_client, window_turns=2, summary_batch_turns=2)
+
+    async def run():
+        messages = await add_turns(db_service, 3)
+        assert await db_service.save_session_summary(SESSION, "Asked about shunts.", messages[1]["cursor"])
+        return await memory.load(SESSION)
+
+    history = asyncio.run(run())
+    assert history["summary"] == "Asked about shunts."
+    assert [message["content"] for message in history["messages"]] == [
+        "Question 1", "Answer 1", "Question 2", "Answer 2"
+    ]
+
+
+def test_update_folds_turns_that_left_the_window(db_service, genai_client):
+    # Up to 4 unsummarized messages; folded one turn at a time
+    memory = ConversationMemory(db_service, genai_client, window_turns=1, summary_batch_turns=1)
+
+    async def run():
+        messages = await add_turns(db_service, 4)
+        extended = await memory.update(SESSION)
+        return messages, extended, await db_service.load_session_summary(SESSION), await memory.load(SESSION)
+
+    messages, extended, state, history = asyncio.run(run())
+    assert extended
+    assert genai_client.aio.models.generate_calls == 2
+    assert state["summary"]
+    assert state["summary_through"] == messages[3]["cursor"]
+    assert [message["content"] for message in history["messages"]] == [
+        "Question 2", "Answer 2", "Question 3", "Answer 3"
+    ]
+
+
+def test_update_waits_for_a_full_batch(db_service, genai_client):
+    memory = ConversationMemory(db_service, genai_client, window_turns=1, summary_batch_turns=2)
+
+    async def run():
+        await add_turns(db_service, 3)
+        return await memory.update(SESSION), await db_service.load_session_summary(SESSION)
+
+    extended, state = asyncio.run(run())
+    assert not extended
+    assert genai_client.aio.models.generate_calls == 0
+    assert state["summary_through"] is None
+
+
+def test_older_summary_does_not_replace_a_newer_one(db_service):
+    async def run():
+        messages = await add_turns(db_service, 2)
+        newer = await db_service.save_session_summary(SESSION, "Newer.", messages[3]["cursor"])
+        older = await db_service.save_session_summary(SESSION, "Older.", messages[1]["cursor"])
+        return messages, newer, older, await db_service.load_session_summary(SESSION)
+
+    messages, newer, older, state = asyncio.run(run())
+    assert newer and not older
+    assert state == {"summary": "Newer.", "summary_through": messages[3]["cursor"]}
+
+
+def test_drain_waits_for_scheduled_updates(db_service, genai_client):
+    genai_client.aio.models.generate_latency = 0.05
+    memory = ConversationMemory(db_service, genai_client, window_turns=1, summary_batch_turns=1)
+
+    async def run():
+        await add_turns(db_service, 3)
+        memory.schedule_update(SESSION)
+        await memory.drain()
+        return await db_service.load_session_summary(SESSION)
+
+    state = asyncio.run(run())
+    assert state["summary"]
+    assert not memory._summary_tasks
+
+
+def test_disabled_memory_loads_and_schedules_nothing(db_service, genai_client):
+    memory = ConversationMemory(db_service, genai_client, window_turns=0)
+
+    async def run():
+        await add_turns(db_service, 5)
+        memory.schedule_update(SESSION)
+        await memory.drain()
+        return await memory.load(SESSION)
+
+    assert asyncio.run(run()) == {"summary": "", "messages": []}
+    assert genai_client.aio.models.generate_calls == 0
@@ -0,0 +1,51 @@
+import asyncio
+
+import document_service as document_service_module
+from chunking import chunk_document
+
+TEXT = "\n\n".join(
+    " ".join(f"Sentence wörd{i} about spinal fusion {j}." for j in range(40)) for i in range(30)
+)
+
+
+def test_streamed_upload_matches_whole_text_chunking(supabase, document_service, tmp_path, monkeypatch):
+    path = tmp_path / "a.txt"
+    path.write_bytes(TEXT.encode())
+
+    async def run():
+        document = await document_service.upload_document_file("a.txt", str(path), "text/plain", "u1")
+        content = await document_service.get_document_content(document["id"], "u1")
+        return document, content
+
+    # Small reads split multi-byte characters across blocks
+    read_file = document_service_module.iter_text_from_file
+    monkeypatch.setattr(document_service_module, "iter_text_from_file", lambda path: read_file(path, 1000))
+    # Content is rebuilt from several pages of chunks
+    monkeypatch.setattr(document_service_module, "CHUNK_PAGE_SIZE", 7)
+    document, content = asyncio.run(run())
+
+    rows = sorted(supabase.tables["document_chunks"], key=lambda row: row["chunk_index"])
+    expected = chunk_document(TEXT, document_service.rag_service.chunk_max_tokens, document_service.rag_service.chunk_overlap_tokens)
+
+    assert document["content"] is None
+    assert document["ingestion"]["chunks"] == len(expected) > 2 * 7
+    assert [(row["content"], row["start_char"], row["end_char"]) for row in rows] == \
+        [(chunk["content"], chunk["start_char"], chunk["end_char"]) for chunk in expected]
+    assert content == TEXT
+
+
+def test_unsupported_type_is_rejected(supabase, document_service, tmp_path):
+    path = tmp_path / "a.doc"
+    path.write_bytes(b"\xd0\xcf\x11\xe0")
+
+    assert asyncio.run(document_service.upload_document_file("a.doc", str(path), "application/msword", "u1")) is None
+    assert not supabase.tables.get("documents")
+
+
+def test_upload_type_falls_back_to_the_file_extension():
+    import main
+
+    assert main.upload_mime_type("Notes.DOCX", "application/octet-stream") == main.DOCX_MIME_TYPE
+    assert main.upload_mime_type("scan.pdf", None) == main.PDF_MIME_TYPE
+    assert main.upload_mime_type("notes.md", None) == "text/plain"
+    assert main.upload_mime_type("notes.md", "text/markdown") == "text/markdown"
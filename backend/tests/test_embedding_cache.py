@@ -0,0 +1,85 @@
+import asyncio
+
+import numpy as np
+
+import embedding_cache
+from embedding_cache import EmbeddingCache, make_cache_key
+
+
+def key(text):
+    return make_cache_key(text, "QUESTION_ANSWERING", "model", 3)
+
+
+def test_keys_ignore_case_and_whitespace():
+    assert key("  What is  a SHUNT?\n") == key("what is a shunt?")
+    assert key("what is a shunt?") != make_cache_key("what is a shunt?", "RETRIEVAL_QUERY", "model", 3)
+
+
+def test_hits_return_read_only_vectors():
+    cache = EmbeddingCache(max_size=4)
+
+    async def run():
+        assert await cache.get(key("a")) is None
+        await cache.set(key("a"), [1.0, 2.0, 3.0])
+        return await cache.get(key("a"))
+
+    vector = asyncio.run(run())
+
+    assert vector.tolist() == [1.0, 2.0, 3.0]
+    assert not vector.flags.writeable
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = EmbeddingCache(max_size=2)
+
+    async def run():
+        await cache.set(key("a"), [1.0, 0.0, 0.0])
+        await cache.set(key("b"), [0.0, 1.0, 0.0])
+        await cache.get(key("a"))
+        await cache.set(key("c"), [0.0, 0.0, 1.0])
+        return [await cache.get(key(text)) is not None for text in "abc"]
+
+    assert asyncio.run(run()) == [True, False, True]
+    assert cache.stats()["evictions"] == 1
+
+
+def test_expired_entries_are_misses(monkeypatch):
+    cache = EmbeddingCache(ttl_seconds=10)
+    now = [1000.0]
+    monkeypatch.setattr(embedding_cache.time, "time", lambda: now[0])
+
+    async def run():
+        await cache.set(key("a"), [1.0, 0.0, 0.0])
+        now[0] += 11
+        return await cache.get(key("a"))
+
+    assert asyncio.run(run()) is None
+    assert cache.stats()["size"] == 0
+
+
+def test_disk_tier_survives_a_new_cache(tmp_path):
+    path = str(tmp_path / "embeddings.sqlite")
+
+    async def run():
+        await EmbeddingCache(db_path=path).set(key("a"), np.array([0.5, 0.5, 0.0]))
+        restarted = EmbeddingCache(db_path=path)
+        return restarted, await restarted.get(key("a"))
+
+    restarted, vector = asyncio.run(run())
+
+    assert vector.tolist() == [0.5, 0.5, 0.0]
+    assert restarted.stats()["disk_hits"] == 1
+
+
+def test_repeated_queries_are_embedded_once(rag_service, genai_client):
+    async def run():
+        first = await rag_service.embed_query("What is a shunt?")
+        second = await rag_service.embed_query("what is   a shunt?")
+        return first, second
+
+    first, second = asyncio.run(run())
+
+    assert genai_client.aio.models.embed_calls == 1
+    assert np.array_equal(first, second)
@@ -0,0 +1,150 @@
+import asyncio
+import os
+import time
+
+import docx
+import pytest
+
+import extraction
+from extraction import TextExtractor, ExtractionError, PDF_MIME_TYPE, DOCX_MIME_TYPE
+
+
+def make_pdf(pages):
+    """Build a minimal PDF with one text line per entry of each page."""
+    objects = {
+        1: b"<< /Type /Catalog /Pages 2 0 R >>",
+        3: b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"
+    }
+    kids = []
+    for index, lines in enumerate(pages):
+        page, content = 4 + 2 * index, 5 + 2 * index
+        kids.append(f"{page} 0 R")
+        stream = ("BT /F1 10 Tf 14 TL 40 800 Td " + " ".join(f"({line}) Tj T*" for line in lines) + " ET").encode()
+        objects[page] = (
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 842] "
+            f"/Resources << /Font << /F1 3 0 R >> >> /Contents {content} 0 R >>"
+        ).encode()
+        objects[content] = b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream"
+    objects[2] = f"<< /Type /Pages /Kids [{' '.join(kids)}] /Count {len(pages)} >>".encode()
+
+    output = b"%PDF-1.4\n"
+    offsets = {}
+    for number in sorted(objects):
+        offsets[number] = len(output)
+        output += b"%d 0 obj\n" % number + objects[number] + b"\nendobj\n"
+    xref = len(output)
+    output += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    for number in sorted(objects):
+        output += b"%010d 00000 n \n" % offsets[number]
+    output += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    return output
+
+
+def sleepy_pages(path, start, count):
+    """Stand-in for extract_pdf_pages that sleeps for the seconds in the file name (sleep-<seconds>.pdf)."""
+    time.sleep(float(os.path.basename(path)[len("sleep-"):-len(".pdf")]))
+    return [os.path.basename(path)], 1
+
+
+async def extract(extractor, path, mime_type):
+    return [piece async for piece in extractor.iter_text(path, mime_type)]
+
+
+@pytest.fixture
+def extractor():
+    extractor = TextExtractor(max_workers=2, timeout_seconds=30, pages_per_task=2)
+    yield extractor
+    extractor.shutdown()
+
+
+def test_pdf_pages_are_extracted_in_order(extractor, tmp_path):
+    path = tmp_path / "notes.pdf"
+    path.write_bytes(make_pdf([[f"Page {index} text."] for index in range(5)]))
+
+    pieces = asyncio.run(extract(extractor, str(path), PDF_MIME_TYPE))
+
+    assert pieces == [f"Page {index} text.\n\n" for index in range(5)]
+
+
+def test_docx_paragraphs_and_tables_are_extracted(extractor, tmp_path):
+    document = docx.Document()
+    document.add_paragraph("First paragraph.")
+    document.add_paragraph("")
+    document.add_paragraph("Second paragraph.")
+    table = document.add_table(rows=1, cols=2)
+    table.rows[0].cells[0].text = "Drug"
+    table.rows[0].cells[1].text = "Dose"
+    path = tmp_path / "notes.docx"
+    document.save(str(path))
+
+    pieces = asyncio.run(extract(extractor, str(path), DOCX_MIME_TYPE))
+
+    assert pieces == ["First paragraph.\n\n", "Second paragraph.\n\n", "Drug | Dose\n\n"]
+
+
+def test_unreadable_file_raises_and_keeps_the_worker(extractor, tmp_path):
+    bad = tmp_path / "bad.pdf"
+    bad.write_bytes(b"not a pdf")
+    good = tmp_path / "good.pdf"
+    good.write_bytes(make_pdf([["Fine."]]))
+
+    async def run():
+        with pytest.raises(ExtractionError):
+            await extract(extractor, str(bad), PDF_MIME_TYPE)
+        return await extract(extractor, str(good), PDF_MIME_TYPE)
+
+    assert asyncio.run(run()) == ["Fine.\n\n"]
+    assert len(extractor._workers) == 1
+
+
+def test_unsupported_type_is_rejected(extractor):
+    assert not extractor.supports("text/plain")
+    with pytest.raises(ExtractionError):
+        asyncio.run(extract(extractor, "notes.txt", "text/plain"))
+
+
+def test_timeout_stops_only_that_files_worker(monkeypatch):
+    monkeypatch.setattr(extraction, "extract_pdf_pages", sleepy_pages)
+    extractor = TextExtractor(max_workers=2, timeout_seconds=4, pages_per_task=1)
+
+    async def run():
+        # Start both workers so process start-up doesn't count against the timing below
+        await asyncio.gather(
+            extract(extractor, "sleep-0.pdf", PDF_MIME_TYPE), extract(extractor, "sleep-0.pdf", PDF_MIME_TYPE)
+        )
+
+        slow = asyncio.ensure_future(extract(extractor, "sleep-60.pdf", PDF_MIME_TYPE))
+        await asyncio.sleep(2)
+        # Still parsing when the slow file times out
+        other = await extract(extractor, "sleep-3.pdf", PDF_MIME_TYPE)
+        with pytest.raises(ExtractionError, match="timed out"):
+            await slow
+        return other
+
+    try:
+        assert asyncio.run(run()) == ["sleep-3.pdf\n\n"]
+        assert extractor.timeouts == 1
+    finally:
+        extractor.shutdown()
+
+
+def test_time_spent_consuming_pages_does_not_count_against_the_timeout(tmp_path):
+    path = tmp_path / "notes.pdf"
+    path.write_bytes(make_pdf([[f"Page {index} text."] for index in range(5)]))
+    extractor = TextExtractor(max_workers=1, timeout_seconds=3, pages_per_task=1)
+
+    async def run():
+        # Start the worker so process start-up doesn't count against the timing below
+        await extract(extractor, str(path), PDF_MIME_TYPE)
+        pieces = []
+        async for piece in extractor.iter_text(str(path), PDF_MIME_TYPE):
+            pieces.append(piece)
+            # Like chunking and embedding a page; 5s in total, parsing only milliseconds
+            await asyncio.sleep(1)
+        return pieces
+
+    try:
+        assert len(asyncio.run(run())) == 5
+        assert extractor.timeouts == 0
+    finally:
+        extractor.shutdown()
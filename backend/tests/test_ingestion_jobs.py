@@ -0,0 +1,113 @@
+import asyncio
+
+from ingestion_jobs import IngestionQueue, COMPLETED, FAILED, QUEUED, _now
+
+TEXT = "\n\n".join(" ".join(f"Sentence {j} of paragraph {i} about the spine." for j in range(20)) for i in range(10))
+
+
+async def blocks(data: bytes, size: int = 1000):
+    for start in range(0, len(data), size):
+        yield data[start:start + size]
+
+
+def test_job_is_processed_in_the_background(supabase, document_service, tmp_path):
+    async def run():
+        queue = IngestionQueue(supabase, document_service, spool_dir=str(tmp_path))
+        await queue.start()
+        try:
+            job = await queue.submit("a.txt", blocks(TEXT.encode()), "text/plain", "u1")
+            assert job["status"] == QUEUED
+            assert job["claimed_by"] == queue.instance_id
+            await queue.queue.join()
+            return queue, await queue.get_job(job["id"], "u1")
+        finally:
+            await queue.stop()
+
+    queue, job = asyncio.run(run())
+    assert job["status"] == COMPLETED
+    assert job["chunks_embedded"] == job["chunks_total"] > 0
+    assert not queue._owned
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_live_lease_is_not_taken_over(supabase, document_service, tmp_path):
+    async def run():
+        owner = IngestionQueue(supabase, document_service, spool_dir=str(tmp_path))
+        restarted = IngestionQueue(supabase, document_service, spool_dir=str(tmp_path))
+
+        # The owner's workers are busy, so the job waits in its queue
+        job = await owner.submit("a.txt", blocks(TEXT.encode()), "text/plain", "u1")
+        await restarted._resume_interrupted_jobs()
+        return job, restarted, await owner.get_job(job["id"], "u1")
+
+    job, restarted, stored = asyncio.run(run())
+    assert restarted.queue.empty()
+    assert stored["claimed_by"] != restarted.instance_id
+    assert stored["attempts"] == 1
+
+
+def test_expired_lease_is_taken_over_once(supabase, document_service, tmp_path):
+    async def run():
+        owner = IngestionQueue(supabase, document_service, spool_dir=str(tmp_path), lease_seconds=60)
+        job = await owner.submit("a.txt", blocks(TEXT.encode()), "text/plain", "u1")
+
+        # The owner died two minutes ago
+        await supabase.table("ingestion_jobs").update({"heartbeat_at": _now(-120)}).eq("id", job["id"]).execute()
+
+        first = IngestionQueue(supabase, document_service, spool_dir=str(tmp_path))
+        second = IngestionQueue(supabase, document_service, spool_dir=str(tmp_path))
+        await asyncio.gather(first._resume_interrupted_jobs(), second._resume_interrupted_jobs())
+        return first, second, await owner.get_job(job["id"], "u1")
+
+    first, second, stored = asyncio.run(run())
+    assert first.queue.qsize() + second.queue.qsize() == 1
+    winner = first if first.queue.qsize() else second
+    assert stored["claimed_by"] == winner.instance_id
+    assert stored["attempts"] == 2
+
+
+def test_leases_are_renewed_while_jobs_are_owned(supabase, document_service, tmp_path):
+    async def run():
+        queue = IngestionQueue(supabase, document_service, spool_dir=str(tmp_path), lease_seconds=0.3)
+        job = await queue.submit("a.txt", blocks(TEXT.encode()), "text/plain", "u1")
+        before = (await queue.get_job(job["id"], "u1"))["heartbeat_at"]
+
+        renewal = asyncio.create_task(queue._renew_leases())
+        await asyncio.sleep(0.25)
+        renewal.cancel()
+        return before, (await queue.get_job(job["id"], "u1"))["heartbeat_at"]
+
+    before, after = asyncio.run(run())
+    assert after > before
+
+
+def test_failed_job_removes_its_upload_and_deletes_partial_output_through_the_service(
+    supabase, document_service, tmp_path, monkeypatch
+):
+    deleted = []
+
+    async def delete_document(document_id, user_id="anonymous"):
+        deleted.append((document_id, user_id))
+        return False
+
+    async def upload_document_file(**kwargs):
+        raise RuntimeError("embedding service unavailable")
+
+    monkeypatch.setattr(document_service, "delete_document", delete_document)
+    monkeypatch.setattr(document_service, "upload_document_file", upload_document_file)
+
+    async def run():
+        queue = IngestionQueue(supabase, document_service, spool_dir=str(tmp_path))
+        await queue.start()
+        try:
+            job = await queue.submit("a.txt", blocks(TEXT.encode()), "text/plain", "u1")
+            await queue.queue.join()
+            return job, await queue.get_job(job["id"], "u1")
+        finally:
+            await queue.stop()
+
+    job, stored = asyncio.run(run())
+    assert stored["status"] == FAILED
+    assert "embedding service unavailable" in stored["error"]
+    assert deleted == [(job["document_id"], "u1")]
+    assert list(tmp_path.iterdir()) == []
@@ -0,0 +1,79 @@
+from metrics import MetricsRegistry
+
+
+def test_counter_renders_labelled_samples():
+    registry = MetricsRegistry()
+    requests = registry.counter("requests_total", "Requests", ["endpoint"])
+    requests.inc(endpoint="chat")
+    requests.inc(2, endpoint="chat")
+    requests.inc(endpoint='say "hi"\n')
+
+    assert requests.value(endpoint="chat") == 3
+    assert registry.render() == (
+        "# HELP requests_total Requests\n"
+        "# TYPE requests_total counter\n"
+        'requests_total{endpoint="chat"} 3\n'
+        'requests_total{endpoint="say \\"hi\\"\\n"} 1\n'
+    )
+
+
+def test_histogram_buckets_are_cumulative():
+    registry = MetricsRegistry()
+    latency = registry.histogram("latency_seconds", "Latency", ["stage"], buckets=(0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 2.0):
+        latency.observe(value, stage="embed")
+
+    samples = latency.samples()
+
+    assert samples == [
+        'latency_seconds_bucket{stage="embed",le="0.1"} 2',
+        'latency_seconds_bucket{stage="embed",le="1"} 3',
+        'latency_seconds_bucket{stage="embed",le="+Inf"} 4',
+        'latency_seconds_sum{stage="embed"} 2.65',
+        'latency_seconds_count{stage="embed"} 4',
+    ]
+    assert latency.count(stage="embed") == 4
+
+
+def test_histogram_times_a_block():
+    registry = MetricsRegistry()
+    latency = registry.histogram("latency_seconds", "Latency", ["stage"])
+
+    with latency.time(stage="search"):
+        pass
+
+    assert latency.count(stage="search") == 1
+
+
+def test_gauge_tracks_blocks_in_progress():
+    registry = MetricsRegistry()
+    in_flight = registry.gauge("in_flight", "In flight", ["kind"])
+
+    with in_flight.track_in_progress(kind="chat"):
+        assert in_flight.value(kind="chat") == 1
+    assert in_flight.value(kind="chat") == 0
+
+
+def test_function_metrics_are_read_at_scrape_time():
+    registry = MetricsRegistry()
+    size = {"value": 1}
+    registry.gauge("cache_entries", "Entries", ["cache"], lambda: {("answer",): size["value"], ("unused",): None})
+    registry.counter("broken_total", "Broken", function=lambda: 1 / 0)
+
+    size["value"] = 5
+    rendered = registry.render()
+
+    assert 'cache_entries{cache="answer"} 5' in rendered
+    assert "unused" not in rendered
+    assert "# TYPE broken_total counter" in rendered
+
+
+def test_metrics_endpoint_serves_the_text_format():
+    from fastapi.testclient import TestClient
+    import main
+
+    response = TestClient(main.app).get("/metrics")
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    assert "# TYPE neurosurgery_chat_stage_seconds histogram" in response.text
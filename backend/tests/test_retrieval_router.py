@@ -0,0 +1,86 @@
+import pytest
+
+from retrieval_router import RetrievalRouter, NO_RETRIEVAL, RETRIEVE, RETRIEVE_MORE
+
+
+@pytest.fixture
+def router():
+    return RetrievalRouter()
+
+
+@pytest.mark.parametrize("question", [
+    "Can you explain what a lumbar drain is and when it is used?",
+    "Explain how this procedure affects recovery after microdiscectomy",
+    "Could you make a checklist for post-op care after this surgery?",
+    "Can you clarify the dosing of dexamethasone in this protocol?",
+    "Explain this procedure",
+    "Summarize this document",
+])
+def test_questions_naming_their_subject_are_retrieved(router, question):
+    assert router.route(question, has_history=True)["route"] != NO_RETRIEVAL
+
+
+@pytest.mark.parametrize("question", [
+    "Can you simplify that?",
+    "explain that again",
+    "Please rephrase your last answer",
+    "Could you put it in a table?",
+    "make it shorter please",
+    "translate that into Spanish",
+    "Elaborate on this in more detail",
+    "tl;dr",
+    "shorter",
+])
+def test_follow_ups_skip_retrieval_with_history(router, question):
+    routing = router.route(question, has_history=True)
+
+    assert routing["route"] == NO_RETRIEVAL
+    assert routing["max_chunks"] == 0
+    assert router.is_follow_up(question)
+
+
+def test_follow_ups_are_retrieved_without_history(router):
+    assert router.route("Can you simplify that?")["route"] == RETRIEVE
+    assert router.route("Can you simplify that?", has_history=False)["route"] == RETRIEVE
+
+
+def test_document_references_win_over_follow_ups(router):
+    assert router.route("Explain this document", has_history=True)["route"] == RETRIEVE
+    assert router.route("Summarize my uploaded notes", has_history=True)["route"] == RETRIEVE_MORE
+
+
+@pytest.mark.parametrize("question", [
+    "thanks!",
+    "Hi there",
+    "Thank you so much for the explanation!",
+    "ok, thanks again doc",
+    "good morning everyone",
+])
+def test_small_talk_skips_retrieval(router, question):
+    assert router.route(question)["route"] == NO_RETRIEVAL
+
+
+@pytest.mark.parametrize("question", [
+    "hi, what is hydrocephalus?",
+    "thanks, what about dosing?",
+    "Hello, ependymoma treatment options?",
+    "hey is glioblastoma curable",
+])
+def test_greetings_followed_by_a_question_are_retrieved(router, question):
+    assert router.route(question)["route"] != NO_RETRIEVAL
+
+
+@pytest.mark.parametrize("question, route", [
+    ("What is hydrocephalus?", NO_RETRIEVAL),
+    ("What is the dose of mannitol for raised ICP?", RETRIEVE),
+    ("Compare ACDF with posterior foraminotomy", RETRIEVE_MORE),
+])
+def test_other_routes(router, question, route):
+    assert router.route(question)["route"] == route
+
+
+def test_disabled_router_always_retrieves():
+    router = RetrievalRouter(enabled=False)
+
+    assert router.route("explain that again", has_history=True)["route"] == RETRIEVE
+    assert not router.is_follow_up("explain that again")
@@ -0,0 +1,90 @@
+import asyncio
+from urllib.parse import quote
+
+import pytest
+
+from database import encode_session_cursor, decode_session_cursor
+
+
+def test_cursor_round_trips_and_is_url_safe():
+    cursor = encode_session_cursor("2025-01-02T03:04:05.678+00:00", "session/1")
+
+    assert quote(cursor, safe="") == cursor
+    assert decode_session_cursor(cursor) == ("2025-01-02T03:04:05.678+00:00", "session/1")
+
+
+@pytest.mark.parametrize("cursor", ["", "not a cursor", "2025-01-02T03:04:05+00:00|abc", encode_session_cursor("a", "b")[:-3]])
+def test_malformed_cursor_is_rejected(cursor):
+    with pytest.raises(ValueError):
+        decode_session_cursor(cursor)
+
+
+def test_sessions_page_through_with_cursor(db_service):
+    async def run():
+        for index in range(5):
+            await db_service.append_chat_messages(
+                f"session-{index}", [{"id": f"m{index}", "role": "user", "content": f"Question {index}"}], "u1"
+            )
+
+        seen = []
+        cursor = None
+        while True:
+            page = await db_service.get_user_sessions("u1", limit=2, cursor=cursor)
+            seen.extend(session["session_id"] for session in page["sessions"])
+            cursor = page["next_cursor"]
+            if cursor is None:
+                return seen
+
+    seen = asyncio.run(run())
+    assert sorted(seen) == [f"session-{index}" for index in range(5)]
+    assert len(set(seen)) == 5
+
+
+def test_malformed_cursor_is_not_an_empty_page(db_service):
+    with pytest.raises(ValueError):
+        asyncio.run(db_service.get_user_sessions("u1", limit=2, cursor="garbage"))
+
+
+def test_sessions_endpoint_rejects_malformed_cursor():
+    from fastapi.testclient import TestClient
+    import main
+
+    response = TestClient(main.app).get("/api/sessions", params={"user_id": "u1", "limit": 2, "cursor": "garbage"})
+
+    assert response.status_code == 400
+
+
+def test_session_list_waits_only_for_that_users_saves(monkeypatch):
+    import main
+
+    async def run():
+        other_user_save = asyncio.get_running_loop().create_future()
+        own_save = asyncio.ensure_future(asyncio.sleep(0))
+        monkeypatch.setattr(main, "pending_chat_saves", {"mine": own_save, "theirs": other_user_save})
+        monkeypatch.setattr(main, "pending_chat_save_users", {"mine": "u1", "theirs": "u2"})
+
+        await asyncio.wait_for(main.wait_for_chat_saves(user_id="u1"), timeout=1)
+        assert own_save.done()
+        assert not other_user_save.done()
+
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(main.wait_for_chat_saves(), timeout=0.05)
+
+    asyncio.run(run())
+
+
+def test_whole_session_loads_past_one_page(db_service, monkeypatch):
+    import database
+
+    monkeypatch.setattr(database, "MESSAGE_PAGE_SIZE", 3)
+
+    async def run():
+        for index in range(8):
+            await db_service.append_chat_messages(
+                "long-session", [{"id": f"m{index}", "role": "user", "content": f"Question {index}"}], "u1"
+            )
+        return await db_service.load_chat_session("long-session")
+
+    messages = asyncio.run(run())
+
+    assert [message["id"] for message in messages] == [f"m{index}" for index in range(8)]
@@ -0,0 +1,89 @@
+import asyncio
+
+import pytest
+
+from single_flight import SingleFlight
+
+
+def test_concurrent_calls_with_the_same_key_share_one_call():
+    flights = SingleFlight("test")
+    started = []
+
+    async def call(value):
+        started.append(value)
+        await asyncio.sleep(0.01)
+        return value
+
+    async def run():
+        return await asyncio.gather(
+            flights.run("a", lambda: call(1)),
+            flights.run("a", lambda: call(2)),
+            flights.run("b", lambda: call(3))
+        )
+
+    assert asyncio.run(run()) == [1, 1, 3]
+    assert started == [1, 3]
+    assert flights.stats()["calls"] == 2
+    assert flights.stats()["coalesced"] == 1
+    assert flights.stats()["in_flight"] == 0
+
+
+def test_errors_reach_every_caller():
+    flights = SingleFlight("test")
+
+    async def fail():
+        await asyncio.sleep(0.01)
+        raise ValueError("boom")
+
+    async def run():
+        return await asyncio.gather(
+            flights.run("a", fail), flights.run("a", fail), return_exceptions=True
+        )
+
+    results = asyncio.run(run())
+    assert all(isinstance(result, ValueError) for result in results)
+    assert flights.stats()["calls"] == 1
+
+
+def test_cancelled_caller_leaves_the_shared_call_running():
+    flights = SingleFlight("test")
+
+    async def run():
+        first = asyncio.ensure_future(flights.run("a", lambda: asyncio.sleep(0.02, result="done")))
+        second = asyncio.ensure_future(flights.run("a", lambda: asyncio.sleep(0.02, result="other")))
+        await asyncio.sleep(0)
+        first.cancel()
+        return await second
+
+    assert asyncio.run(run()) == "done"
+
+
+def test_last_cancelled_caller_cancels_the_call():
+    flights = SingleFlight("test")
+    finished = []
+
+    async def call():
+        await asyncio.sleep(0.05)
+        finished.append(True)
+
+    async def run():
+        waiter = asyncio.ensure_future(flights.run("a", call))
+        await asyncio.sleep(0)
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        await asyncio.sleep(0.1)
+
+    asyncio.run(run())
+    assert finished == []
+    assert flights.stats()["in_flight"] == 0
+
+
+def test_concurrent_identical_queries_are_embedded_once(rag_service, genai_client):
+    async def run():
+        return await asyncio.gather(*(rag_service.embed_query("What is a shunt?") for _ in range(5)))
+
+    vectors = asyncio.run(run())
+
+    assert genai_client.aio.models.embed_calls == 1
+    assert all((vector == vectors[0]).all() for vector in vectors)
@@ -0,0 +1,118 @@
+import asyncio
+import threading
+
+import numpy as np
+
+from vector_index import UserShard, LocalVectorIndex
+
+
+def unit(vector):
+    vector = np.asarray(vector, dtype=np.float32)
+    return vector / np.linalg.norm(vector)
+
+
+def document(document_id, vectors):
+    rows = [{"id": f"{document_id}-{index}", "document_id": document_id} for index in range(len(vectors))]
+    return rows, np.vstack([unit(vector) for vector in vectors])
+
+
+def test_search_ranks_by_cosine_similarity():
+    shard = UserShard(dimension=3, ann_threshold=1000)
+    shard.set_document("a", *document("a", [[1, 0, 0], [0, 1, 0]]))
+    shard.set_document("b", *document("b", [[1, 1, 0]]))
+
+    results = shard.search(np.array([1, 0.1, 0]), limit=2, threshold=0.0)
+
+    assert [row["id"] for row in results] == ["a-0", "b-0"]
+    assert results[0]["similarity"] > results[1]["similarity"]
+
+
+def test_removed_document_is_not_returned():
+    shard = UserShard(dimension=3, ann_threshold=1000)
+    shard.set_document("a", *document("a", [[1, 0, 0]]))
+    shard.search(np.array([1, 0, 0]), limit=5, threshold=0.0)
+
+    shard.remove_document("a")
+
+    assert shard.search(np.array([1, 0, 0]), limit=5, threshold=0.0) == []
+
+
+class PausingShard(UserShard):
+    """Pauses its build after the first document, so a change can land mid-build."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.building = threading.Event()
+        self.resume = threading.Event()
+
+    def _build_structures(self, documents):
+        def pausing():
+            for index, item in enumerate(documents.values()):
+                if index == 1:
+                    self.building.set()
+                    self.resume.wait(5)
+                yield item
+        return super()._build_structures(dict(zip(documents.keys(), pausing())))
+
+
+def test_change_during_build_is_not_lost():
+    shard = PausingShard(dimension=3, ann_threshold=1000)
+    shard.set_documents({
+        "a": document("a", [[1, 0, 0]]),
+        "b": document("b", [[0, 1, 0]])
+    })
+
+    results = []
+    search = threading.Thread(target=lambda: results.append(shard.search(np.array([0, 0, 1]), 5, -1.0)))
+    search.start()
+    assert shard.building.wait(5)
+
+    # Loop-thread changes while the worker thread is iterating its snapshot
+    shard.set_document("c", *document("c", [[0, 0, 1]]))
+    shard.remove_document("a")
+    shard.resume.set()
+    search.join(5)
+
+    # The racing search saw its snapshot; the next one sees the changes
+    assert {row["document_id"] for row in results[0]} == {"a", "b"}
+    assert {row["document_id"] for row in shard.search(np.array([0, 0, 1]), 5, -1.0)} == {"b", "c"}
+
+
+def stored_chunk(document_id, vector):
+    return {"id": f"{document_id}-0", "document_id": document_id, "chunk_index": 0, "content": document_id,
+            "embedding": vector, "documents": {"filename": f"{document_id}.txt"}}
+
+
+def test_change_during_shard_load_is_not_lost():
+    index = LocalVectorIndex(None, dimension=3)
+    stored = {"a": stored_chunk("a", [1, 0, 0]), "b": stored_chunk("b", [0, 1, 0])}
+
+    async def run():
+        fetched = asyncio.Event()
+        resume = asyncio.Event()
+        loads = []
+
+        async def fetch_chunks(user_id, document_id=None):
+            snapshot = list(stored.values())
+            loads.append(snapshot)
+            if len(loads) == 1:
+                # Read before the deletion, returned after it
+                fetched.set()
+                await resume.wait()
+            return snapshot
+
+        index._fetch_chunks = fetch_chunks
+        search = asyncio.ensure_future(index.search("u1", np.array([1, 0, 0]), limit=5, threshold=-1.0))
+        await fetched.wait()
+
+        del stored["a"]
+        index.remove_document("u1", "a")
+        resume.set()
+
+        return await search, len(loads)
+
+    results, loads = asyncio.run(run())
+
+    assert loads == 2
+    assert [row["document_id"] for row in results] == ["b"]
+    assert "a" not in index._shards["u1"].documents
@@ -0,0 +1,443 @@
+"""
+In-Process Vector Index for Document Chunks
+
+Alternative to the search_document_chunks RPC: each user's chunk embeddings are
+loaded once into memory and searched locally, with exact matrix search for small
+shards and an HNSW graph (via the optional hnswlib package) for large ones.
+Optionally the search runs on a Matryoshka prefix of each embedding and only
+the best candidates are re-ranked with the full vectors.
+"""
+
+import os
+import json
+import time
+import asyncio
+import threading
+from typing import List, Dict, Any, Optional, Tuple
+import numpy as np
+from supabase import AsyncClient
+
+try:
+    import hnswlib
+except ImportError:  # Optional: shards fall back to exact search
+    hnswlib = None
+
+# Rows fetched per request when loading chunks (PostgREST's default max-rows)
+LOAD_PAGE_SIZE = 1000
+
+# Times a shard load is repeated when documents change while it runs
+LOAD_ATTEMPTS = 3
+
+CHUNK_COLUMNS = "id, document_id, chunk_index, content, embedding, documents!inner(user_id, filename)"
+
+
+class UserShard:
+    def __init__(
+        self,
+        dimension: int,
+        ann_threshold: int,
+        hnsw_m: int = 16,
+        hnsw_ef_construction: int = 200,
+        hnsw_ef_search: int = 64,
+        coarse_dimensions: int = 0,
+        rescore_multiplier: int = 4
+    ):
+        """
+        Initialize an empty shard holding one user's chunks.
+
+        Args:
+            dimension: Embedding dimension
+            ann_threshold: Chunk count from which an HNSW graph is used instead of exact search
+            hnsw_m: HNSW graph degree
+            hnsw_ef_construction: HNSW build-time candidate list size
+            hnsw_ef_search: HNSW query-time candidate list size
+            coarse_dimensions: If set, search the first N (Matryoshka) dimensions
+                first and re-rank the candidates with the full embeddings
+            rescore_multiplier: Coarse candidates per requested result
+        """
+        self.dimension = dimension
+        self.ann_threshold = ann_threshold
+        self.hnsw_m = hnsw_m
+        self.hnsw_ef_construction = hnsw_ef_construction
+        self.hnsw_ef_search = hnsw_ef_search
+        self.coarse_dimensions = coarse_dimensions if 0 < coarse_dimensions < dimension else 0
+        self.rescore_multiplier = max(1, rescore_multiplier)
+        self.loaded_at = time.time()
+
+        # document_id -> (chunk rows without embeddings, normalized embedding matrix).
+        # Replaced rather than modified, so a build in a worker thread can keep
+        # iterating the snapshot it started from
+        self.documents: Dict[str, Tuple[List[Dict[str, Any]], np.ndarray]] = {}
+
+        # Combined search structures (rows, matrix, coarse matrix, HNSW graph),
+        # rebuilt lazily after changes; _generation counts changes so a build
+        # that raced with one is not published
+        self._built: Optional[Tuple[List[Dict[str, Any]], np.ndarray, Optional[np.ndarray], Any]] = None
+        self._generation = 0
+        # Guards documents, _built and _generation; held only briefly
+        self._state_lock = threading.Lock()
+        # Serializes builds, which can take a while for large shards
+        self._build_lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return sum(len(rows) for rows, _ in self.documents.values())
+
+    def set_documents(self, documents: Dict[str, Tuple[List[Dict[str, Any]], np.ndarray]]) -> None:
+        """Replace all chunks, keyed by document ID."""
+        with self._state_lock:
+            self.documents = dict(documents)
+            self._invalidate()
+
+    def set_document(self, document_id: str, rows: List[Dict[str, Any]], matrix: np.ndarray) -> None:
+        """Add or replace a document's chunks."""
+        with self._state_lock:
+            self.documents = {**self.documents, document_id: (rows, matrix)}
+            self._invalidate()
+
+    def remove_document(self, document_id: str) -> None:
+        """Drop a document's chunks."""
+        with self._state_lock:
+            if document_id in self.documents:
+                self.documents = {key: value for key, value in self.documents.items() if key != document_id}
+                self._invalidate()
+
+    def search(self, query_vector: np.ndarray, limit: int, threshold: float) -> List[Dict[str, Any]]:
+        """
+        Find the chunks most similar to a query.
+
+        Args:
+            query_vector: Query embedding
+            limit: Maximum number of chunks to return
+            threshold: Minimum cosine similarity
+
+        Returns:
+            Chunk rows with a "similarity" field, most similar first
+        """
+        rows, matrix, coarse_matrix, ann = self._build()
+        if not rows or limit <= 0:
+            return []
+
+        query = _normalize(np.asarray(query_vector, dtype=np.float32))
+        k = min(limit, len(rows))
+
+        if self.coarse_dimensions:
+            # Coarse pass on the embedding prefix, then exact full-dimension re-rank
+            coarse_query = _normalize(query[:self.coarse_dimensions])
+            candidates = min(len(rows), k * self.rescore_multiplier)
+            indexes, _ = self._nearest(coarse_matrix, ann, coarse_query, candidates)
+            exact = matrix[indexes] @ query
+            order = np.argsort(-exact)[:k]
+            indexes, scores = indexes[order], exact[order]
+        else:
+            indexes, scores = self._nearest(matrix, ann, query, k)
+
+        return [
+            {**rows[i], "similarity": float(score)}
+            for i, score in zip(indexes, scores)
+            if score > threshold
+        ]
+
+    def _nearest(self, matrix: np.ndarray, ann: Any, query: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Indexes and similarities of the k nearest rows, via HNSW if built or exact search."""
+        if ann is not None:
+            ann.set_ef(max(self.hnsw_ef_search, k))
+            labels, distances = ann.knn_query(query, k=k)
+            return labels[0].astype(np.int64), 1.0 - distances[0]
+
+        similarities = matrix @ query
+        if k < len(similarities):
+            indexes = np.argpartition(-similarities, k - 1)[:k]
+        else:
+            indexes = np.arange(len(similarities))
+        indexes = indexes[np.argsort(-similarities[indexes])]
+        return indexes, similarities[indexes]
+
+    def _invalidate(self) -> None:
+        """Drop the search structures; the caller holds _state_lock."""
+        self._generation += 1
+        self._built = None
+
+    def _build(self) -> Tuple[List[Dict[str, Any]], np.ndarray, Optional[np.ndarray], Any]:
+        """Return the search structures, building them from the current documents if needed."""
+        with self._build_lock:
+            with self._state_lock:
+                if self._built is not None:
+                    return self._built
+                documents, generation = self.documents, self._generation
+
+            built = self._build_structures(documents)
+
+            with self._state_lock:
+                # A document changed during the build: serve this search from the
+                # snapshot, but leave the next one to rebuild
+                if self._generation == generation:
+                    self._built = built
+            return built
+
+    def _build_structures(
+        self,
+        documents: Dict[str, Tuple[List[Dict[str, Any]], np.ndarray]]
+    ) -> Tuple[List[Dict[str, Any]], np.ndarray, Optional[np.ndarray], Any]:
+        """Combine the per-document matrices and, for large shards, build the HNSW graph."""
+        rows = [row for doc_rows, _ in documents.values() for row in doc_rows]
+        matrices = [matrix for _, matrix in documents.values() if len(matrix)]
+        matrix = np.vstack(matrices) if matrices else np.empty((0, self.dimension), dtype=np.float32)
+
+        # Matryoshka prefixes are renormalized so inner product stays cosine similarity
+        coarse_matrix = None
+        if self.coarse_dimensions:
+            coarse_matrix = _normalize(np.ascontiguousarray(matrix[:, :self.coarse_dimensions]))
+        search_matrix = coarse_matrix if coarse_matrix is not None else matrix
+
+        ann = None
+        if hnswlib is not None and len(rows) >= self.ann_threshold:
+            # Inner product on normalized vectors is cosine similarity
+            ann = hnswlib.Index(space="ip", dim=search_matrix.shape[1])
+            ann.init_index(max_elements=len(rows), M=self.hnsw_m, ef_construction=self.hnsw_ef_construction)
+            ann.add_items(search_matrix, np.arange(len(rows)))
+
+        return rows, matrix, coarse_matrix, ann
+
+
+class LocalVectorIndex:
+    def __init__(
+        self,
+        supabase_client: AsyncClient,
+        dimension: int = 768,
+        ann_threshold: int = 20000,
+        ttl_seconds: float = 300,
+        hnsw_m: int = 16,
+        hnsw_ef_construction: int = 200,
+        hnsw_ef_search: int = 64,
+        coarse_dimensions: int = 0,
+        rescore_multiplier: int = 4
+    ):
+        """
+        Initialize the local vector index.
+
+        Args:
+            supabase_client: Async Supabase client used to load chunk embeddings
+            dimension: Embedding dimension
+            ann_threshold: Chunk count from which a shard uses HNSW (requires hnswlib)
+            ttl_seconds: Shard lifetime before it is reloaded, so changes made by
+                other server processes are picked up
+            hnsw_m: HNSW graph degree
+            hnsw_ef_construction: HNSW build-time candidate list size
+            hnsw_ef_search: HNSW query-time candidate list size
+            coarse_dimensions: If set, search the first N (Matryoshka) dimensions
+                first and re-rank the candidates with the full embeddings
+            rescore_multiplier: Coarse candidates per requested result
+        """
+        self.supabase = supabase_client
+        self.dimension = dimension
+        self.ann_threshold = ann_threshold
+        self.ttl_seconds = ttl_seconds
+        self.hnsw_m = hnsw_m
+        self.hnsw_ef_construction = hnsw_ef_construction
+        self.hnsw_ef_search = hnsw_ef_search
+        self.coarse_dimensions = coarse_dimensions
+        self.rescore_multiplier = rescore_multiplier
+
+        self._shards: Dict[str, UserShard] = {}
+        self._load_locks: Dict[str, asyncio.Lock] = {}
+        # Counts each user's document changes, so a load that overlaps one is redone
+        self._changes: Dict[str, int] = {}
+
+        if hnswlib is None:
+            print("hnswlib is not installed; local vector index will use exact search only")
+
+    @classmethod
+    def from_env(
+        cls,
+        supabase_client: AsyncClient,
+        dimension: int = 768,
+        coarse_dimensions: int = 0
+    ) -> "LocalVectorIndex":
+        """Create an index configured from LOCAL_INDEX_* environment variables."""
+        return cls(
+            supabase_client,
+            dimension=dimension,
+            coarse_dimensions=coarse_dimensions,
+            rescore_multiplier=int(os.getenv("LOCAL_INDEX_RESCORE_MULTIPLIER", 4)),
+            ann_threshold=int(os.getenv("LOCAL_INDEX_ANN_THRESHOLD", 20000)),
+            ttl_seconds=float(os.getenv("LOCAL_INDEX_TTL", 300)),
+            hnsw_m=int(os.getenv("LOCAL_INDEX_HNSW_M", 16)),
+            hnsw_ef_construction=int(os.getenv("LOCAL_INDEX_HNSW_EF_CONSTRUCTION", 200)),
+            hnsw_ef_search=int(os.getenv("LOCAL_INDEX_HNSW_EF_SEARCH", 64))
+        )
+
+    async def search(
+        self,
+        user_id: str,
+        query_vector: np.ndarray,
+        limit: int = 5,
+        threshold: float = 0.7
+    ) -> List[Dict[str, Any]]:
+        """
+        Search a user's chunks, loading the user's shard on first use.
+
+        Args:
+            user_id: User whose documents are searched
+            query_vector: Query embedding
+            limit: Maximum number of chunks to return
+            threshold: Minimum cosine similarity
+
+        Returns:
+            Chunks shaped like search_document_chunks rows (id, document_id,
+            chunk_index, content, similarity, documents.filename)
+        """
+        shard = await self._get_shard(user_id)
+        # Building an HNSW graph can take a while, so keep it off the event loop
+        return await asyncio.to_thread(shard.search, query_vector, limit, threshold)
+
+    async def add_document(self, user_id: str, document_id: str) -> None:
+        """
+        Load a newly stored document into the user's shard, if the shard is loaded.
+
+        Args:
+            user_id: Owner of the document
+            document_id: ID of the document
+        """
+        self._record_change(user_id)
+        shard = self._shards.get(user_id)
+        if shard is None:
+            # Not loaded yet (or loading); the load includes the document
+            return
+
+        try:
+            chunks = await self._fetch_chunks(user_id, document_id)
+        except Exception as e:
+            print(f"Error loading document {document_id} into local index: {e}")
+            self.invalidate(user_id)
+            return
+
+        rows, matrix = self._to_rows_and_matrix(chunks)
+        shard.set_document(document_id, rows, matrix)
+
+    def remove_document(self, user_id: str, document_id: str) -> None:
+        """
+        Drop a deleted document from the user's shard.
+
+        Args:
+            user_id: Owner of the document
+            document_id: ID of the document
+        """
+        self._record_change(user_id)
+        shard = self._shards.get(user_id)
+        if shard is not None:
+            shard.remove_document(document_id)
+
+    def invalidate(self, user_id: str) -> None:
+        """Forget a user's shard so the next search reloads it."""
+        self._record_change(user_id)
+        self._shards.pop(user_id, None)
+
+    def stats(self) -> Dict[str, Any]:
+        """Return shard counts and sizes."""
+        return {
+            "users": len(self._shards),
+            "chunks": sum(len(shard) for shard in self._shards.values()),
+            "ann_available": hnswlib is not None,
+            "coarse_dimensions": self.coarse_dimensions
+        }
+
+    async def _get_shard(self, user_id: str) -> UserShard:
+        """Return the user's shard, loading it if missing or expired."""
+        shard = self._shards.get(user_id)
+        if shard is not None and time.time() - shard.loaded_at < self.ttl_seconds:
+            return shard
+
+        # One load per user at a time; concurrent searches wait for it
+        lock = self._load_locks.setdefault(user_id, asyncio.Lock())
+        async with lock:
+            shard = self._shards.get(user_id)
+            if shard is not None and time.time() - shard.loaded_at < self.ttl_seconds:
+                return shard
+
+            # A document added or deleted while the chunks are fetched may or may
+            # not be in them, so such a load is repeated rather than published
+            for _ in range(LOAD_ATTEMPTS):
+                changes = self._changes.get(user_id, 0)
+                shard = await self._load_shard(user_id)
+                if self._changes.get(user_id, 0) == changes:
+                    print(f"Loaded {len(shard)} chunks into local index for user {user_id}")
+                    self._shards[user_id] = shard
+                    return shard
+
+            # Documents keep changing; answer this search without caching the shard
+            return shard
+
+    async def _load_shard(self, user_id: str) -> UserShard:
+        """Build a shard from all of a user's chunks."""
+        shard = UserShard(
+            self.dimension,
+            self.ann_threshold,
+            self.hnsw_m,
+            self.hnsw_ef_construction,
+            self.hnsw_ef_search,
+            self.coarse_dimensions,
+            self.rescore_multiplier
+        )
+        chunks = await self._fetch_chunks(user_id)
+
+        by_document: Dict[str, List[Dict[str, Any]]] = {}
+        for chunk in chunks:
+            by_document.setdefault(chunk["document_id"], []).append(chunk)
+        shard.set_documents({
+            document_id: self._to_rows_and_matrix(document_chunks)
+            for document_id, document_chunks in by_document.items()
+        })
+        return shard
+
+    def _record_change(self, user_id: str) -> None:
+        self._changes[user_id] = self._changes.get(user_id, 0) + 1
+
+    async def _fetch_chunks(self, user_id: str, document_id: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Page through a user's document_chunks rows (with embeddings), optionally for one document."""
+        chunks: List[Dict[str, Any]] = []
+        start = 0
+        while True:
+            query = self.supabase.table("document_chunks").select(CHUNK_COLUMNS).eq(
+                "documents.user_id", user_id
+            )
+            if document_id is not None:
+                query = query.eq("document_id", document_id)
+            result = await query.order("id").range(start, start + LOAD_PAGE_SIZE - 1).execute()
+
+            page = result.data or []
+            chunks.extend(page)
+            if len(page) < LOAD_PAGE_SIZE:
+                return chunks
+            start += LOAD_PAGE_SIZE
+
+    def _to_rows_and_matrix(self, chunks: List[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], np.ndarray]:
+        """Split chunk records into result rows and a normalized embedding matrix."""
+        rows: List[Dict[str, Any]] = []
+        vectors: List[Any] = []
+        for chunk in chunks:
+            embedding = chunk.get("embedding")
+            if embedding is None:
+                continue
+            # pgvector values come back from PostgREST as "[x,y,...]" strings
+            if isinstance(embedding, str):
+                embedding = json.loads(embedding)
+            vectors.append(embedding)
+            rows.append({
+                "id": chunk["id"],
+                "document_id": chunk["document_id"],
+                "chunk_index": chunk.get("chunk_index"),
+                "content": chunk["content"],
+                "documents": {"filename": (chunk.get("documents") or {}).get("filename")}
+            })
+
+        if not vectors:
+            return [], np.empty((0, self.dimension), dtype=np.float32)
+
+        return rows, _normalize(np.asarray(vectors, dtype=np.float32))
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    """Scale vectors (or the rows of a matrix) to unit length."""
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
@@ -0,0 +1,42 @@
+-- Migration: move chat history from chat_sessions.messages (JSONB array)
+-- into the append-only chat_messages table.
+-- Run this once in your Supabase SQL editor on databases created before
+-- chat_messages existed.
+
+BEGIN;
+
+CREATE TABLE IF NOT EXISTS chat_messages (
+    id BIGSERIAL PRIMARY KEY,
+    session_id TEXT NOT NULL REFERENCES chat_sessions(session_id) ON DELETE CASCADE,
+    message_id TEXT NOT NULL,
+    role TEXT NOT NULL,
+    content TEXT NOT NULL,
+    source TEXT,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS idx_chat_messages_session_id ON chat_messages(session_id, id);
+
+-- Copy every stored message, preserving order within each session.
+-- Sessions that already have rows in chat_messages are skipped, so the
+-- migration is safe to re-run.
+INSERT INTO chat_messages (session_id, message_id, role, content, source, created_at)
+SELECT
+    cs.session_id,
+    COALESCE(m.value->>'id', gen_random_uuid()::text),
+    m.value->>'role',
+    COALESCE(m.value->>'content', ''),
+    m.value->>'source',
+    cs.updated_at
+FROM chat_sessions cs
+CROSS JOIN LATERAL jsonb_array_elements(cs.messages) WITH ORDINALITY AS m(value, ordinality)
+WHERE NOT EXISTS (
+    SELECT 1 FROM chat_messages existing WHERE existing.session_id = cs.session_id
+)
+ORDER BY cs.created_at, cs.session_id, m.ordinality;
+
+-- The backend no longer reads or writes chat_sessions.messages. Keep the column
+-- until the new storage has been verified, then drop it:
+-- ALTER TABLE chat_sessions DROP COLUMN messages;
+
+COMMIT;
@@ -0,0 +1,38 @@
+-- Migration: add denormalized session summary columns used by /api/sessions.
+-- Run after 001_chat_messages.sql.
+
+BEGIN;
+
+ALTER TABLE chat_sessions ADD COLUMN IF NOT EXISTS title TEXT;
+ALTER TABLE chat_sessions ADD COLUMN IF NOT EXISTS message_count INTEGER NOT NULL DEFAULT 0;
+
+-- Backfill from chat_messages without touching updated_at, so the
+-- sidebar keeps its existing order
+ALTER TABLE chat_sessions DISABLE TRIGGER update_chat_sessions_updated_at;
+
+UPDATE chat_sessions cs
+SET
+    message_count = counts.message_count,
+    title = COALESCE(cs.title, (
+        SELECT CASE
+                WHEN length(cm.content) > 50 THEN left(cm.content, 50) || '...'
+                ELSE cm.content
+            END
+        FROM chat_messages cm
+        WHERE cm.session_id = cs.session_id
+        AND cm.role = 'user'
+        ORDER BY cm.id
+        LIMIT 1
+    ))
+FROM (
+    SELECT session_id, COUNT(*)::integer AS message_count
+    FROM chat_messages
+    GROUP BY session_id
+) counts
+WHERE counts.session_id = cs.session_id;
+
+ALTER TABLE chat_sessions ENABLE TRIGGER update_chat_sessions_updated_at;
+
+CREATE INDEX IF NOT EXISTS idx_chat_sessions_user_updated ON chat_sessions(user_id, updated_at DESC, session_id DESC);
+
+COMMIT;
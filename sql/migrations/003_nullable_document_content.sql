@@ -0,0 +1,5 @@
+-- Migration: allow documents without stored full text.
+-- Uploads are streamed into document_chunks, so documents.content is NULL for
+-- new documents; the backend rebuilds the text from the chunks on request.
+
+ALTER TABLE documents ALTER COLUMN content DROP NOT NULL;
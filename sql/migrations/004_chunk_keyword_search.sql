@@ -0,0 +1,9 @@
+-- Migration: add the full-text column and index used for keyword search.
+-- Rewrites document_chunks once to compute the column for existing rows;
+-- re-run sql/schema.sql afterwards to install search_document_chunks_text.
+
+ALTER TABLE document_chunks
+    ADD COLUMN IF NOT EXISTS content_tsv tsvector
+    GENERATED ALWAYS AS (to_tsvector('english', content)) STORED;
+
+CREATE INDEX IF NOT EXISTS idx_document_chunks_content_tsv ON document_chunks USING gin(content_tsv);
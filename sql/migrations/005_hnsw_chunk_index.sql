@@ -0,0 +1,10 @@
+-- Migration: replace the IVFFlat chunk embedding index with HNSW.
+-- The old index was created with lists = 100 on an empty table, so its
+-- centroids don't reflect the data. Re-run sql/schema.sql afterwards to
+-- install the index-friendly search_document_chunks and
+-- rebuild_document_chunks_index.
+
+DROP INDEX IF EXISTS idx_document_chunks_embedding;
+
+CREATE INDEX idx_document_chunks_embedding ON document_chunks
+USING hnsw (embedding vector_cosine_ops) WITH (m = 16, ef_construction = 64);
@@ -0,0 +1,7 @@
+-- Migration: record where each chunk's text sits in its document.
+-- Chunks stored before this migration keep NULL offsets; get_document_content
+-- falls back to word-overlap reassembly for them.
+
+ALTER TABLE document_chunks
+    ADD COLUMN IF NOT EXISTS start_char INTEGER,
+    ADD COLUMN IF NOT EXISTS end_char INTEGER;
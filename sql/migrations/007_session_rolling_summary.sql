@@ -0,0 +1,6 @@
+-- Migration: add the rolling conversation summary kept per chat session.
+-- Older turns are folded into summary by the backend; summary_through is the
+-- chat_messages.id of the last message it covers.
+
+ALTER TABLE chat_sessions ADD COLUMN IF NOT EXISTS summary TEXT;
+ALTER TABLE chat_sessions ADD COLUMN IF NOT EXISTS summary_through BIGINT;
@@ -0,0 +1,10 @@
+-- Migration: content-addressed store of chunk embeddings, so identical chunk
+-- text is embedded once across uploads (see RAGService.store_chunk_stream).
+-- content_hash = sha256(model, dimension, chunk text). Until this is applied,
+-- uploads still work but every chunk is embedded afresh.
+
+CREATE TABLE IF NOT EXISTS chunk_embeddings (
+    content_hash TEXT PRIMARY KEY,
+    embedding vector(768) NOT NULL,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+);
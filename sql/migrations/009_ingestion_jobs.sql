@@ -0,0 +1,43 @@
+-- Migration: background document ingestion jobs (see backend/ingestion_jobs.py).
+-- Creates the table on databases that predate it, and adds the lease columns
+-- (claimed_by, heartbeat_at) to tables created without them. Jobs that exist
+-- when this runs get a fresh heartbeat, so they can be resumed once it expires.
+
+BEGIN;
+
+CREATE TABLE IF NOT EXISTS ingestion_jobs (
+    id UUID PRIMARY KEY,
+    user_id TEXT NOT NULL DEFAULT 'anonymous',
+    filename TEXT NOT NULL,
+    mime_type TEXT,
+    file_size INTEGER NOT NULL,
+    status TEXT NOT NULL DEFAULT 'queued', -- queued, processing, completed, failed
+    chunks_total INTEGER,
+    chunks_embedded INTEGER NOT NULL DEFAULT 0,
+    document_id UUID, -- reserved up front so an interrupted job can clean up
+    document JSONB, -- document metadata once completed
+    ingestion JSONB, -- embedding statistics once completed
+    error TEXT,
+    attempts INTEGER NOT NULL DEFAULT 1,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+);
+
+ALTER TABLE ingestion_jobs
+    ADD COLUMN IF NOT EXISTS claimed_by TEXT,
+    ADD COLUMN IF NOT EXISTS heartbeat_at TIMESTAMP WITH TIME ZONE DEFAULT NOW();
+
+CREATE INDEX IF NOT EXISTS idx_ingestion_jobs_status ON ingestion_jobs(status, created_at);
+
+DO $$
+BEGIN
+    IF NOT EXISTS (SELECT 1 FROM pg_trigger WHERE tgname = 'update_ingestion_jobs_updated_at') THEN
+        CREATE TRIGGER update_ingestion_jobs_updated_at 
+            BEFORE UPDATE ON ingestion_jobs 
+            FOR EACH ROW 
+            EXECUTE FUNCTION update_updated_at_column();
+    END IF;
+END
+$$;
+
+COMMIT;
@@ -9,17 +9,33 @@ CREATE TABLE IF NOT EXISTS chat_sessions (
     id UUID DEFAULT gen_random_uuid() PRIMARY KEY,
     user_id TEXT NOT NULL DEFAULT 'anonymous',
     session_id TEXT NOT NULL UNIQUE,
-    messages JSONB NOT NULL DEFAULT '[]'::jsonb,
+    title TEXT, -- first user message, truncated; maintained by append_chat_messages
+    message_count INTEGER NOT NULL DEFAULT 0, -- maintained by append_chat_messages
+    summary TEXT, -- rolling summary of older messages, passed to the agent
+    summary_through BIGINT, -- chat_messages.id of the last message covered by summary
     created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
     updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
 );
 
+-- Chat messages, one row per message (append-only)
+-- Existing deployments: run sql/migrations/001_chat_messages.sql to move
+-- history out of the old chat_sessions.messages JSONB column
+CREATE TABLE IF NOT EXISTS chat_messages (
+    id BIGSERIAL PRIMARY KEY, -- insertion order, also used as the pagination cursor
+    session_id TEXT NOT NULL REFERENCES chat_sessions(session_id) ON DELETE CASCADE,
+    message_id TEXT NOT NULL,
+    role TEXT NOT NULL,
+    content TEXT NOT NULL,
+    source TEXT,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+);
+
 -- Documents table for RAG
 CREATE TABLE IF NOT EXISTS documents (
     id UUID DEFAULT gen_random_uuid() PRIMARY KEY,
     user_id TEXT NOT NULL DEFAULT 'anonymous',
     filename TEXT NOT NULL,
-    content TEXT NOT NULL,
+    content TEXT, -- NULL for streamed uploads; the text is rebuilt from document_chunks
     file_size INTEGER NOT NULL,
     mime_type TEXT,
     created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
@@ -32,19 +48,60 @@ CREATE TABLE IF NOT EXISTS document_chunks (
     document_id UUID NOT NULL REFERENCES documents(id) ON DELETE CASCADE,
     chunk_index INTEGER NOT NULL,
     content TEXT NOT NULL,
+    start_char INTEGER, -- offsets of content in the document text; NULL for chunks stored before they were recorded
+    end_char INTEGER,
     embedding vector(768), -- 768-dimensional embeddings from Gemini
+    content_tsv tsvector GENERATED ALWAYS AS (to_tsvector('english', content)) STORED, -- keyword search
     created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
 );
 
+-- Content-addressed embedding store shared by all uploads, so identical chunk
+-- text is only embedded once. content_hash = sha256(model, dimension, chunk text)
+CREATE TABLE IF NOT EXISTS chunk_embeddings (
+    content_hash TEXT PRIMARY KEY,
+    embedding vector(768) NOT NULL,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+);
+
+-- Background document ingestion jobs (see backend/ingestion_jobs.py)
+CREATE TABLE IF NOT EXISTS ingestion_jobs (
+    id UUID PRIMARY KEY,
+    user_id TEXT NOT NULL DEFAULT 'anonymous',
+    filename TEXT NOT NULL,
+    mime_type TEXT,
+    file_size INTEGER NOT NULL,
+    status TEXT NOT NULL DEFAULT 'queued', -- queued, processing, completed, failed
+    chunks_total INTEGER,
+    chunks_embedded INTEGER NOT NULL DEFAULT 0,
+    document_id UUID, -- reserved up front so an interrupted job can clean up
+    document JSONB, -- document metadata once completed
+    ingestion JSONB, -- embedding statistics once completed
+    error TEXT,
+    attempts INTEGER NOT NULL DEFAULT 1,
+    claimed_by TEXT, -- server process holding the job's lease
+    heartbeat_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(), -- last lease renewal
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+);
+
 -- Indexes for faster queries (create only if they don't exist)
 CREATE INDEX IF NOT EXISTS idx_chat_sessions_session_id ON chat_sessions(session_id);
 CREATE INDEX IF NOT EXISTS idx_chat_sessions_user_id ON chat_sessions(user_id);
+CREATE INDEX IF NOT EXISTS idx_chat_sessions_user_updated ON chat_sessions(user_id, updated_at DESC, session_id DESC);
+CREATE INDEX IF NOT EXISTS idx_chat_messages_session_id ON chat_messages(session_id, id);
 CREATE INDEX IF NOT EXISTS idx_documents_user_id ON documents(user_id);
 CREATE INDEX IF NOT EXISTS idx_document_chunks_document_id ON document_chunks(document_id);
+CREATE INDEX IF NOT EXISTS idx_ingestion_jobs_status ON ingestion_jobs(status, created_at);
+
+-- Full-text index for keyword search over chunks
+CREATE INDEX IF NOT EXISTS idx_document_chunks_content_tsv ON document_chunks USING gin(content_tsv);
 
--- Vector similarity index for fast cosine similarity search
-CREATE INDEX IF NOT EXISTS idx_document_chunks_embedding ON document_chunks 
-USING ivfflat (embedding vector_cosine_ops) WITH (lists = 100);
+-- Vector similarity index for fast cosine similarity search. HNSW needs no
+-- training data, so it is valid from the first insert; an IVFFlat index built
+-- on an empty table has meaningless centroids. Use rebuild_document_chunks_index
+-- (backend/rebuild_vector_index.py) to rebuild or switch index types.
+CREATE INDEX IF NOT EXISTS idx_document_chunks_embedding ON document_chunks
+USING hnsw (embedding vector_cosine_ops) WITH (m = 16, ef_construction = 64);
 
 -- Update timestamp trigger function
 CREATE OR REPLACE FUNCTION update_updated_at_column()
@@ -67,6 +124,17 @@ BEGIN
 END
 $$;
 
+DO $$
+BEGIN
+    IF NOT EXISTS (SELECT 1 FROM pg_trigger WHERE tgname = 'update_ingestion_jobs_updated_at') THEN
+        CREATE TRIGGER update_ingestion_jobs_updated_at 
+            BEFORE UPDATE ON ingestion_jobs 
+            FOR EACH ROW 
+            EXECUTE FUNCTION update_updated_at_column();
+    END IF;
+END
+$$;
+
 DO $$
 BEGIN
     IF NOT EXISTS (SELECT 1 FROM pg_trigger WHERE tgname = 'update_documents_updated_at') THEN
@@ -78,35 +146,371 @@ BEGIN
 END
 $$;
 
--- Function for vector similarity search
+-- Atomically append messages to a chat session, creating the session if needed.
+-- The upsert locks the session row, so concurrent turns on the same session are
+-- serialized and their messages never interleave or overwrite each other.
+-- It also keeps the session's title and message_count summary columns current.
+CREATE OR REPLACE FUNCTION append_chat_messages(
+    session_id_input text,
+    user_id_input text DEFAULT 'anonymous',
+    new_messages jsonb DEFAULT '[]'::jsonb
+)
+RETURNS void
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    first_user_title text;
+BEGIN
+    -- Title from the first user message in this batch (first 50 characters)
+    SELECT CASE
+            WHEN length(m.value->>'content') > 50 THEN left(m.value->>'content', 50) || '...'
+            ELSE m.value->>'content'
+        END
+    INTO first_user_title
+    FROM jsonb_array_elements(new_messages) WITH ORDINALITY AS m(value, ordinality)
+    WHERE m.value->>'role' = 'user'
+    ORDER BY m.ordinality
+    LIMIT 1;
+
+    INSERT INTO chat_sessions (session_id, user_id, title, message_count)
+    VALUES (session_id_input, user_id_input, first_user_title, jsonb_array_length(new_messages))
+    ON CONFLICT (session_id) DO UPDATE SET
+        updated_at = NOW(),
+        title = COALESCE(chat_sessions.title, EXCLUDED.title),
+        message_count = chat_sessions.message_count + EXCLUDED.message_count;
+
+    INSERT INTO chat_messages (session_id, message_id, role, content, source)
+    SELECT
+        session_id_input,
+        m.value->>'id',
+        m.value->>'role',
+        m.value->>'content',
+        m.value->>'source'
+    FROM jsonb_array_elements(new_messages) WITH ORDINALITY AS m(value, ordinality)
+    ORDER BY m.ordinality;
+END;
+$$;
+
+-- List a user's sessions for the sidebar, newest first, from the summary columns.
+-- Pass the (updated_at, session_id) of the last row of a page to get the next page.
+CREATE OR REPLACE FUNCTION list_chat_sessions(
+    user_id_filter text DEFAULT 'anonymous',
+    before_updated_at timestamptz DEFAULT NULL,
+    before_session_id text DEFAULT NULL,
+    page_size int DEFAULT NULL
+)
+RETURNS TABLE (
+    session_id text,
+    title text,
+    message_count integer,
+    created_at timestamptz,
+    updated_at timestamptz
+)
+LANGUAGE plpgsql
+STABLE
+AS $$
+BEGIN
+    RETURN QUERY
+    SELECT
+        cs.session_id,
+        cs.title,
+        cs.message_count,
+        cs.created_at,
+        cs.updated_at
+    FROM chat_sessions cs
+    WHERE cs.user_id = user_id_filter
+    AND (
+        before_updated_at IS NULL
+        OR (cs.updated_at, cs.session_id) < (before_updated_at, before_session_id)
+    )
+    ORDER BY cs.updated_at DESC, cs.session_id DESC
+    LIMIT page_size;
+END;
+$$;
+
+-- Expression over an embedding that the ANN index is built on and searches
+-- order by: optionally a Matryoshka prefix (the first coarse_dimensions
+-- values, 0 = all), optionally quantized to halfvec or binary. Search and
+-- index use the same expression so the planner can match them.
+CREATE OR REPLACE FUNCTION chunk_embedding_expression(
+    source text,
+    quantization text DEFAULT 'none',
+    coarse_dimensions int DEFAULT 0
+)
+RETURNS text
+LANGUAGE plpgsql
+IMMUTABLE
+AS $$
+DECLARE
+    dims int := CASE WHEN coarse_dimensions > 0 THEN coarse_dimensions ELSE 768 END;
+    expr text := CASE WHEN coarse_dimensions > 0
+                      THEN format('subvector(%s, 1, %s)', source, coarse_dimensions)
+                      ELSE source END;
+BEGIN
+    IF quantization = 'halfvec' THEN
+        RETURN format('%s::halfvec(%s)', expr, dims);
+    ELSIF quantization = 'binary' THEN
+        RETURN format('binary_quantize(%s)::bit(%s)', expr, dims);
+    ELSIF quantization = 'none' THEN
+        RETURN CASE WHEN coarse_dimensions > 0 THEN format('%s::vector(%s)', expr, dims) ELSE expr END;
+    END IF;
+
+    RAISE EXCEPTION 'Unknown quantization: %', quantization;
+END;
+$$;
+
+-- Function for vector similarity search.
+-- The inner query orders by distance with a LIMIT so the planner can walk the
+-- ANN index; the similarity threshold is applied to that short candidate list
+-- rather than in WHERE, where it would force a scan of every row. The user's
+-- documents are resolved first so chunks are filtered by document_id.
+--
+-- With quantization 'halfvec' / 'binary' or coarse_dimensions > 0 the candidates
+-- come from the matching quantized or Matryoshka-prefix expression index (see
+-- rebuild_document_chunks_index), and match_count * rescore_multiplier of them
+-- are re-ranked by full-precision, full-dimension cosine similarity. Both
+-- settings must match the installed index.
+DROP FUNCTION IF EXISTS search_document_chunks(vector, text, float, int);
+DROP FUNCTION IF EXISTS search_document_chunks(vector, text, float, int, int, int);
+DROP FUNCTION IF EXISTS search_document_chunks(vector, text, float, int, int, int, text, int);
+
 CREATE OR REPLACE FUNCTION search_document_chunks(
     query_embedding vector(768),
     user_id_filter text DEFAULT 'anonymous',
     similarity_threshold float DEFAULT 0.7,
-    match_count int DEFAULT 5
+    match_count int DEFAULT 5,
+    ef_search int DEFAULT 40,
+    probes int DEFAULT 10,
+    quantization text DEFAULT 'none',
+    rescore_multiplier int DEFAULT 4,
+    coarse_dimensions int DEFAULT 0
 )
 RETURNS TABLE (
     id uuid,
     document_id uuid,
+    chunk_index int,
     content text,
     similarity float,
     documents jsonb
 )
 LANGUAGE plpgsql
 AS $$
+DECLARE
+    user_document_ids uuid[];
+    candidate_order text;
+    candidate_count int;
+BEGIN
+    -- Recall/speed knobs for whichever index type is installed (transaction-local)
+    PERFORM set_config('hnsw.ef_search', GREATEST(ef_search, match_count * rescore_multiplier)::text, true);
+    PERFORM set_config('ivfflat.probes', probes::text, true);
+
+    -- pgvector >= 0.8 keeps scanning the index until enough rows pass the
+    -- document filter; older versions don't have the setting
+    BEGIN
+        PERFORM set_config('hnsw.iterative_scan', 'relaxed_order', true);
+        PERFORM set_config('ivfflat.iterative_scan', 'relaxed_order', true);
+    EXCEPTION WHEN OTHERS THEN
+        NULL;
+    END;
+
+    SELECT array_agg(d.id) INTO user_document_ids
+    FROM documents d
+    WHERE d.user_id = user_id_filter;
+
+    IF user_document_ids IS NULL THEN
+        RETURN;
+    END IF;
+
+    candidate_order := format(
+        '%s %s %s',
+        chunk_embedding_expression('dc.embedding', quantization, coarse_dimensions),
+        CASE WHEN quantization = 'binary' THEN '<~>' ELSE '<=>' END,
+        chunk_embedding_expression('$1', quantization, coarse_dimensions)
+    );
+    candidate_count := CASE WHEN quantization = 'none' AND coarse_dimensions <= 0
+                            THEN match_count
+                            ELSE match_count * rescore_multiplier END;
+
+    RETURN QUERY EXECUTE format(
+        'SELECT
+            candidates.id,
+            candidates.document_id,
+            candidates.chunk_index,
+            candidates.content,
+            candidates.similarity,
+            jsonb_build_object(''filename'', d.filename) AS documents
+        FROM (
+            SELECT
+                dc.id,
+                dc.document_id,
+                dc.chunk_index,
+                dc.content,
+                1 - (dc.embedding <=> $1) AS similarity
+            FROM document_chunks dc
+            WHERE dc.document_id = ANY($2)
+            ORDER BY %s
+            LIMIT $3
+        ) candidates
+        JOIN documents d ON candidates.document_id = d.id
+        WHERE candidates.similarity > $4
+        ORDER BY candidates.similarity DESC
+        LIMIT $5',
+        candidate_order
+    )
+    USING query_embedding, user_document_ids, candidate_count, similarity_threshold, match_count;
+END;
+$$;
+
+-- Rebuild the chunk embedding index, e.g. after bulk loads or to switch type.
+-- IVFFlat lists are sized from the current row count (rows / 1000, or
+-- sqrt(rows) above a million rows) so its centroids reflect real data.
+-- quantization 'halfvec' indexes a half-precision copy of each embedding
+-- (half the index memory) and 'binary' a 1-bit-per-dimension copy (1/32);
+-- coarse_dimensions indexes only a Matryoshka prefix (e.g. 256 of 768
+-- dimensions, a third of the memory). Full vectors stay in the table for
+-- re-ranking. The new index is built under a temporary name and swapped in,
+-- so searches keep working; inserts wait until the build finishes.
+DROP FUNCTION IF EXISTS rebuild_document_chunks_index(text, int, int, int);
+DROP FUNCTION IF EXISTS rebuild_document_chunks_index(text, int, int, int, text);
+
+CREATE OR REPLACE FUNCTION rebuild_document_chunks_index(
+    index_type text DEFAULT 'hnsw',
+    hnsw_m int DEFAULT 16,
+    hnsw_ef_construction int DEFAULT 64,
+    ivfflat_lists int DEFAULT NULL,
+    quantization text DEFAULT 'none',
+    coarse_dimensions int DEFAULT 0
+)
+RETURNS jsonb
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    row_count bigint;
+    lists int;
+    indexed_column text;
 BEGIN
+    SELECT count(*) INTO row_count FROM document_chunks WHERE embedding IS NOT NULL;
+
+    indexed_column := format(
+        '(%s) %s',
+        chunk_embedding_expression('embedding', quantization, coarse_dimensions),
+        CASE quantization
+            WHEN 'halfvec' THEN 'halfvec_cosine_ops'
+            WHEN 'binary' THEN 'bit_hamming_ops'
+            ELSE 'vector_cosine_ops'
+        END
+    );
+
+    DROP INDEX IF EXISTS idx_document_chunks_embedding_new;
+
+    IF index_type = 'hnsw' THEN
+        EXECUTE format(
+            'CREATE INDEX idx_document_chunks_embedding_new ON document_chunks '
+            'USING hnsw (%s) WITH (m = %s, ef_construction = %s)',
+            indexed_column, hnsw_m, hnsw_ef_construction
+        );
+    ELSIF index_type = 'ivfflat' THEN
+        lists := COALESCE(
+            ivfflat_lists,
+            GREATEST(1, CASE WHEN row_count > 1000000
+                             THEN sqrt(row_count)::int
+                             ELSE (row_count / 1000)::int END)
+        );
+        EXECUTE format(
+            'CREATE INDEX idx_document_chunks_embedding_new ON document_chunks '
+            'USING ivfflat (%s) WITH (lists = %s)',
+            indexed_column, lists
+        );
+    ELSE
+        RAISE EXCEPTION 'Unknown index type: %', index_type;
+    END IF;
+
+    DROP INDEX IF EXISTS idx_document_chunks_embedding;
+    ALTER INDEX idx_document_chunks_embedding_new RENAME TO idx_document_chunks_embedding;
+    ANALYZE document_chunks;
+
+    RETURN jsonb_build_object(
+        'index_type', index_type,
+        'quantization', quantization,
+        'coarse_dimensions', coarse_dimensions,
+        'rows', row_count,
+        'lists', lists,
+        'm', CASE WHEN index_type = 'hnsw' THEN hnsw_m END,
+        'ef_construction', CASE WHEN index_type = 'hnsw' THEN hnsw_ef_construction END,
+        'index_size', pg_size_pretty(pg_relation_size('idx_document_chunks_embedding'))
+    );
+END;
+$$;
+
+-- Index rebuilds are an admin operation: keep them away from the public API keys
+REVOKE EXECUTE ON FUNCTION rebuild_document_chunks_index(text, int, int, int, text, int) FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION rebuild_document_chunks_index(text, int, int, int, text, int) TO service_role;
+
+-- Function for keyword (full-text) search, used alongside vector search.
+-- Query terms are OR-ed so a full question still matches chunks containing
+-- its rarer words (drug names, eponyms); ts_rank_cd with length
+-- normalization ranks chunks matching more, and denser, terms first.
+CREATE OR REPLACE FUNCTION search_document_chunks_text(
+    query_text text,
+    user_id_filter text DEFAULT 'anonymous',
+    match_count int DEFAULT 5
+)
+RETURNS TABLE (
+    id uuid,
+    document_id uuid,
+    chunk_index int,
+    content text,
+    keyword_rank float,
+    documents jsonb
+)
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    terms tsquery;
+BEGIN
+    -- Lexemes from plainto_tsquery are already normalized, so cast rather
+    -- than re-parse them with to_tsquery
+    terms := NULLIF(replace(plainto_tsquery('english', query_text)::text, ' & ', ' | '), '')::tsquery;
+
+    IF terms IS NULL THEN
+        RETURN;
+    END IF;
+
     RETURN QUERY
-    SELECT 
+    SELECT
         dc.id,
         dc.document_id,
+        dc.chunk_index,
         dc.content,
-        1 - (dc.embedding <=> query_embedding) as similarity,
-        to_jsonb(d.*) as documents
+        ts_rank_cd(dc.content_tsv, terms, 1)::float AS keyword_rank,
+        jsonb_build_object('filename', d.filename) AS documents
     FROM document_chunks dc
     JOIN documents d ON dc.document_id = d.id
     WHERE d.user_id = user_id_filter
-    AND 1 - (dc.embedding <=> query_embedding) > similarity_threshold
-    ORDER BY dc.embedding <=> query_embedding
+    AND dc.content_tsv @@ terms
+    ORDER BY keyword_rank DESC
     LIMIT match_count;
 END;
-$$;
\ No newline at end of file
+$$;
+
+-- Per-user corpus descriptor: document and chunk counts plus the latest
+-- document change, from which the backend derives a document set version
+CREATE OR REPLACE FUNCTION get_corpus_descriptor(
+    user_id_filter text DEFAULT 'anonymous'
+)
+RETURNS TABLE (
+    document_count bigint,
+    chunk_count bigint,
+    last_modified timestamptz
+)
+LANGUAGE sql
+STABLE
+AS $$
+    SELECT
+        (SELECT count(*) FROM documents d WHERE d.user_id = user_id_filter),
+        (SELECT count(*)
+         FROM document_chunks dc
+         JOIN documents d ON dc.document_id = d.id
+         WHERE d.user_id = user_id_filter),
+        (SELECT max(greatest(d.created_at, d.updated_at)) FROM documents d WHERE d.user_id = user_id_filter);
+$$;
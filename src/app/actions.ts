@@ -176,10 +176,45 @@ export interface DocumentResponse {
   updated_at: string;
 }
 
+export interface IngestionJob {
+  id: string;
+  status: 'queued' | 'processing' | 'completed' | 'failed';
+  filename: string;
+  file_size: number;
+  chunks_total?: number | null;
+  chunks_embedded: number;
+  document?: DocumentResponse | null;
+  error?: string | null;
+  created_at: string;
+  updated_at: string;
+}
+
 export interface UploadResponse {
   success: boolean;
   message: string;
   document?: DocumentResponse;
+  job?: IngestionJob;
+}
+
+export async function getIngestionJob(jobId: string, userId: string = 'anonymous'): Promise<IngestionJob | null> {
+  try {
+    const response = await fetch(`${BACKEND_URL}/api/documents/jobs/${jobId}?user_id=${userId}`, {
+      method: 'GET',
+      headers: {
+        'Content-Type': 'application/json',
+      },
+    });
+
+    if (!response.ok) {
+      throw new Error(`Failed to load ingestion job: ${response.status}`);
+    }
+
+    return await response.json();
+
+  } catch (error) {
+    console.error('Error loading ingestion job:', error);
+    return null;
+  }
 }
 
 export async function uploadDocument(file: File, userId: string = 'anonymous'): Promise<UploadResponse> {
@@ -198,6 +233,7 @@ export async function uploadDocument(file: File, userId: string = 'anonymous'):
       throw new Error(errorData.detail || `Upload failed with status ${response.status}`);
     }
 
+    // Uploads are processed in the background; the caller polls data.job
     const data: UploadResponse = await response.json();
     return data;
 
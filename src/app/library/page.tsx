@@ -1,11 +1,11 @@
 'use client';
 
-import { useState, useEffect } from 'react';
+import { useState, useEffect, useRef } from 'react';
 import Link from 'next/link';
 import { ArrowLeft, MessageSquare } from 'lucide-react';
 import { DocumentUpload } from '@/components/DocumentUpload';
 import { DocumentList } from '@/components/DocumentList';
-import { getDocuments, uploadDocument, deleteDocument } from '@/app/actions';
+import { getDocuments, uploadDocument, deleteDocument, getIngestionJob, type UploadResponse } from '@/app/actions';
 
 export interface Document {
   id: string;
@@ -16,16 +16,49 @@ export interface Document {
   updated_at: string;
 }
 
+// How often and how long to poll a background ingestion job
+const JOB_POLL_INTERVAL_MS = 1000;
+const JOB_POLL_TIMEOUT_MS = 10 * 60 * 1000;
+
 export default function LibraryPage() {
   const [documents, setDocuments] = useState<Document[]>([]);
   const [loading, setLoading] = useState(true);
   const [uploading, setUploading] = useState(false);
+  const mounted = useRef(true);
 
   // Load documents on component mount
   useEffect(() => {
+    mounted.current = true;
     loadDocuments();
+    return () => {
+      mounted.current = false;
+    };
   }, []);
 
+  // Poll a background ingestion job from the browser; each poll is a short request
+  const waitForIngestionJob = async (jobId: string): Promise<UploadResponse> => {
+    const deadline = Date.now() + JOB_POLL_TIMEOUT_MS;
+
+    while (mounted.current && Date.now() < deadline) {
+      const job = await getIngestionJob(jobId);
+
+      if (job?.status === 'completed' && job.document) {
+        return { success: true, message: 'Document uploaded and processed successfully', document: job.document };
+      }
+
+      if (job?.status === 'failed') {
+        return { success: false, message: job.error || 'Failed to process document' };
+      }
+
+      await new Promise(resolve => setTimeout(resolve, JOB_POLL_INTERVAL_MS));
+    }
+
+    return {
+      success: false,
+      message: 'Document is still processing. It will appear in your library when ready.'
+    };
+  };
+
   const loadDocuments = async () => {
     try {
       setLoading(true);
@@ -41,7 +74,11 @@ export default function LibraryPage() {
   const handleUpload = async (file: File) => {
     try {
       setUploading(true);
-      const result = await uploadDocument(file);
+      let result = await uploadDocument(file);
+
+      if (result.success && result.job && !result.document) {
+        result = await waitForIngestionJob(result.job.id);
+      }
       
       if (result.success && result.document) {
         setDocuments(prev => [result.document!, ...prev]);
@@ -92,7 +129,7 @@ export default function LibraryPage() {
         <h1 className="text-3xl font-bold text-gray-900 mb-2">Document Library</h1>
         <p className="text-gray-600">
           Upload documents to enhance your AI chat with personalized knowledge. 
-          Supported formats: Text files (.txt, .md, .csv)
+          Supported formats: Text files (.txt, .md, .csv), PDF (.pdf) and Word (.docx)
         </p>
       </div>
 
@@ -45,8 +45,12 @@ export function DocumentUpload({ onUpload, uploading }: DocumentUploadProps) {
     setMessage(null);
 
     // Validate file type
-    const allowedTypes = ['text/plain', 'text/markdown', 'text/csv', 'application/csv'];
-    const allowedExtensions = ['.txt', '.md', '.csv'];
+    const allowedTypes = [
+      'text/plain', 'text/markdown', 'text/csv', 'application/csv',
+      'application/pdf',
+      'application/vnd.openxmlformats-officedocument.wordprocessingml.document'
+    ];
+    const allowedExtensions = ['.txt', '.md', '.csv', '.pdf', '.docx'];
     
     const hasValidType = allowedTypes.includes(file.type);
     const hasValidExtension = allowedExtensions.some(ext => 
@@ -56,7 +60,7 @@ export function DocumentUpload({ onUpload, uploading }: DocumentUploadProps) {
     if (!hasValidType && !hasValidExtension) {
       setMessage({
         type: 'error',
-        text: 'Please upload a text file (.txt, .md, .csv)'
+        text: 'Please upload a text, PDF or Word file (.txt, .md, .csv, .pdf, .docx)'
       });
       return;
     }
@@ -111,7 +115,7 @@ export function DocumentUpload({ onUpload, uploading }: DocumentUploadProps) {
           ref={fileInputRef}
           type="file"
           className="hidden"
-          accept=".txt,.md,.csv,text/plain,text/markdown,text/csv,application/csv"
+          accept=".txt,.md,.csv,.pdf,.docx,text/plain,text/markdown,text/csv,application/csv,application/pdf,application/vnd.openxmlformats-officedocument.wordprocessingml.document"
           onChange={handleChange}
           disabled={uploading}
         />
@@ -145,7 +149,7 @@ export function DocumentUpload({ onUpload, uploading }: DocumentUploadProps) {
           <div className="flex items-center justify-center space-x-4 text-sm text-gray-500">
             <div className="flex items-center space-x-1">
               <FileText className="w-4 h-4" />
-              <span>Text files</span>
+              <span>Text, PDF and Word files</span>
             </div>
             <span>•</span>
             <span>Max 10MB</span>